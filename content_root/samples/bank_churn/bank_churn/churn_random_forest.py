@@ -1,18 +1,105 @@
 import logging
+import numpy as np
 import os
 import pandas as pd
 import pickle as pkl
 
+from compiled_forest import CompiledForest
+from schema_encoder import SchemaEncoder
+
+# Batch size up to which the compiled forest beats sklearn's predict_proba
+# for the bundled 100 tree, depth 7 model.
+COMPILED_MAX_ROWS = 256
+
+
+class SchemaPreprocessor:
+    """NumPy replacement for the fitted ColumnTransformer in front of the
+    forest: median imputation of numeric columns followed by one-hot
+    encoding of categoricals (unknown values encode as all zeros).
+
+    Categories are mapped to one-hot positions through lookup tables built
+    once from the model.yaml schema and the fitted OneHotEncoder, so no
+    string comparisons or dtype inference happen per prediction.
+    """
+
+    def __init__(self, column_transformer, schema_encoder):
+        numeric, categorical = column_transformer.transformers_[:2]
+        _, numeric_pipeline, numeric_columns = numeric
+        _, categorical_pipeline, categorical_columns = categorical
+        imputer = numeric_pipeline.steps[-1][1]
+        one_hot = categorical_pipeline.steps[-1][1]
+        self.schema_encoder = schema_encoder
+        self.numeric_columns = list(numeric_columns)
+        self.fill_values = imputer.statistics_
+        self.categorical_columns = list(categorical_columns)
+
+        offset = len(self.numeric_columns)
+        self.lookups = []
+        for column, categories in zip(self.categorical_columns,
+                                      one_hot.categories_):
+            lookup = schema_encoder.code_lookup(column, categories)
+            self.lookups.append(np.where(lookup >= 0, lookup + offset, -1))
+            offset += len(categories)
+        self.num_features = offset
+
+    @classmethod
+    def supports(cls, column_transformer):
+        """Whether the pipeline's preprocessing has the shape this class
+        replicates."""
+        transformers = getattr(column_transformer, 'transformers_', [])
+        # sklearn only lists the remainder if some columns are left over.
+        if (len(transformers) not in (2, 3)
+                or column_transformer.remainder != 'drop'):
+            return False
+        (_, numeric, _), (_, categorical, _) = transformers[:2]
+        imputer = numeric.steps[-1][1]
+        one_hot = categorical.steps[-1][1]
+        return (len(numeric.steps) == 1 and len(categorical.steps) == 1
+                and type(imputer).__name__ == 'SimpleImputer'
+                and not imputer.add_indicator
+                and not np.isnan(imputer.statistics_).any()
+                and type(one_hot).__name__ == 'OneHotEncoder'
+                and one_hot.drop is None
+                and one_hot.handle_unknown == 'ignore')
+
+    def transform(self, input_df):
+        features = np.zeros((len(input_df), self.num_features))
+        # Imputed in place in `features`, as to_numpy may return a
+        # read-only view of the frame.
+        numeric = features[:, :len(self.numeric_columns)]
+        numeric[:] = input_df[self.numeric_columns].to_numpy(dtype=float)
+        missing = np.isnan(numeric)
+        if missing.any():
+            numeric[missing] = np.take(self.fill_values,
+                                       np.nonzero(missing)[1])
+
+        rows = np.arange(len(input_df))
+        for column, lookup in zip(self.categorical_columns, self.lookups):
+            positions = lookup[self.schema_encoder.codes(input_df, column)]
+            known = positions >= 0
+            features[rows[known], positions[known]] = 1
+        return features
+
 
 class RFPredictor:
     """An Randomforest predictor for bank_churn data.
        This loads the predictor once and runs for each call to predict.
     """
 
-    def __init__(self, model_path, output_column=None):
+    def __init__(self, model_path, output_column=None, compiled=False,
+                 compiled_max_rows=COMPILED_MAX_ROWS, model_yaml=None):
         """
         :param model_path: The directory where the model is saved.
         :param output_column: list of column name(s) for the output.
+        :param compiled: If True, the random forest is flattened into
+            NumPy node arrays (see CompiledForest) and evaluated without
+            going through sklearn's predict_proba. Preprocessing steps of
+            the pipeline still run through sklearn.
+        :param compiled_max_rows: Largest batch scored with the compiled
+            forest. sklearn's Cython traversal is faster for larger batches.
+        :param model_yaml: Optional path to the model.yaml. If given, the
+            pipeline's ColumnTransformer is replaced by a SchemaPreprocessor
+            that encodes categoricals using the declared possible-values.
         """
         self.model_path = model_path
         self.output_column = output_column
@@ -21,9 +108,43 @@ class RFPredictor:
         with open(file_path, 'rb') as file:
             self.model = pkl.load(file)
 
+        self.forest = self.model.steps[-1][1]
+        self.compiled_max_rows = compiled_max_rows
+        self.compiled_forest = None
+        if compiled:
+            self.compiled_forest = CompiledForest(self.forest)
+
+        self.preprocessor = None
+        column_transformer = self.model.steps[0][1]
+        if model_yaml is not None:
+            if (len(self.model.steps) == 2
+                    and SchemaPreprocessor.supports(column_transformer)):
+                self.preprocessor = SchemaPreprocessor(
+                    column_transformer, SchemaEncoder(model_yaml))
+            else:
+                logging.warning('Pipeline preprocessing is not supported by '
+                                'SchemaPreprocessor, using sklearn instead')
+
+    def preprocess(self, input_df):
+        if self.preprocessor is not None:
+            return self.preprocessor.transform(input_df)
+        features = input_df
+        for _, step in self.model.steps[:-1]:
+            features = step.transform(features)
+        return features
+
+    def predict_proba(self, input_df):
+        if self.compiled_forest is None and self.preprocessor is None:
+            return self.model.predict_proba(input_df)
+        features = self.preprocess(input_df)
+        if (self.compiled_forest is None
+                or len(input_df) > self.compiled_max_rows):
+            return self.forest.predict_proba(features)
+        return self.compiled_forest.predict_proba(features)
+
     def predict(self, input_df):
         return pd.DataFrame(
-            self.model.predict_proba(input_df)[:, 0], columns=self.output_column
+            self.predict_proba(input_df)[:, 0], columns=self.output_column
         )
 
 
@@ -6,4 +6,6 @@ PACKAGE_DIR = os.path.dirname(__file__)
 
 
 def get_model():
-    return RFPredictor(PACKAGE_DIR, output_column=['probability_churned'])
+    return RFPredictor(PACKAGE_DIR, output_column=['probability_churned'],
+                       compiled=True,
+                       model_yaml=os.path.join(PACKAGE_DIR, 'model.yaml'))
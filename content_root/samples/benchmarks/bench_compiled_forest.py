@@ -0,0 +1,55 @@
+"""Latency of the bank churn RFPredictor with sklearn's predict_proba vs the
+compiled NumPy forest, end to end and for the forest alone. End to end, the
+compiled predictor falls back to sklearn above `compiled_max_rows` rows.
+
+Usage: python bench_compiled_forest.py
+"""
+import logging
+import statistics
+
+import numpy as np
+
+from bench_utils import (DATASETS_DIR, SAMPLES_DIR, load_model_inputs,
+                         load_package, sample_rows, time_calls)
+
+PACKAGE_DIR = SAMPLES_DIR / 'bank_churn/bank_churn'
+DATASET_CSV = DATASETS_DIR / 'bank_churn/dataset.csv'
+BATCH_SIZES = [1, 100, 10000]
+REPEAT = {1: 500, 100: 200, 10000: 10}
+
+
+def main():
+    package = load_package(PACKAGE_DIR)
+    sklearn_model = package.RFPredictor(package.PACKAGE_DIR,
+                                        output_column=['probability_churned'])
+    compiled_model = package.RFPredictor(package.PACKAGE_DIR,
+                                         output_column=['probability_churned'],
+                                         compiled=True)
+    preprocessor = sklearn_model.model.steps[0][1]
+    forest = sklearn_model.model.steps[-1][1]
+    inputs = load_model_inputs(PACKAGE_DIR, DATASET_CSV)
+
+    print(f'{"rows":>8}{"predict ms":>12}{"compiled":>10}{"speedup":>9}'
+          f'{"forest ms":>12}{"compiled":>10}{"speedup":>9}')
+    for num_rows in BATCH_SIZES:
+        batch = sample_rows(inputs, num_rows)
+        features = preprocessor.transform(batch)
+        np.testing.assert_allclose(compiled_model.predict(batch),
+                                   sklearn_model.predict(batch))
+        timings = [
+            statistics.median(time_calls(fn, arg, REPEAT[num_rows])) * 1e3
+            for fn, arg in ((sklearn_model.predict, batch),
+                            (compiled_model.predict, batch),
+                            (forest.predict_proba, features),
+                            (compiled_model.compiled_forest.predict_proba,
+                             features))]
+        print(f'{num_rows:>8}{timings[0]:>12.3f}{timings[1]:>10.3f}'
+              f'{timings[0] / timings[1]:>8.1f}x'
+              f'{timings[2]:>12.3f}{timings[3]:>10.3f}'
+              f'{timings[2] / timings[3]:>8.1f}x')
+
+
+if __name__ == '__main__':
+    logging.basicConfig(level=logging.INFO,
+                        format='%(asctime)s %(levelname)-7s: %(message)s')
+    main()
@@ -0,0 +1,79 @@
+"""Throughput and latency of concurrent single-row requests, predicted
+directly vs coalesced by MicroBatcher.
+
+Each of `CLIENTS` threads sends single-row requests back to back. Direct
+calls share the model, as the executor's request threads would.
+
+Usage: python bench_micro_batcher.py
+"""
+import logging
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+from bench_utils import (DATASETS_DIR, SAMPLES_DIR, load_model_inputs,
+                         load_package, sample_rows)
+from micro_batcher import MicroBatcher
+
+os.environ.setdefault('TF_CPP_MIN_LOG_LEVEL', '2')
+
+PACKAGES = {
+    'lending': (SAMPLES_DIR / 'lending/logreg-all',
+                DATASETS_DIR / 'p2p_loans/p2p_loans.csv'),
+    'wine_dnn': (SAMPLES_DIR / 'wine_quality/dnn_wine_regressor',
+                 DATASETS_DIR / 'winequality/train.csv'),
+}
+CLIENTS = 32
+REQUESTS_PER_CLIENT = 100
+MAX_DELAYS_MS = [1, 5, 20]
+MAX_BATCH_ROWS = 256
+
+
+def run(predict, rows):
+    def client(offset):
+        latencies = []
+        for i in range(REQUESTS_PER_CLIENT):
+            row = rows[(offset * REQUESTS_PER_CLIENT + i) % len(rows)]
+            start = time.perf_counter()
+            predict(row)
+            latencies.append(time.perf_counter() - start)
+        return latencies
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(CLIENTS) as pool:
+        latencies = sum(pool.map(client, range(CLIENTS)), [])
+    return len(latencies) / (time.perf_counter() - start), latencies
+
+
+def report(name, mode, throughput, latencies, mean_batch=1.0):
+    p50, p99 = np.percentile(latencies, [50, 99]) * 1e3
+    print(f'{name:<10}{mode:<12}{throughput:>10.0f}{p50:>9.2f}{p99:>9.2f}'
+          f'{mean_batch:>11.1f}')
+
+
+def main():
+    print(f'{CLIENTS} clients x {REQUESTS_PER_CLIENT} single-row requests')
+    print(f'{"package":<10}{"mode":<12}{"req/s":>10}{"p50 ms":>9}'
+          f'{"p99 ms":>9}{"mean rows":>11}')
+    for name, (package_dir, dataset_csv) in PACKAGES.items():
+        model = load_package(package_dir).get_model()
+        inputs = sample_rows(load_model_inputs(package_dir, dataset_csv),
+                             1000)
+        rows = [inputs.iloc[[i]].reset_index(drop=True)
+                for i in range(len(inputs))]
+        report(name, 'direct', *run(model.predict, rows))
+        for max_delay_ms in MAX_DELAYS_MS:
+            batcher = MicroBatcher(model, max_delay_ms=max_delay_ms,
+                                   max_batch_rows=MAX_BATCH_ROWS)
+            throughput, latencies = run(batcher.predict, rows)
+            batcher.close()
+            report(name, f'batch {max_delay_ms}ms', throughput, latencies,
+                   batcher.batch_rows.mean())
+
+
+if __name__ == '__main__':
+    logging.basicConfig(level=logging.ERROR,
+                        format='%(asctime)s %(levelname)-7s: %(message)s')
+    main()
@@ -0,0 +1,117 @@
+"""Hit rate of ModelHost versus its memory budget, in a simulated
+multi-tenant executor.
+
+Tenants' model packages are generated in a temporary directory. Each model
+allocates between 4 and 32 MB, measured by ModelHost as resident growth,
+and takes 1 ms per MB to load, standing in for deserialization. The same
+Zipf-distributed request sequence is replayed against budgets from 10% to
+100% of the tenants' total size.
+
+Usage: python bench_model_host.py
+"""
+import logging
+import statistics
+import tempfile
+import time
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+import bench_utils  # noqa: F401, puts common on sys.path
+from model_registry import ModelHost
+
+NUM_TENANTS = 24
+NUM_REQUESTS = 2000
+ZIPF_EXPONENT = 1.1
+MIN_SIZE_MB, MAX_SIZE_MB = 4, 32
+LOAD_SECONDS_PER_MB = 0.001
+BUDGET_FRACTIONS = [0.1, 0.25, 0.5, 0.75, 1.0]
+
+PACKAGE_PY = '''
+import time
+
+import numpy as np
+import pandas as pd
+
+SIZE_MB = {size_mb}
+
+
+class Model:
+    def __init__(self):
+        time.sleep(SIZE_MB * {load_seconds_per_mb})
+        self.weights = np.ones(SIZE_MB * 1024 * 1024, dtype=np.uint8)
+
+    def predict(self, input_df):
+        return pd.DataFrame({{'score': input_df['x'] * self.weights[0]}})
+
+
+def get_model():
+    return Model()
+'''
+
+
+def make_packages(root, sizes_mb):
+    package_dirs = {}
+    for i, size_mb in enumerate(sizes_mb):
+        package_dir = Path(root) / f'tenant_{i}'
+        package_dir.mkdir()
+        (package_dir / '__init__.py').write_text('')
+        (package_dir / 'package.py').write_text(PACKAGE_PY.format(
+            size_mb=size_mb, load_seconds_per_mb=LOAD_SECONDS_PER_MB))
+        package_dirs[f'tenant_{i}'] = package_dir
+    return package_dirs
+
+
+def zipf_requests(num_tenants, num_requests, rng):
+    weights = 1.0 / np.arange(1, num_tenants + 1) ** ZIPF_EXPONENT
+    # Popularity is unrelated to model size.
+    tenants = rng.permutation(num_tenants)
+    return tenants[rng.choice(num_tenants, num_requests,
+                              p=weights / weights.sum())]
+
+
+def run(package_dirs, budget_bytes, requests, input_df):
+    host = ModelHost(package_dirs, budget_bytes)
+    latencies = []
+    peak_footprint = 0
+    for tenant in requests:
+        start = time.perf_counter()
+        host.predict(f'tenant_{tenant}', input_df)
+        latencies.append(time.perf_counter() - start)
+        peak_footprint = max(peak_footprint, host.memory_footprint())
+    stats = host.stats()
+    host.clear()
+    return stats, peak_footprint, latencies
+
+
+def main():
+    rng = np.random.RandomState(0)
+    sizes_mb = np.exp(rng.uniform(np.log(MIN_SIZE_MB), np.log(MAX_SIZE_MB),
+                                  NUM_TENANTS)).astype(int)
+    total_bytes = int(sizes_mb.sum()) * 1024 * 1024
+    requests = zipf_requests(NUM_TENANTS, NUM_REQUESTS, rng)
+    input_df = pd.DataFrame({'x': [1.0]})
+    print(f'{NUM_TENANTS} tenants, {sizes_mb.sum()} MB in total, '
+          f'{NUM_REQUESTS} requests')
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        package_dirs = make_packages(tmp_dir, sizes_mb)
+        print(f'{"budget MB":>10}{"hit rate":>10}{"loads":>7}'
+              f'{"evictions":>11}{"peak MB":>9}{"mean ms":>9}{"p99 ms":>8}')
+        for fraction in BUDGET_FRACTIONS:
+            budget_bytes = int(total_bytes * fraction)
+            stats, peak, latencies = run(package_dirs, budget_bytes,
+                                         requests, input_df)
+            p99 = np.percentile(latencies, 99)
+            print(f'{budget_bytes / 2 ** 20:>10.0f}{stats["hit_rate"]:>10.3f}'
+                  f'{stats["misses"]:>7}{stats["evictions"]:>11}'
+                  f'{peak / 2 ** 20:>9.0f}'
+                  f'{statistics.mean(latencies) * 1e3:>9.2f}'
+                  f'{p99 * 1e3:>8.2f}')
+
+
+if __name__ == '__main__':
+    logging.basicConfig(level=logging.ERROR,
+                        format='%(asctime)s %(levelname)-7s: %(message)s')
+    main()
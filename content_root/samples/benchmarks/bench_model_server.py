@@ -0,0 +1,85 @@
+"""Throughput of each sample package served by ModelServer from 1 to N
+worker processes.
+
+Client threads, two per worker, send batches of `BATCH_ROWS` rows back to
+back. The models are only loaded in the workers, so the benchmark process
+never imports TF before forking.
+
+Usage: python bench_model_server.py [max_workers, default: CPU count]
+"""
+import logging
+import os
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from bench_utils import (DATASETS_DIR, SAMPLES_DIR, load_model_inputs,
+                         sample_rows)
+from model_server import ModelServer
+
+os.environ.setdefault('TF_CPP_MIN_LOG_LEVEL', '2')
+
+PACKAGES = {
+    'wine': (SAMPLES_DIR / 'wine_quality/linear_model_wine_regressor',
+             DATASETS_DIR / 'winequality/train.csv'),
+    'wine_dnn': (SAMPLES_DIR / 'wine_quality/dnn_wine_regressor',
+                 DATASETS_DIR / 'winequality/train.csv'),
+    'iris': (SAMPLES_DIR / 'iris_classification/iris',
+             DATASETS_DIR / 'iris/train.csv'),
+    'lending': (SAMPLES_DIR / 'lending/logreg-all',
+                DATASETS_DIR / 'p2p_loans/p2p_loans.csv'),
+    'bank_churn': (SAMPLES_DIR / 'bank_churn/bank_churn',
+                   DATASETS_DIR / 'bank_churn/dataset.csv'),
+    # There is no imdb dataset CSV, and imdb_rnn ships without its
+    # tokenizer.pickle; it is reported as unavailable until both exist.
+    'imdb_rnn': (SAMPLES_DIR / 'imdb_rnn/imdb_rnn',
+                 DATASETS_DIR / 'imdb_rnn/imdb_rnn.csv'),
+}
+BATCH_ROWS = 32
+REQUESTS_PER_CLIENT = 100
+
+
+def run(server, batches, num_clients):
+    def client(offset):
+        for i in range(REQUESTS_PER_CLIENT):
+            server.predict(batches[(offset + i) % len(batches)])
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(num_clients) as pool:
+        list(pool.map(client, range(num_clients)))
+    num_rows = num_clients * REQUESTS_PER_CLIENT * BATCH_ROWS
+    return num_rows / (time.perf_counter() - start)
+
+
+def main():
+    max_workers = int(sys.argv[1]) if len(sys.argv) > 1 else os.cpu_count()
+    print(f'{os.cpu_count()} CPUs, batches of {BATCH_ROWS} rows')
+    print(f'{"package":<12}{"workers":>8}{"load s":>8}{"rows/s":>10}'
+          f'{"speedup":>9}')
+    for name, (package_dir, dataset_csv) in PACKAGES.items():
+        try:
+            inputs = load_model_inputs(package_dir, dataset_csv)
+        except OSError as e:
+            print(f'{name:<12} unavailable: {e}')
+            continue
+        rows = sample_rows(inputs, BATCH_ROWS * 100)
+        batches = [rows[i:i + BATCH_ROWS].reset_index(drop=True)
+                   for i in range(0, len(rows), BATCH_ROWS)]
+        baseline = None
+        for num_workers in range(1, max_workers + 1):
+            try:
+                with ModelServer(package_dir, num_workers) as server:
+                    throughput = run(server, batches, 2 * num_workers)
+                    load_seconds = max(server.load_seconds)
+            except RuntimeError as e:
+                print(f'{name:<12} unavailable: {e.__cause__ or e}')
+                break
+            baseline = baseline or throughput
+            print(f'{name:<12}{num_workers:>8}{load_seconds:>8.2f}'
+                  f'{throughput:>10.0f}{throughput / baseline:>9.2f}')
+
+
+if __name__ == '__main__':
+    logging.basicConfig(level=logging.CRITICAL,
+                        format='%(asctime)s %(levelname)-7s: %(message)s')
+    main()
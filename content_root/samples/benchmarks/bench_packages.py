@@ -0,0 +1,249 @@
+"""Cold start, predict latency and IG latency of every sample package,
+written as JSON so runs can be compared across commits.
+
+Each package is measured in a fresh process, so its cold start includes
+importing its package.py and everything it imports (e.g. TF), as in a newly
+started executor, and packages don't share TF graphs or thread pools.
+
+Predict latency is measured on rows sampled from the package's dataset CSV
+in batches of 1, 32 and 1024 rows, and on the whole dataset. For models
+with `ig_enabled`, IG latency is the time to explain a single row with
+`integrated_gradients`. Packages whose artifacts or dataset are missing, or
+that fail to load, are recorded with the error.
+
+Usage:
+    python bench_packages.py [--output results.json] [--compare old.json]
+        [package ...]
+"""
+import argparse
+import json
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import time
+import traceback
+
+import numpy as np
+
+from bench_utils import (DATASETS_DIR, SAMPLES_DIR, load_model_inputs,
+                         sample_rows, time_calls)
+
+os.environ.setdefault('TF_CPP_MIN_LOG_LEVEL', '2')
+
+# name => (package directory, dataset CSV)
+PACKAGES = {
+    'bank_churn': ('bank_churn/bank_churn', 'bank_churn/dataset.csv'),
+    'heart_disease': ('heart_disease/heart_disease',
+                      'heart_disease/data.csv'),
+    'imdb_bert': ('imdb_rnn/imdb_bert', 'imdb_rnn/imdb_rnn.csv'),
+    'imdb_rnn': ('imdb_rnn/imdb_rnn', 'imdb_rnn/imdb_rnn.csv'),
+    'imdb_rnn_test': ('imdb_rnn/imdb_rnn_test', 'imdb_rnn/imdb_rnn.csv'),
+    'iris': ('iris_classification/iris', 'iris/train.csv'),
+    'pmml_iris': ('iris_classification/pmml_iris', 'iris/train.csv'),
+    'lending_logreg_all': ('lending/logreg-all', 'p2p_loans/p2p_loans.csv'),
+    'lending_logreg_simple': ('lending/logreg-simple',
+                              'p2p_loans/p2p_loans.csv'),
+    'lending_xgboost': ('lending/xgboost-simple-sagemaker',
+                        'p2p_loans/p2p_loans.csv'),
+    'wine_dnn': ('wine_quality/dnn_wine_regressor',
+                 'winequality/train.csv'),
+    'wine_linear': ('wine_quality/linear_model_wine_regressor',
+                    'winequality/train.csv'),
+}
+BATCH_SIZES = [1, 32, 1024, 'full']
+REPEAT = {1: 200, 32: 100, 1024: 20, 'full': 10}
+IG_STEPS = 10
+IG_REPEAT = 10
+PERCENTILES = [50, 90, 99]
+
+
+def latency_stats(latencies):
+    stats = {f'p{q}_ms': float(np.percentile(latencies, q)) * 1e3
+             for q in PERCENTILES}
+    stats['mean_ms'] = statistics.mean(latencies) * 1e3
+    stats['repeat'] = len(latencies)
+    return stats
+
+
+def integrated_gradients(model, input_df, steps=IG_STEPS):
+    """Returns the projected attributions of the single row `input_df`,
+    approximating IG along the straight line from the baseline with a
+    `steps`-point Riemann sum, as the executor does for models with
+    `ig_enabled`."""
+    transformed_df = model.transform_input(input_df)
+    feed = model.get_feed_dict(transformed_df)
+    baseline_feed = model.get_feed_dict(model.generate_baseline(input_df))
+    keys = list(model.differentiable_tensors)
+    tensors = [model.differentiable_tensors[key] for key in keys]
+    inputs = model.sess.run(tensors, feed)
+    baselines = model.sess.run(tensors, baseline_feed)
+
+    attributions = {}
+    for column, gradient_tensors in model.gradient_tensors.items():
+        totals = [np.zeros_like(value) for value in inputs]
+        for alpha in (np.arange(steps) + 0.5) / steps:
+            step_feed = dict(feed)
+            step_feed.update(
+                {tensor: baseline + alpha * (value - baseline)
+                 for tensor, value, baseline in zip(tensors, inputs,
+                                                    baselines)})
+            # tf.gradients returns a list with a tensor per input.
+            gradients = model.sess.run(
+                [gradient_tensors[key][0] for key in keys], step_feed)
+            totals = [total + gradient
+                      for total, gradient in zip(totals, gradients)]
+        attributions[column] = model.project_attributions(
+            input_df, transformed_df,
+            {key: (value - baseline) * total / steps
+             for key, value, baseline, total in zip(keys, inputs, baselines,
+                                                    totals)})
+    return attributions
+
+
+def measure_package(name):
+    """Measures package `name` in this process and returns its results."""
+    package_dir, dataset_csv = PACKAGES[name]
+    package_dir = SAMPLES_DIR / package_dir
+    result = {'package_dir': str(package_dir.relative_to(SAMPLES_DIR))}
+    try:
+        inputs = load_model_inputs(package_dir, DATASETS_DIR / dataset_csv)
+    except (OSError, ValueError) as e:
+        return dict(result, error=f'No dataset: {e}')
+
+    from artifact_cache import resident_bytes
+    from model_registry import create_model, import_package
+    try:
+        start_resident = resident_bytes()
+        start_time = time.perf_counter()
+        import_package(package_dir)
+        import_seconds = time.perf_counter() - start_time
+        model = create_model(package_dir)
+        load_model = getattr(model, 'load_model', None)
+        if load_model is not None:
+            load_model()
+        cold_start_seconds = time.perf_counter() - start_time
+        # The first prediction may still build caches or trace graphs.
+        first_start = time.perf_counter()
+        model.predict(sample_rows(inputs, 1))
+        first_predict_seconds = time.perf_counter() - first_start
+    except Exception as e:
+        return dict(result, error=f'Failed to load: {e!r}',
+                    traceback=traceback.format_exc())
+    result['cold_start'] = {
+        'import_seconds': import_seconds,
+        'total_seconds': cold_start_seconds,
+        'first_predict_seconds': first_predict_seconds,
+        'resident_bytes': (None if start_resident is None
+                           else resident_bytes() - start_resident),
+    }
+
+    result['predict'] = {}
+    for batch_size in BATCH_SIZES:
+        batch = (inputs if batch_size == 'full'
+                 else sample_rows(inputs, batch_size))
+        latencies = time_calls(model.predict, batch, REPEAT[batch_size])
+        result['predict'][str(batch_size)] = dict(
+            latency_stats(latencies), rows=len(batch),
+            rows_per_second=len(batch) / statistics.median(latencies))
+
+    if getattr(model, 'ig_enabled', False):
+        row = sample_rows(inputs, 1)
+        try:
+            result['ig'] = dict(
+                latency_stats(time_calls(
+                    lambda row: integrated_gradients(model, row), row,
+                    IG_REPEAT)),
+                steps=IG_STEPS)
+        except Exception as e:
+            result['ig'] = {'error': repr(e)}
+    return result
+
+
+def run_isolated(name):
+    """Measures package `name` in a new process."""
+    process = subprocess.run(
+        [sys.executable, '-W', 'ignore', __file__, '--measure', name],
+        stdout=subprocess.PIPE, stderr=subprocess.PIPE,
+        universal_newlines=True)
+    if process.returncode != 0:
+        return {'error': f'Exited with {process.returncode}',
+                'stderr': process.stderr[-2000:]}
+    return json.loads(process.stdout.splitlines()[-1])
+
+
+def git_commit():
+    try:
+        return subprocess.run(
+            ['git', 'rev-parse', 'HEAD'], cwd=str(SAMPLES_DIR),
+            stdout=subprocess.PIPE, stderr=subprocess.DEVNULL,
+            universal_newlines=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def print_summary(results, baseline=None):
+    """Prints p50 latencies, and their ratio to `baseline`'s if given."""
+    print(f'{"package":<24}{"cold s":>8}' + ''.join(
+        f'{f"p50 ms@{size}":>15}' for size in BATCH_SIZES) +
+        f'{"IG p50 ms":>11}')
+    for name, result in results['packages'].items():
+        if 'error' in result:
+            print(f'{name:<24}  {result["error"].splitlines()[0][:90]}')
+            continue
+        old = (baseline or {}).get('packages', {}).get(name, {})
+        cells = [f'{result["cold_start"]["total_seconds"]:>8.2f}']
+        for size in BATCH_SIZES:
+            p50 = result['predict'][str(size)]['p50_ms']
+            old_p50 = old.get('predict', {}).get(str(size), {}).get('p50_ms')
+            ratio = f' x{p50 / old_p50:.2f}' if old_p50 else ''
+            cells.append(f'{f"{p50:.2f}{ratio}":>15}')
+        ig_p50 = result.get('ig', {}).get('p50_ms')
+        cells.append(f'{ig_p50:>11.2f}' if ig_p50 is not None
+                     else f'{"-":>11}')
+        print(f'{name:<24}' + ''.join(cells))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    parser.add_argument('packages', nargs='*', metavar='package',
+                        help=f'Packages to measure, of {", ".join(PACKAGES)}. '
+                        f'Defaults to all of them.')
+    parser.add_argument('--output', default='bench_packages.json')
+    parser.add_argument('--compare', help='Results of an earlier run to '
+                        'compare p50 latencies with')
+    parser.add_argument('--measure', help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    unknown = set(args.packages) - set(PACKAGES)
+    if unknown:
+        parser.error(f'Unknown packages: {", ".join(sorted(unknown))}')
+    if args.measure:
+        print(json.dumps(measure_package(args.measure)))
+        return
+
+    results = {
+        'commit': git_commit(),
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'cpus': os.cpu_count(),
+        'time': time.strftime('%Y-%m-%dT%H:%M:%S%z'),
+        'packages': {},
+    }
+    for name in args.packages or PACKAGES:
+        print(f'Measuring {name}', file=sys.stderr)
+        results['packages'][name] = run_isolated(name)
+    with open(args.output, 'w') as f:
+        json.dump(results, f, indent=2)
+
+    baseline = None
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+    print_summary(results, baseline)
+    print(f'Results written to {args.output}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,76 @@
+"""Latency of the iris PMML package scoring through openscoring vs the
+in-process PMMLTreeModel evaluator.
+
+No openscoring server is needed: remote mode calls a local HTTP server that
+implements openscoring's CSV API with the same evaluator, so the difference
+is the cost of the network round trip and CSV serialization. Because the
+stub cannot disagree with the evaluator, each model's predictions are
+checked against the dataset's species labels instead.
+
+Usage: python bench_pmml_iris.py
+"""
+import logging
+import statistics
+import tempfile
+from pathlib import Path
+
+import pandas as pd
+
+from bench_utils import (DATASETS_DIR, SAMPLES_DIR, load_model_inputs,
+                         load_package, sample_rows, time_calls)
+from pmml_tree_model import PMMLTreeModel
+from tests.stubs import OPENSCORING_PATH
+from tests.stubs import StubOpenscoringServer
+from tests.stubs import write_model_yaml
+
+PACKAGE_DIR = SAMPLES_DIR / 'iris_classification/pmml_iris'
+DATASET_CSV = DATASETS_DIR / 'iris/train.csv'
+BATCH_SIZES = [1, 100, 10000]
+REPEAT = {1: 200, 100: 100, 10000: 10}
+
+
+def check_accuracy(result, labels):
+    # The output columns are in the order of the species labels 0, 1, 2.
+    accuracy = (result.to_numpy().argmax(axis=1) == labels).mean()
+    assert len(labels) < 100 or accuracy > 0.9, accuracy
+
+
+def make_model(package, tmp_dir, url, in_process):
+    path = write_model_yaml(
+        Path(tmp_dir) / f'model_{in_process}.yaml', openscoring={
+            'url': url + OPENSCORING_PATH, 'max_concurrent_requests': 1,
+            'in_process': in_process})
+    return package.IrisPMMLModel(path)
+
+
+def main():
+    package = load_package(PACKAGE_DIR)
+    server = StubOpenscoringServer(
+        evaluate=PMMLTreeModel(package.PMML_PATH).evaluate)
+    inputs = load_model_inputs(PACKAGE_DIR, DATASET_CSV)
+    inputs['species'] = pd.read_csv(DATASET_CSV, usecols=['species'])
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        remote_model = make_model(package, tmp_dir, server.url, False)
+        local_model = make_model(package, tmp_dir, server.url, True)
+
+        print(f'{"rows":>8}{"openscoring ms":>16}{"in-process ms":>15}'
+              f'{"speedup":>9}')
+        for num_rows in BATCH_SIZES:
+            batch = sample_rows(inputs, num_rows)
+            labels = batch.pop('species')
+            for model in (remote_model, local_model):
+                check_accuracy(model.predict(batch), labels)
+            timings = [
+                statistics.median(time_calls(model.predict, batch,
+                                             REPEAT[num_rows])) * 1e3
+                for model in (remote_model, local_model)]
+            print(f'{num_rows:>8}{timings[0]:>16.3f}{timings[1]:>15.3f}'
+                  f'{timings[0] / timings[1]:>8.1f}x')
+    server.close()
+
+
+if __name__ == '__main__':
+    logging.basicConfig(level=logging.INFO,
+                        format='%(asctime)s %(levelname)-7s: %(message)s')
+    main()
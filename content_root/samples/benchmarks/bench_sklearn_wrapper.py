@@ -0,0 +1,41 @@
+"""Per-call overhead of SimpleSklearnModel.predict vs predict_array.
+
+Usage: python bench_sklearn_wrapper.py
+"""
+import logging
+import statistics
+
+from bench_utils import (DATASETS_DIR, SAMPLES_DIR, load_model_inputs,
+                         load_package, sample_rows, time_calls)
+
+PACKAGES = {
+    'iris': (SAMPLES_DIR / 'iris_classification/iris',
+             DATASETS_DIR / 'iris/train.csv'),
+    'wine': (SAMPLES_DIR / 'wine_quality/linear_model_wine_regressor',
+             DATASETS_DIR / 'winequality/train.csv'),
+    'lending': (SAMPLES_DIR / 'lending/logreg-all',
+                DATASETS_DIR / 'p2p_loans/p2p_loans.csv'),
+}
+BATCH_SIZES = [1, 10000]
+REPEAT = {1: 2000, 10000: 20}
+
+
+def main():
+    print(f'{"package":<10}{"rows":>8}{"predict us":>14}'
+          f'{"predict_array us":>20}')
+    for name, (package_dir, dataset_csv) in PACKAGES.items():
+        model = load_package(package_dir).get_model()
+        inputs = load_model_inputs(package_dir, dataset_csv)
+        for num_rows in BATCH_SIZES:
+            batch = sample_rows(inputs, num_rows)
+            medians = [
+                statistics.median(time_calls(fn, batch, REPEAT[num_rows]))
+                for fn in (model.predict, model.predict_array)]
+            print(f'{name:<10}{num_rows:>8}{medians[0] * 1e6:>14.1f}'
+                  f'{medians[1] * 1e6:>20.1f}')
+
+
+if __name__ == '__main__':
+    logging.basicConfig(level=logging.INFO,
+                        format='%(asctime)s %(levelname)-7s: %(message)s')
+    main()
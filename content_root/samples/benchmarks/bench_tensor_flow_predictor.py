@@ -0,0 +1,82 @@
+"""Load time and per-batch latency of the wine DNN's TensorFlowPredictor,
+loading the full SavedModel vs the frozen, pruned and grappler-optimized
+graph.
+
+"optimize" is the first load, which builds and saves the optimized graph;
+"cached" is every later load, which reads the saved graph.
+
+Usage: python bench_tensor_flow_predictor.py
+"""
+import logging
+import statistics
+import tempfile
+import time
+from pathlib import Path
+
+import numpy as np
+
+from bench_utils import (DATASETS_DIR, SAMPLES_DIR, load_model_inputs,
+                         load_package, sample_rows, time_calls)
+
+PACKAGE_DIR = SAMPLES_DIR / 'wine_quality/dnn_wine_regressor'
+DATASET_CSV = DATASETS_DIR / 'winequality/train.csv'
+BATCH_SIZES = [1, 100, 10000, 100000]
+REPEAT = {1: 500, 100: 500, 10000: 50, 100000: 10}
+LOAD_REPEAT = 10
+
+
+def time_load(make_predictor, repeat):
+    latencies = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        predictor = make_predictor()
+        latencies.append(time.perf_counter() - start)
+        predictor.unload_model()
+    return statistics.median(latencies)
+
+
+def main():
+    package = load_package(PACKAGE_DIR)
+    inputs = load_model_inputs(PACKAGE_DIR, DATASET_CSV)
+
+    def make_predictor(optimized_graph_path=None):
+        return package.TensorFlowPredictor(
+            package.DNN_MODEL_DIR, ['predicted_quality'],
+            batch_size=package.BATCH_SIZE,
+            optimized_graph_path=optimized_graph_path)
+
+    # The first session in the process pays for TensorFlow's own setup.
+    make_predictor().unload_model()
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        graph_path = Path(tmp_dir) / 'dnn_model_optimized.pb'
+        load_times = {
+            'saved model': time_load(make_predictor, LOAD_REPEAT),
+            'optimize': time_load(lambda: make_predictor(graph_path), 1),
+            'cached': time_load(lambda: make_predictor(graph_path),
+                                LOAD_REPEAT),
+        }
+        saved_model = make_predictor()
+        optimized = make_predictor(graph_path)
+
+    print(f'{"load":>12}{"ms":>10}')
+    for name, seconds in load_times.items():
+        print(f'{name:>12}{seconds * 1e3:>10.1f}')
+
+    print(f'\n{"rows":>8}{"saved model ms":>16}{"optimized ms":>14}'
+          f'{"speedup":>9}')
+    for num_rows in BATCH_SIZES:
+        batch = sample_rows(inputs, num_rows)
+        np.testing.assert_allclose(saved_model.predict(batch),
+                                   optimized.predict(batch), rtol=1e-5)
+        timings = [
+            statistics.median(time_calls(model.predict, batch,
+                                         REPEAT[num_rows])) * 1e3
+            for model in (saved_model, optimized)]
+        print(f'{num_rows:>8}{timings[0]:>16.3f}{timings[1]:>14.3f}'
+              f'{timings[0] / timings[1]:>8.2f}x')
+
+
+if __name__ == '__main__':
+    logging.basicConfig(level=logging.WARNING,
+                        format='%(asctime)s %(levelname)-7s: %(message)s')
+    main()
@@ -0,0 +1,61 @@
+"""Helpers shared by the benchmarks of the sample model packages."""
+import sys
+import time
+from pathlib import Path
+
+import pandas as pd
+import yaml
+
+SAMPLES_DIR = Path(__file__).resolve().parent.parent
+COMMON_DIR = SAMPLES_DIR / 'common'
+DATASETS_DIR = SAMPLES_DIR / 'datasets'
+
+# The executor puts the common directory on sys.path, so package.py files
+# import e.g. `sklearn_wrapper` as a top-level module.
+if str(COMMON_DIR) not in sys.path:
+    sys.path.insert(0, str(COMMON_DIR))
+
+from model_registry import import_package  # noqa: E402
+
+
+def load_package(package_dir):
+    """Imports `package_dir/package.py` the way the executor does and
+    returns the module. See `model_registry.import_package`."""
+    return import_package(package_dir)
+
+
+def _dtype(column):
+    data_type = column['data-type']
+    if data_type == 'category':
+        return pd.api.types.CategoricalDtype(column['possible-values'])
+    return {'float': 'float64', 'int': 'int64', 'bool': 'bool'}.get(
+        data_type, 'object')
+
+
+def load_model_inputs(package_dir, dataset_csv):
+    """Reads `dataset_csv` and returns the input columns declared in the
+    package's model.yaml, with the dtypes declared there."""
+    with open(Path(package_dir) / 'model.yaml') as f:
+        inputs = yaml.safe_load(f)['model']['inputs']
+    df = pd.read_csv(dataset_csv, usecols=[c['column-name'] for c in inputs])
+    return pd.DataFrame({c['column-name']: df[c['column-name']].astype(
+        _dtype(c)) for c in inputs})
+
+
+def sample_rows(df, num_rows, seed=0):
+    """Returns `num_rows` rows drawn from `df` with replacement."""
+    return df.sample(n=num_rows, replace=True,
+                     random_state=seed).reset_index(drop=True)
+
+
+def time_calls(fn, arg, repeat, warmup=1):
+    """Calls `fn(arg)` `repeat` times and returns each call's latency in
+    seconds."""
+    for _ in range(warmup):
+        fn(arg)
+    latencies = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn(arg)
+        latencies.append(time.perf_counter() - start)
+    return latencies
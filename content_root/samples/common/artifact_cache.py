@@ -0,0 +1,272 @@
+"""Process-wide cache of loaded model artifacts.
+
+Packages often load the same files: imdb_rnn_test reuses the imdb_rnn saved
+model and tokenizer, imdb_bert ships the same BERT tokenizer as common, and
+several lending packages ship identical transformer pickles. Artifacts
+acquired through this module are loaded once per process and shared.
+
+Entries are keyed by the path, size and newest modification time of the
+file (or directory tree, e.g. a TF SavedModel) and the loader used, so
+acquiring an artifact never reads it. Only when an entry of the same size
+is already loaded from another path are both hashed, so identical copies
+share one entry. Each `acquire_artifact` must be paired with a
+`release_artifact` once the caller is done with the object. Released
+entries are kept around for reuse and are evicted least recently used first
+once more than `max_unused` of them accumulate, or all at once by
+`clear_unused_artifacts`.
+
+Loading and hashing happen outside the cache's lock, so a slow load only
+blocks callers acquiring the same artifact.
+
+The growth of the process's resident size while an artifact loaded is
+recorded as its footprint (see `artifact_footprint`).
+"""
+import collections
+import hashlib
+import logging
+import os
+import pickle
+import threading
+from pathlib import Path
+
+LOG = logging.getLogger(__name__)
+
+DEFAULT_MAX_UNUSED = 8
+_HASH_BLOCK_SIZE = 1024 * 1024
+
+
+def resident_bytes(pid='self'):
+    """Returns the resident size of this process, or of process `pid`, in
+    bytes, or None where it is not available (Linux only)."""
+    try:
+        with open(f'/proc/{pid}/statm') as statm:
+            return int(statm.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+    except (OSError, ValueError):
+        return None
+
+
+def load_pickle(path):
+    with open(path, 'rb') as infile:
+        return pickle.load(infile)
+
+
+class _Entry:
+    def __init__(self, key, value, on_evict, resident_bytes):
+        self.key = key
+        # Keys of identical files at other paths sharing this entry.
+        self.keys = [key]
+        self.value = value
+        self.on_evict = on_evict
+        self.resident_bytes = resident_bytes
+        self.ref_count = 0
+
+
+class ArtifactCache:
+    def __init__(self, max_unused=DEFAULT_MAX_UNUSED):
+        """
+        :param max_unused: Number of loaded artifacts without references to
+            keep for reuse. Referenced artifacts are never evicted.
+        """
+        self.max_unused = max_unused
+        self.lock = threading.RLock()
+        # key => _Entry, including the keys of identical copies.
+        self._entries = {}
+        # id(value) => _Entry. Least recently used first.
+        self._entries_by_value = collections.OrderedDict()
+        # key => Event set once the thread loading it is done.
+        self._loading = {}
+        # file key => content hash, so files are hashed once.
+        self._hashes = {}
+
+    def acquire(self, path, loader=load_pickle, on_evict=None,
+                **loader_kwargs):
+        """
+        Returns `loader(path, **loader_kwargs)`, loading it only if the same
+        or an identical file has not been loaded with the same loader and
+        arguments before.
+
+        :param on_evict: Optional function called with the loaded object
+            when it is evicted, e.g. to close a TF session.
+        """
+        key = (file_key(path), loader, tuple(sorted(loader_kwargs.items())))
+        while True:
+            with self.lock:
+                entry = self._entries.get(key)
+                if entry is not None:
+                    return self._reference(entry)
+                loading = self._loading.get(key)
+                if loading is None:
+                    loading = self._loading[key] = threading.Event()
+                    break
+            # Another thread is loading it. If that fails, retry the load.
+            loading.wait()
+
+        try:
+            entry = self._find_identical(key)
+            with self.lock:
+                # The identical entry may have been evicted meanwhile.
+                if (entry is not None and
+                        self._entries_by_value.get(id(entry.value)) is entry):
+                    return self._add(key, entry, loading)
+            entry = self._load(key, path, loader, on_evict, loader_kwargs)
+        except BaseException:
+            with self.lock:
+                del self._loading[key]
+                loading.set()
+            raise
+        with self.lock:
+            return self._add(key, entry, loading)
+
+    def release(self, value):
+        """Drops a reference taken by `acquire`."""
+        with self.lock:
+            entry = self._entries_by_value.get(id(value))
+            if entry is None or entry.ref_count == 0:
+                raise ValueError('Artifact was not acquired from this cache')
+            entry.ref_count -= 1
+            self._evict()
+
+    def clear(self):
+        """Evicts every artifact that is not referenced."""
+        with self.lock:
+            self._evict(max_unused=0)
+
+    def footprint(self, value):
+        """Returns the bytes the process's resident size grew by when
+        `value` was loaded, or 0 if it was not loaded by this cache."""
+        with self.lock:
+            entry = self._entries_by_value.get(id(value))
+            return 0 if entry is None else entry.resident_bytes
+
+    def content_hash(self, path, key=None):
+        """Returns the sha256 of the file or directory tree at `path`,
+        computed once per file key."""
+        if key is None:
+            key = file_key(path)
+        with self.lock:
+            digest = self._hashes.get(key)
+        if digest is None:
+            digest = _hash_path(key[0])
+            with self.lock:
+                self._hashes[key] = digest
+        return digest
+
+    def __len__(self):
+        return len(self._entries_by_value)
+
+    def _add(self, key, entry, loading):
+        del self._loading[key]
+        loading.set()
+        self._entries[key] = entry
+        if key not in entry.keys:
+            entry.keys.append(key)
+        self._entries_by_value[id(entry.value)] = entry
+        return self._reference(entry)
+
+    def _reference(self, entry):
+        self._entries_by_value.move_to_end(id(entry.value))
+        entry.ref_count += 1
+        return entry.value
+
+    def _find_identical(self, key):
+        """Returns a loaded entry whose file has the same contents as the
+        one of `key`, loaded with the same loader and arguments."""
+        (_, size, _), loader, loader_kwargs = key
+        with self.lock:
+            candidates = [
+                entry for entry in self._entries_by_value.values()
+                if entry.key[0][1] == size
+                and entry.key[1:] == (loader, loader_kwargs)]
+        if not candidates:
+            return None
+        digest = self.content_hash(key[0][0], key[0])
+        for entry in candidates:
+            # The candidate's file may have changed since it was loaded.
+            if file_key(entry.key[0][0]) != entry.key[0]:
+                continue
+            if self.content_hash(entry.key[0][0], entry.key[0]) == digest:
+                return entry
+        return None
+
+    @staticmethod
+    def _load(key, path, loader, on_evict, loader_kwargs):
+        LOG.info(f'Loading artifact {path}')
+        start_resident = resident_bytes()
+        value = loader(path, **loader_kwargs)
+        # Approximate: other threads may allocate meanwhile, and
+        # memory-mapped files only count once their pages are read.
+        growth = (0 if start_resident is None
+                  else max(resident_bytes() - start_resident, 0))
+        return _Entry(key, value, on_evict, growth)
+
+    def _evict(self, max_unused=None):
+        if max_unused is None:
+            max_unused = self.max_unused
+        unused = [entry for entry in self._entries_by_value.values()
+                  if entry.ref_count == 0]
+        for entry in unused[:max(len(unused) - max_unused, 0)]:
+            for key in entry.keys:
+                self._entries.pop(key, None)
+            del self._entries_by_value[id(entry.value)]
+            if entry.on_evict is not None:
+                entry.on_evict(entry.value)
+
+
+def file_key(path):
+    """Returns the resolved path, total size and newest modification time of
+    the file or directory tree at `path`, which change whenever any file in
+    it is replaced or edited."""
+    path = Path(path).resolve()
+    stat = path.stat()
+    if not path.is_dir():
+        return path, stat.st_size, stat.st_mtime_ns
+    size, mtime_ns = 0, stat.st_mtime_ns
+    for root, dirs, names in os.walk(path):
+        for name in dirs + names:
+            entry_stat = os.stat(os.path.join(root, name))
+            if name in names:
+                size += entry_stat.st_size
+            mtime_ns = max(mtime_ns, entry_stat.st_mtime_ns)
+    return path, size, mtime_ns
+
+
+def _hash_path(path):
+    digest = hashlib.sha256()
+    if path.is_dir():
+        files = sorted(Path(root) / name
+                       for root, _, names in os.walk(path) for name in names)
+    else:
+        files = [path]
+    for file in files:
+        digest.update(str(file.relative_to(path)).encode())
+        with open(file, 'rb') as infile:
+            for block in iter(lambda: infile.read(_HASH_BLOCK_SIZE), b''):
+                digest.update(block)
+    return digest.hexdigest()
+
+
+_cache = ArtifactCache()
+
+
+def acquire_artifact(path, loader=load_pickle, on_evict=None,
+                     **loader_kwargs):
+    """Acquires `path` from the process-wide cache. See
+    `ArtifactCache.acquire`."""
+    return _cache.acquire(path, loader, on_evict, **loader_kwargs)
+
+
+def release_artifact(value):
+    """Releases an artifact acquired with `acquire_artifact`."""
+    _cache.release(value)
+
+
+def artifact_footprint(value):
+    """Returns the approximate resident size of an artifact acquired with
+    `acquire_artifact`. See `ArtifactCache.footprint`."""
+    return _cache.footprint(value)
+
+
+def clear_unused_artifacts():
+    """Evicts every artifact of the process-wide cache that is not
+    referenced, e.g. to free memory once models are unloaded."""
+    _cache.clear()
@@ -0,0 +1,92 @@
+import numpy as np
+import scipy.sparse
+
+# sklearn trees compare float32 features against float64 thresholds.
+TREE_INPUT_DTYPE = np.float32
+
+
+class CompiledForest:
+    """Vectorized NumPy inference for a fitted sklearn tree ensemble
+    (RandomForest*, ExtraTrees*).
+
+    All trees are flattened into contiguous node arrays (feature, threshold,
+    left, right, value) and every row walks every tree at once, one tree
+    level per step. This avoids sklearn's per-call input validation and
+    per-tree Python dispatch, which dominate latency for small batches.
+    Results match the estimator's `predict_proba` / `predict`.
+    """
+
+    def __init__(self, forest):
+        """
+        :param forest: A fitted single-output sklearn forest classifier or
+            regressor.
+        """
+        if forest.n_outputs_ != 1:
+            raise ValueError('Only single output forests are supported')
+        self.is_classifier = hasattr(forest, 'classes_')
+        self.classes_ = getattr(forest, 'classes_', None)
+        self.n_trees = len(forest.estimators_)
+
+        features = []
+        thresholds = []
+        lefts = []
+        rights = []
+        values = []
+        roots = []
+        offset = 0
+        for estimator in forest.estimators_:
+            tree = estimator.tree_
+            num_nodes = tree.node_count
+            node_ids = np.arange(num_nodes)
+            is_leaf = tree.children_left == -1
+
+            # Leaves point to themselves, so extra steps keep rows in place.
+            features.append(np.where(is_leaf, 0, tree.feature))
+            thresholds.append(tree.threshold)
+            lefts.append(np.where(is_leaf, node_ids, tree.children_left)
+                         + offset)
+            rights.append(np.where(is_leaf, node_ids, tree.children_right)
+                          + offset)
+
+            value = tree.value[:, 0, :]
+            if self.is_classifier:
+                # Per tree class probabilities, as in
+                # DecisionTreeClassifier.predict_proba.
+                normalizer = value.sum(axis=1, keepdims=True)
+                normalizer[normalizer == 0.0] = 1.0
+                value = value / normalizer
+            values.append(value)
+            roots.append(offset)
+            offset += num_nodes
+
+        self.feature = np.concatenate(features).astype(np.intp)
+        self.threshold = np.concatenate(thresholds)
+        self.left = np.concatenate(lefts).astype(np.intp)
+        self.right = np.concatenate(rights).astype(np.intp)
+        self.value = np.concatenate(values)
+        self.roots = np.array(roots, dtype=np.intp)
+        self.max_depth = max(estimator.tree_.max_depth
+                             for estimator in forest.estimators_)
+
+    def _leaf_values(self, X):
+        if scipy.sparse.issparse(X):
+            X = X.toarray()
+        X = np.asarray(X, dtype=TREE_INPUT_DTYPE)
+        rows = np.arange(X.shape[0])[:, np.newaxis]
+        nodes = np.repeat(self.roots[np.newaxis, :], X.shape[0], axis=0)
+        for _ in range(self.max_depth):
+            go_left = X[rows, self.feature[nodes]] <= self.threshold[nodes]
+            nodes = np.where(go_left, self.left[nodes], self.right[nodes])
+        # (rows, trees, classes or 1)
+        return self.value[nodes]
+
+    def predict_proba(self, X):
+        if not self.is_classifier:
+            raise AttributeError('predict_proba is only available for '
+                                 'classifiers')
+        return self._leaf_values(X).sum(axis=1) / self.n_trees
+
+    def predict(self, X):
+        if self.is_classifier:
+            return self.classes_.take(self.predict_proba(X).argmax(axis=1))
+        return self._leaf_values(X)[:, :, 0].sum(axis=1) / self.n_trees
@@ -0,0 +1,228 @@
+"""Coalesces concurrent `predict` calls into batches.
+
+Online traffic often arrives as many concurrent single-row requests, while
+models like TFSavedModelWrapper, TFBertModelIg and SimpleSklearnModel cost
+far less per row in batches. `MicroBatcher` sits in front of a model: a
+request waits up to `max_delay_ms` for others to join it, the rows of up to
+`max_batch_rows` are predicted with one call to the model, and each caller
+gets back the rows of its own request. Only requests with the same columns
+and dtypes are batched together, and if a batch fails, its requests are
+retried one at a time, so one bad request only fails its own caller.
+
+Latency histograms of requests, queueing and model calls, and a histogram
+of batch sizes, are kept to help tune the delay and batch size.
+"""
+import bisect
+import logging
+import queue
+import threading
+import time
+from concurrent.futures import Future
+
+import numpy as np
+import pandas as pd
+
+LOG = logging.getLogger(__name__)
+
+DEFAULT_MAX_DELAY_MS = 5
+DEFAULT_MAX_BATCH_ROWS = 256
+
+# Bucket upper bounds in seconds, from 10us to 10s, 10 per decade.
+LATENCY_BUCKETS = tuple(10 ** (exponent / 10) for exponent in range(-50, 11))
+
+
+class Histogram:
+    """Counts of values in fixed buckets, with percentiles estimated as the
+    upper bound of the bucket they fall in."""
+
+    def __init__(self, bounds=LATENCY_BUCKETS):
+        self.bounds = bounds
+        # The last count is for values above the last bound.
+        self.counts = [0] * (len(bounds) + 1)
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+        self.lock = threading.Lock()
+
+    def record(self, value):
+        with self.lock:
+            self.counts[bisect.bisect_left(self.bounds, value)] += 1
+            self.count += 1
+            self.total += value
+            self.max = max(self.max, value)
+
+    def percentile(self, q):
+        """Returns the bucket bound below which `q` percent of the values
+        fall, or the maximum if that is smaller."""
+        with self.lock:
+            if self.count == 0:
+                return 0.0
+            rank = q / 100 * self.count
+            cumulative = 0
+            for bound, count in zip(self.bounds, self.counts):
+                cumulative += count
+                if cumulative >= rank:
+                    return min(bound, self.max)
+            return self.max
+
+    def mean(self):
+        return self.total / self.count if self.count else 0.0
+
+    def stats(self):
+        return {'count': self.count, 'mean': self.mean(),
+                'p50': self.percentile(50), 'p90': self.percentile(90),
+                'p99': self.percentile(99), 'max': self.max}
+
+
+class _Request:
+    def __init__(self, input_df):
+        self.input_df = input_df
+        # Requests are only batched with others of the same layout. Dtypes
+        # are compared with their type first, as older numpy raises when
+        # comparing its dtypes to pandas' extension dtypes.
+        self.layout = (tuple(input_df.columns),
+                       tuple((type(dtype), dtype)
+                             for dtype in input_df.dtypes))
+        self.future = Future()
+        self.enqueued_at = time.perf_counter()
+
+
+class MicroBatcher:
+    def __init__(self, model, max_delay_ms=DEFAULT_MAX_DELAY_MS,
+                 max_batch_rows=DEFAULT_MAX_BATCH_ROWS):
+        """
+        :param model: Model whose `predict(input_df)` returns a DataFrame
+            with a row per input row, e.g. the result of `get_model()`.
+        :param max_delay_ms: Longest a request waits for others to be
+            batched with it.
+        :param max_batch_rows: Most rows predicted at once. Requests are
+            never split, so a larger request is predicted on its own.
+        """
+        self.model = model
+        self.max_delay_ms = max_delay_ms
+        self.max_batch_rows = max_batch_rows
+        # Seconds from predict being called until it returns, spent waiting
+        # for the batch to be predicted, and predicting the batch.
+        self.request_latency = Histogram()
+        self.queue_latency = Histogram()
+        self.predict_latency = Histogram()
+        self.batch_rows = Histogram(
+            bounds=tuple(2 ** exponent for exponent in range(21)))
+        self._queue = queue.Queue()
+        # Guards _closed, so no request is queued after close.
+        self._lock = threading.Lock()
+        self._closed = False
+        self._thread = threading.Thread(target=self._run, daemon=True,
+                                        name='micro-batcher')
+        self._thread.start()
+
+    def predict(self, input_df):
+        """Returns `model.predict(input_df)`, predicted in a batch with
+        other concurrent requests."""
+        request = _Request(input_df)
+        with self._lock:
+            if self._closed:
+                raise RuntimeError('MicroBatcher is closed')
+            self._queue.put(request)
+        try:
+            return request.future.result()
+        finally:
+            self.request_latency.record(
+                time.perf_counter() - request.enqueued_at)
+
+    def stats(self):
+        return {'request_latency': self.request_latency.stats(),
+                'queue_latency': self.queue_latency.stats(),
+                'predict_latency': self.predict_latency.stats(),
+                'batch_rows': self.batch_rows.stats()}
+
+    def close(self):
+        """Predicts the queued requests and stops the batching thread."""
+        with self._lock:
+            if not self._closed:
+                self._closed = True
+                self._queue.put(None)
+        self._thread.join()
+
+    def load_model(self):
+        load_model = getattr(self.model, 'load_model', None)
+        if load_model is not None:
+            load_model()
+
+    def unload_model(self):
+        unload_model = getattr(self.model, 'unload_model', None)
+        if unload_model is not None:
+            unload_model()
+
+    def memory_footprint(self):
+        memory_footprint = getattr(self.model, 'memory_footprint', None)
+        return 0 if memory_footprint is None else memory_footprint()
+
+    def _run(self):
+        carried = None
+        while True:
+            request = carried if carried is not None else self._queue.get()
+            carried = None
+            if request is None:
+                return
+            batch = [request]
+            num_rows = len(request.input_df)
+            deadline = request.enqueued_at + self.max_delay_ms / 1000
+            stopping = False
+            while num_rows < self.max_batch_rows:
+                timeout = deadline - time.perf_counter()
+                try:
+                    if timeout > 0:
+                        request = self._queue.get(timeout=timeout)
+                    else:
+                        request = self._queue.get_nowait()
+                except queue.Empty:
+                    break
+                if request is None:
+                    stopping = True
+                    break
+                if (num_rows + len(request.input_df) > self.max_batch_rows
+                        or request.layout != batch[0].layout):
+                    carried = request
+                    break
+                batch.append(request)
+                num_rows += len(request.input_df)
+            self._predict_batch(batch, num_rows)
+            if stopping:
+                return
+
+    def _predict_batch(self, batch, num_rows):
+        start = time.perf_counter()
+        for request in batch:
+            self.queue_latency.record(start - request.enqueued_at)
+        self.batch_rows.record(num_rows)
+        try:
+            if len(batch) == 1:
+                result_df = self.model.predict(batch[0].input_df)
+            else:
+                result_df = self.model.predict(pd.concat(
+                    [request.input_df for request in batch],
+                    ignore_index=True))
+            if len(result_df) != num_rows:
+                raise ValueError(f'Expected {num_rows} predictions, got '
+                                 f'{len(result_df)}')
+        except Exception as e:
+            self.predict_latency.record(time.perf_counter() - start)
+            if len(batch) == 1:
+                batch[0].future.set_exception(e)
+                return
+            LOG.exception(f'Batch of {len(batch)} requests failed, retrying '
+                          f'them one at a time')
+            for request in batch:
+                self._predict_batch([request], len(request.input_df))
+            return
+        self.predict_latency.record(time.perf_counter() - start)
+
+        if len(batch) == 1:
+            batch[0].future.set_result(result_df)
+            return
+        bounds = np.cumsum([0] + [len(request.input_df)
+                                  for request in batch])
+        for request, begin, end in zip(batch, bounds[:-1], bounds[1:]):
+            request.future.set_result(
+                result_df.iloc[begin:end].reset_index(drop=True))
@@ -0,0 +1,323 @@
+"""Executor-side registry of loaded models, kept under a memory budget.
+
+Models follow the lifecycle of the wrappers in this directory:
+`load_model()` loads the model and does nothing if it is already loaded,
+`unload_model()` frees its sessions, clients and artifacts, and
+`memory_footprint()` returns its approximate resident bytes. Any of these
+methods may be missing: such models are expected to load on construction,
+have nothing to free when evicted, and count as using as much memory as the
+process's resident size grew by while they were created and loaded.
+`ModelHost` imports each package before that, so modules it imports for the
+first time (e.g. TensorFlow) are not counted; loads of other models that
+overlap with it are.
+
+Once the models loaded together need more than the budget, the least
+recently used ones are unloaded. The model being requested is always kept,
+even if it alone exceeds the budget, and so are models in use by `use`,
+which are unloaded once released if they are still over the budget.
+
+`ModelHost` serves model packages this way, loading each one on demand with
+its package.py's `get_model()`.
+"""
+import collections
+import contextlib
+import importlib
+import importlib.machinery
+import importlib.util
+import logging
+import re
+import sys
+import threading
+import time
+from pathlib import Path
+
+from artifact_cache import clear_unused_artifacts
+from artifact_cache import resident_bytes
+
+LOG = logging.getLogger(__name__)
+
+
+class LoadedModel:
+    """A model held by the registry, with the resources it was measured to
+    use."""
+    def __init__(self, name, model, resident_bytes, load_seconds):
+        self.name = name
+        self.model = model
+        # Growth of the process's resident size while the model was created
+        # and loaded.
+        self.resident_bytes = resident_bytes
+        self.load_seconds = load_seconds
+        self.last_used = time.time()
+        # Number of `use` blocks the model is in. It is not unloaded until
+        # this drops to 0.
+        self.ref_count = 0
+        # Set when the model leaves the registry while in use.
+        self.removed = False
+
+    def footprint(self):
+        """Returns `memory_footprint()` of the model if it has one, and the
+        resident size it was measured to add otherwise."""
+        memory_footprint = getattr(self.model, 'memory_footprint', None)
+        if memory_footprint is None:
+            return self.resident_bytes
+        return memory_footprint()
+
+
+class ModelRegistry:
+    def __init__(self, memory_budget_bytes):
+        """
+        :param memory_budget_bytes: Total footprint of the loaded models
+            above which the least recently used ones are unloaded.
+        """
+        self.memory_budget_bytes = memory_budget_bytes
+        # Models are loaded and unloaded outside the lock, so requests for
+        # loaded models never wait for them.
+        self.lock = threading.RLock()
+        # name => LoadedModel. Least recently used first.
+        self._models = collections.OrderedDict()
+        # name => Event set once the thread loading it is done, so a model
+        # is never loaded twice at once.
+        self._loading = {}
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    @property
+    def hit_rate(self):
+        """Fraction of requests served by an already loaded model."""
+        requests = self.hits + self.misses
+        return self.hits / requests if requests else 0.0
+
+    def get(self, name, factory):
+        """Returns the model registered as `name`. If it is not loaded, it
+        is created by calling `factory()` and loaded, and other models are
+        unloaded as needed to stay within the budget.
+
+        The model may be unloaded by later requests for other models while
+        the caller uses it; see `use`."""
+        with self.use(name, factory) as model:
+            return model
+
+    @contextlib.contextmanager
+    def use(self, name, factory):
+        """Like `get`, but keeps the model loaded until the block exits."""
+        loaded = self._acquire(name, factory)
+        try:
+            yield loaded.model
+        finally:
+            self._release(loaded)
+
+    def unload(self, name):
+        """Unloads the model registered as `name`, if it is loaded. Models in
+        use are unloaded once released."""
+        with self.lock:
+            loaded = self._models.pop(name, None)
+            unloading = self._remove([] if loaded is None else [loaded])
+        self._unload_all(unloading)
+
+    def clear(self):
+        """Unloads every model. Models in use are unloaded once released."""
+        with self.lock:
+            unloading = self._remove(list(self._models.values()))
+            self._models.clear()
+        self._unload_all(unloading)
+
+    def memory_footprint(self):
+        """Returns the total footprint of the loaded models."""
+        with self.lock:
+            return sum(loaded.footprint()
+                       for loaded in self._models.values())
+
+    def loaded_models(self):
+        """Returns the `LoadedModel` of every loaded model, least recently
+        used first."""
+        with self.lock:
+            return list(self._models.values())
+
+    def stats(self):
+        with self.lock:
+            return {'hits': self.hits, 'misses': self.misses,
+                    'hit_rate': self.hit_rate,
+                    'evictions': self.evictions,
+                    'models': len(self._models),
+                    'memory_footprint': self.memory_footprint()}
+
+    def __contains__(self, name):
+        return name in self._models
+
+    def __len__(self):
+        return len(self._models)
+
+    def _acquire(self, name, factory):
+        while True:
+            with self.lock:
+                loaded = self._models.get(name)
+                if loaded is not None:
+                    self.hits += 1
+                    loaded.last_used = time.time()
+                    loaded.ref_count += 1
+                    self._models.move_to_end(name)
+                    return loaded
+                loading = self._loading.get(name)
+                if loading is None:
+                    self.misses += 1
+                    loading = self._loading[name] = threading.Event()
+                    break
+            # Another thread is loading it. If that fails, retry the load.
+            loading.wait()
+
+        try:
+            loaded = self._load(name, factory)
+        except BaseException:
+            with self.lock:
+                del self._loading[name]
+                loading.set()
+            raise
+        with self.lock:
+            loaded.ref_count += 1
+            self._models[name] = loaded
+            del self._loading[name]
+            loading.set()
+            unloading = self._evict()
+        self._unload_all(unloading)
+        return loaded
+
+    def _release(self, loaded):
+        with self.lock:
+            loaded.ref_count -= 1
+            if loaded.ref_count > 0:
+                return
+            # Evictions that were deferred while it was in use.
+            unloading = [loaded] if loaded.removed else self._evict()
+        self._unload_all(unloading)
+
+    @staticmethod
+    def _load(name, factory):
+        LOG.info(f'Loading model {name}')
+        start_time = time.perf_counter()
+        start_resident = resident_bytes()
+        model = factory()
+        load_model = getattr(model, 'load_model', None)
+        if load_model is not None:
+            load_model()
+        growth = (0 if start_resident is None
+                  else max(resident_bytes() - start_resident, 0))
+        return LoadedModel(name, model, growth,
+                           time.perf_counter() - start_time)
+
+    def _evict(self):
+        """Removes the least recently used models that are not in use until
+        the rest fit in the budget, always keeping the most recently used
+        one. Returns the removed models to unload, outside the lock."""
+        footprints = collections.OrderedDict(
+            (name, loaded.footprint())
+            for name, loaded in self._models.items())
+        total = sum(footprints.values())
+        keep = next(reversed(footprints), None)
+        unloading = []
+        for name, footprint in footprints.items():
+            if total <= self.memory_budget_bytes:
+                break
+            if name == keep or self._models[name].ref_count > 0:
+                continue
+            unloading.append(self._models.pop(name))
+            self.evictions += 1
+            total -= footprint
+        if total > self.memory_budget_bytes:
+            LOG.warning(f'Loaded models use {total} bytes, more than the '
+                        f'budget of {self.memory_budget_bytes}')
+        return unloading
+
+    @staticmethod
+    def _remove(models):
+        """Returns those of `models`, just taken out of the registry, that
+        can be unloaded now. The others are unloaded once released."""
+        for loaded in models:
+            loaded.removed = True
+        return [loaded for loaded in models if loaded.ref_count == 0]
+
+    def _unload_all(self, unloading):
+        for loaded in unloading:
+            self._unload(loaded)
+        if unloading:
+            # Unloaded models release their artifacts, which are only freed
+            # once evicted from the artifact cache.
+            clear_unused_artifacts()
+
+    @staticmethod
+    def _unload(loaded):
+        LOG.info(f'Unloading model {loaded.name}')
+        unload_model = getattr(loaded.model, 'unload_model', None)
+        if unload_model is not None:
+            unload_model()
+
+
+def import_package(package_dir):
+    """Imports `package_dir/package.py` and returns the module.
+
+    As in the executor, the model directory is imported as a subpackage of
+    its project directory, so package.py may import from its own directory
+    and from sibling models (e.g. imdb_rnn_test from imdb_rnn) with relative
+    imports. Directory names need not be valid identifiers (e.g.
+    'logreg-all').
+    """
+    package_dir = Path(package_dir).resolve()
+    project = 'model_project_' + re.sub(r'\W', '_', str(package_dir.parent))
+    if project not in sys.modules:
+        spec = importlib.machinery.ModuleSpec(project, None, is_package=True)
+        spec.submodule_search_locations.append(str(package_dir.parent))
+        sys.modules[project] = importlib.util.module_from_spec(spec)
+    return importlib.import_module(f'{project}.{package_dir.name}.package')
+
+
+def model_factory(package_dir):
+    """Imports the package in `package_dir` and returns its function that
+    creates the model."""
+    package = import_package(package_dir)
+    # pmml_iris names its factory get_model_class.
+    return getattr(package, 'get_model', None) or package.get_model_class
+
+
+def create_model(package_dir):
+    """Returns the model of the package in `package_dir`."""
+    return model_factory(package_dir)()
+
+
+class ModelHost(ModelRegistry):
+    """Serves several model packages from one process, loading each on its
+    first request and unloading the least recently used ones to stay within
+    the memory budget."""
+
+    def __init__(self, package_dirs, memory_budget_bytes):
+        """
+        :param package_dirs: Dict of model name => package directory, i.e.
+            the directory containing its package.py.
+        :param memory_budget_bytes: See `ModelRegistry`.
+        """
+        super().__init__(memory_budget_bytes)
+        self.package_dirs = dict(package_dirs)
+        # name => get_model of its package.
+        self._factories = {}
+
+    def get_model(self, name):
+        """Returns the model of package `name`, loading it if needed. See
+        `ModelRegistry.get`."""
+        return self.get(name, self._factory(name))
+
+    def use_model(self, name):
+        """Returns a context manager that keeps the model of package `name`
+        loaded while in it. See `ModelRegistry.use`."""
+        return self.use(name, self._factory(name))
+
+    def predict(self, name, input_df):
+        with self.use_model(name) as model:
+            return model.predict(input_df)
+
+    def _factory(self, name):
+        # The package is imported before its model is measured, so that
+        # the modules it imports are not counted in the model's footprint.
+        factory = self._factories.get(name)
+        if factory is None:
+            factory = self._factories[name] = model_factory(
+                self.package_dirs[name])
+        return factory
@@ -0,0 +1,326 @@
+"""Serves a model package from several worker processes.
+
+pandas preprocessing and the Python side of sklearn and TF run under the
+GIL, so a model predicts on about one core however many threads call it.
+`ModelServer` forks `num_workers` processes, each of which imports the
+package and calls its `get_model()` once, after the fork, so no session,
+thread pool or client is shared between processes. Each request is sent to
+an idle worker as a pickled DataFrame over a pipe, and the prediction comes
+back the same way. On Python 3.8+, the column buffers of large requests are
+copied into a shared memory segment of the worker instead, and only the
+rest of the pickle goes through the pipe, which is several times slower to
+copy through. Predictions have a row per input row and only a few columns,
+so they always come back over the pipe.
+
+A worker that exits is replaced by a new one, forked in the background. If
+it can't load the model either, the server runs with fewer workers, and
+once none are left, requests fail instead of waiting for one.
+
+Workers are forked from the calling process, so it should not have loaded
+TF or started threads that hold locks, e.g. call `load_model()` before
+loading models or starting a MicroBatcher in the same process.
+"""
+import logging
+import multiprocessing
+import os
+import pickle
+import queue
+import threading
+import time
+import traceback
+
+from artifact_cache import resident_bytes
+from model_registry import create_model
+
+try:
+    from multiprocessing import resource_tracker
+    from multiprocessing import shared_memory
+except ImportError:  # Python 3.7
+    shared_memory = None
+
+LOG = logging.getLogger(__name__)
+
+# Requests whose columns take at least this many bytes are passed through
+# shared memory, where available.
+SHARED_MEMORY_MIN_BYTES = 64 * 1024
+
+
+def _picklable(e):
+    """Returns `e`, or a RuntimeError describing it if it can't be sent
+    back to the server."""
+    try:
+        pickle.dumps(e)
+        return e
+    except Exception:
+        return RuntimeError(
+            ''.join(traceback.format_exception_only(type(e), e)).strip())
+
+
+class _SharedRequest:
+    """A DataFrame pickled with its column buffers out of band, which are in
+    the shared memory segment `name` at the (offset, size) `spans`."""
+
+    def __init__(self, data, name, spans):
+        self.data = data
+        self.name = name
+        self.spans = spans
+
+    def load(self, segment):
+        # Copied out of the segment, which the next request overwrites.
+        buffers = [bytearray(segment.buf[offset:offset + size])
+                   for offset, size in self.spans]
+        return pickle.loads(self.data, buffers=buffers)
+
+
+def _serve(package_dir, conn):
+    try:
+        start_time = time.perf_counter()
+        model = create_model(package_dir)
+        conn.send((True, time.perf_counter() - start_time))
+    except Exception as e:
+        LOG.exception(f'Failed to load {package_dir}')
+        conn.send((False, _picklable(e)))
+        return
+    segment = None
+    while True:
+        try:
+            request = conn.recv()
+        except EOFError:
+            break
+        if request is None:
+            break
+        try:
+            if isinstance(request, _SharedRequest):
+                if segment is None or segment.name != request.name:
+                    if segment is not None:
+                        segment.close()
+                    segment = shared_memory.SharedMemory(request.name)
+                request = request.load(segment)
+            conn.send((True, model.predict(request)))
+        except Exception as e:
+            conn.send((False, _picklable(e)))
+    if segment is not None:
+        segment.close()
+    unload_model = getattr(model, 'unload_model', None)
+    if unload_model is not None:
+        unload_model()
+
+
+class _Worker:
+    def __init__(self, process, conn):
+        self.process = process
+        self.conn = conn
+        self.load_seconds = None
+        # Shared memory the worker reads large requests from.
+        self.segment = None
+
+    def wait_loaded(self):
+        """Waits for the worker to create its model, and returns the error
+        if it failed."""
+        try:
+            ok, result = self.conn.recv()
+        except (EOFError, OSError):
+            ok, result = False, RuntimeError(
+                f'Worker {self.process.pid} exited while loading')
+        if not ok:
+            return result
+        self.load_seconds = result
+        return None
+
+    def send(self, input_df):
+        if (shared_memory is None or input_df.memory_usage(
+                index=False).sum() < SHARED_MEMORY_MIN_BYTES):
+            self.conn.send(input_df)
+            return
+        buffers = []
+        data = pickle.dumps(input_df, protocol=5,
+                            buffer_callback=buffers.append)
+        views = [buffer.raw() for buffer in buffers]
+        segment = self._get_segment(sum(view.nbytes for view in views))
+        spans = []
+        offset = 0
+        for view in views:
+            segment.buf[offset:offset + view.nbytes] = view
+            spans.append((offset, view.nbytes))
+            offset += view.nbytes
+        self.conn.send(_SharedRequest(data, segment.name, spans))
+
+    def _get_segment(self, size):
+        if self.segment is None or self.segment.size < size:
+            self._close_segment()
+            # Grown in powers of two, so it is rarely replaced.
+            self.segment = shared_memory.SharedMemory(
+                create=True, size=1 << max(size - 1, 0).bit_length())
+        return self.segment
+
+    def _close_segment(self):
+        segment, self.segment = self.segment, None
+        if segment is not None:
+            segment.close()
+            segment.unlink()
+
+    def stop(self):
+        self.process.join(timeout=10)
+        if self.process.is_alive():
+            LOG.warning(f'Terminating worker {self.process.pid}')
+            self.process.terminate()
+            self.process.join()
+        self.conn.close()
+        self._close_segment()
+
+
+class ModelServer:
+    def __init__(self, package_dir, num_workers=None):
+        """
+        :param package_dir: Directory containing the package.py to serve.
+        :param num_workers: Number of worker processes. Defaults to the
+            number of CPUs.
+        """
+        self.package_dir = package_dir
+        self.num_workers = num_workers or os.cpu_count()
+        self._workers = []
+        # Workers not serving a request. None once no workers are left.
+        self._idle = queue.Queue()
+        # Number of workers serving or replacing one that exited.
+        self._num_live = 0
+        self._num_started = 0
+        self.respawns = 0
+        self.lock = threading.Lock()
+
+    @property
+    def load_seconds(self):
+        """Time each worker took to create its model, including those that
+        replaced workers that exited."""
+        return [worker.load_seconds for worker in self._workers]
+
+    def load_model(self):
+        """Starts the workers and waits for each to load the model."""
+        with self.lock:
+            if self._workers:
+                return
+            # The old queue may hold the None left by the last workers.
+            self._idle = queue.Queue()
+            self._workers = [self._start_worker()
+                             for _ in range(self.num_workers)]
+            error = None
+            for worker in self._workers:
+                worker_error = worker.wait_loaded()
+                if worker_error is None:
+                    self._idle.put(worker)
+                elif error is None:
+                    error = worker_error
+            if error is not None:
+                self._stop_workers()
+                raise RuntimeError(
+                    f'Failed to load {self.package_dir}') from error
+            self._num_live = self.num_workers
+            LOG.info(f'Serving {self.package_dir} from {self.num_workers} '
+                     f'workers')
+
+    def unload_model(self):
+        """Stops the workers."""
+        with self.lock:
+            self._stop_workers()
+
+    def memory_footprint(self):
+        """Returns the total resident size of the workers."""
+        return sum(resident_bytes(worker.process.pid) or 0
+                   for worker in self._workers)
+
+    def predict(self, input_df):
+        """Returns the prediction of an idle worker for `input_df`. Blocks
+        until a worker is idle, so up to `num_workers` calls from different
+        threads are served at once."""
+        if not self._workers:
+            raise RuntimeError('ModelServer is not loaded')
+        idle = self._idle
+        worker = idle.get()
+        if worker is None:
+            # Wakes the next waiting caller too.
+            idle.put(None)
+            raise RuntimeError(f'No workers left serving {self.package_dir}')
+        try:
+            worker.send(input_df)
+            ok, result = worker.conn.recv()
+        except (EOFError, OSError) as e:
+            # The worker is replaced instead of returned to the idle queue.
+            # The request is not retried, as it may be what killed it.
+            self._replace(worker, idle)
+            raise RuntimeError(
+                f'Worker {worker.process.pid} exited') from e
+        except Exception:
+            # E.g. a request that can't be pickled, which fails before any
+            # of it is written, so the worker can serve the next one.
+            idle.put(worker)
+            raise
+        idle.put(worker)
+        if not ok:
+            raise result
+        return result
+
+    def __enter__(self):
+        self.load_model()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.unload_model()
+
+    def _start_worker(self):
+        if shared_memory is not None:
+            # Workers share the server's tracker, rather than starting their
+            # own, which would unlink the segments when they exit.
+            resource_tracker.ensure_running()
+        context = multiprocessing.get_context('fork')
+        conn, worker_conn = context.Pipe()
+        process = context.Process(
+            target=_serve, args=(self.package_dir, worker_conn),
+            name=f'model-server-{self._num_started}', daemon=True)
+        self._num_started += 1
+        process.start()
+        worker_conn.close()
+        return _Worker(process, conn)
+
+    def _replace(self, worker, idle):
+        LOG.warning(f'Worker {worker.process.pid} exited with code '
+                    f'{worker.process.exitcode}, starting a new one')
+        threading.Thread(target=self._respawn, args=(worker, idle),
+                         daemon=True, name='model-server-respawn').start()
+
+    def _respawn(self, worker, idle):
+        worker.stop()
+        with self.lock:
+            # Unloaded, or unloaded and loaded again, meanwhile.
+            if idle is not self._idle:
+                return
+            new_worker = self._start_worker()
+            self._workers.append(new_worker)
+            self._workers.remove(worker)
+        error = new_worker.wait_loaded()
+        with self.lock:
+            if idle is not self._idle:
+                return
+            if error is None:
+                self.respawns += 1
+                idle.put(new_worker)
+                return
+            LOG.error(f'Replacement worker failed to load '
+                      f'{self.package_dir}: {error}')
+            self._workers.remove(new_worker)
+            self._num_live -= 1
+            if self._num_live == 0:
+                idle.put(None)
+        new_worker.stop()
+
+    def _stop_workers(self):
+        for worker in self._workers:
+            try:
+                worker.conn.send(None)
+            except OSError:
+                pass
+        for worker in self._workers:
+            worker.stop()
+        self._workers = []
+        self._num_live = 0
+        # Callers waiting on the old queue are told the server stopped.
+        self._idle.put(None)
+        self._idle = queue.Queue()
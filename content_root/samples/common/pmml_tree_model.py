@@ -0,0 +1,232 @@
+"""In-process evaluation of PMML TreeModel classifiers, such as those
+exported by R's rpart through the pmml package.
+
+The tree is parsed once into node arrays and every row walks it at once,
+one tree level per step. Results have the columns an openscoring server
+returns for the model: the target field followed by the model's output
+fields.
+
+Supported: SimplePredicate, True and False node predicates on continuous
+fields, the defaultChild, lastPrediction and none missing value strategies,
+and probability, predictedValue and entityId output fields.
+"""
+import xml.etree.ElementTree as ET
+
+import numpy as np
+import pandas as pd
+
+# SimplePredicate operators, plus codes for True and False predicates.
+_OPERATORS = ['lessThan', 'lessOrEqual', 'greaterThan', 'greaterOrEqual',
+              'equal', 'notEqual', 'isMissing', 'isNotMissing']
+_TRUE = len(_OPERATORS)
+_FALSE = _TRUE + 1
+_MISSING_VALUE_STRATEGIES = ('none', 'defaultChild', 'lastPrediction')
+
+
+def _local_name(element):
+    return element.tag.rsplit('}', 1)[-1]
+
+
+def _children(element, name):
+    return [child for child in element if _local_name(child) == name]
+
+
+def _child(element, name):
+    children = _children(element, name)
+    return children[0] if children else None
+
+
+class PMMLTreeModel:
+    def __init__(self, pmml_path):
+        root = ET.parse(pmml_path).getroot()
+        tree = _child(root, 'TreeModel')
+        if tree is None or tree.get('functionName') != 'classification':
+            raise NotImplementedError('Only classification TreeModels are '
+                                      'supported')
+        self.missing_value_strategy = tree.get('missingValueStrategy',
+                                               'none')
+        if self.missing_value_strategy not in _MISSING_VALUE_STRATEGIES:
+            raise NotImplementedError(f'Unsupported missingValueStrategy '
+                                      f'{self.missing_value_strategy}')
+        self.return_last_prediction = (
+            tree.get('noTrueChildStrategy') == 'returnLastPrediction')
+
+        mining_fields = _children(_child(tree, 'MiningSchema'),
+                                  'MiningField')
+        self.target_field = next(
+            field.get('name') for field in mining_fields
+            if field.get('usageType') in ('predicted', 'target'))
+        self.active_fields = [
+            field.get('name') for field in mining_fields
+            if field.get('usageType', 'active') == 'active']
+        data_fields = {field.get('name'): field for field in _children(
+            _child(root, 'DataDictionary'), 'DataField')}
+        self.classes = [value.get('value') for value in _children(
+            data_fields[self.target_field], 'Value')]
+
+        output = _child(tree, 'Output')
+        self.output_fields = [] if output is None else [
+            (field.get('name'), field.get('feature'), field.get('value'))
+            for field in _children(output, 'OutputField')]
+        for name, feature, _ in self.output_fields:
+            if feature not in ('probability', 'predictedValue', 'entityId'):
+                raise NotImplementedError(f'Unsupported output feature '
+                                          f'{feature} for {name}')
+
+        self._build(_child(tree, 'Node'))
+
+    def _build(self, root_node):
+        nodes = []
+        stack = [root_node]
+        while stack:
+            node = stack.pop()
+            nodes.append(node)
+            stack.extend(reversed(_children(node, 'Node')))
+        index = {id(node): i for i, node in enumerate(nodes)}
+        ids = {node.get('id'): i for i, node in enumerate(nodes)}
+        field_index = {field: i for i, field in enumerate(self.active_fields)}
+
+        # The extra last node stands for a null prediction.
+        num_nodes = len(nodes) + 1
+        max_children = max(len(_children(node, 'Node')) for node in nodes)
+        self.children = np.full((num_nodes, max(max_children, 1)), -1,
+                                dtype=np.intp)
+        self.operator = np.full(num_nodes, _TRUE, dtype=np.intp)
+        self.feature = np.zeros(num_nodes, dtype=np.intp)
+        self.threshold = np.zeros(num_nodes)
+        self.default_child = np.full(num_nodes, num_nodes - 1, dtype=np.intp)
+        self.probabilities = np.full((num_nodes, len(self.classes)), np.nan)
+        self.scores = np.empty(num_nodes, dtype=object)
+        self.entity_ids = np.empty(num_nodes, dtype=object)
+
+        for i, node in enumerate(nodes):
+            for j, child in enumerate(_children(node, 'Node')):
+                self.children[i, j] = index[id(child)]
+            if node.get('defaultChild') is not None:
+                self.default_child[i] = ids[node.get('defaultChild')]
+            self._set_predicate(i, node, field_index)
+            self.scores[i] = node.get('score')
+            self.entity_ids[i] = node.get('id')
+
+            distribution = {
+                score.get('value'): score
+                for score in _children(node, 'ScoreDistribution')}
+            total = sum(float(score.get('recordCount'))
+                        for score in distribution.values())
+            for k, value in enumerate(self.classes):
+                score = distribution.get(value)
+                if score is None:
+                    probability = 0.0
+                elif score.get('probability') is not None:
+                    probability = float(score.get('probability'))
+                else:
+                    probability = float(score.get('recordCount')) / total
+                self.probabilities[i, k] = probability
+
+        self.null_node = num_nodes - 1
+        self.is_leaf = self.children[:, 0] == -1
+        self.max_depth = self._depth(0)
+
+    def _set_predicate(self, i, node, field_index):
+        predicate = next(child for child in node
+                         if _local_name(child) != 'Extension')
+        name = _local_name(predicate)
+        if name == 'True':
+            self.operator[i] = _TRUE
+        elif name == 'False':
+            self.operator[i] = _FALSE
+        elif name == 'SimplePredicate':
+            self.operator[i] = _OPERATORS.index(predicate.get('operator'))
+            self.feature[i] = field_index[predicate.get('field')]
+            if predicate.get('value') is not None:
+                self.threshold[i] = float(predicate.get('value'))
+        else:
+            raise NotImplementedError(f'Unsupported predicate {name}')
+
+    def _depth(self, i):
+        children = self.children[i][self.children[i] >= 0]
+        return 1 + max((self._depth(child) for child in children), default=0)
+
+    def _evaluate_predicates(self, nodes, X):
+        """Returns whether each row's predicate at `nodes` is true, and
+        whether it is unknown because its field is missing."""
+        operator = self.operator[nodes]
+        values = X[np.arange(len(nodes)), self.feature[nodes]]
+        threshold = self.threshold[nodes]
+        missing = np.isnan(values)
+        with np.errstate(invalid='ignore'):
+            results = np.select(
+                [operator == k for k in range(len(_OPERATORS) + 2)],
+                [values < threshold, values <= threshold,
+                 values > threshold, values >= threshold,
+                 values == threshold, values != threshold,
+                 missing, ~missing,
+                 np.ones(len(nodes), dtype=bool),
+                 np.zeros(len(nodes), dtype=bool)], default=False)
+        unknown = missing & (operator < _OPERATORS.index('isMissing'))
+        return results & ~unknown, unknown
+
+    def leaf_nodes(self, input_df):
+        """Returns the index of the node each row's prediction comes from,
+        or `null_node`. `input_df` must have a column for every active
+        field; its missing values follow the missing value strategy."""
+        # A misnamed column would otherwise send every row down the
+        # missing value path.
+        absent = [field for field in self.active_fields
+                  if field not in input_df]
+        if absent:
+            raise ValueError(f'Input has no column for the active fields '
+                             f'{absent}')
+        X = np.full((len(input_df), max(len(self.active_fields), 1)), np.nan)
+        for i, field in enumerate(self.active_fields):
+            X[:, i] = pd.to_numeric(input_df[field], errors='coerce')
+
+        nodes = np.zeros(len(input_df), dtype=np.intp)
+        done = self.is_leaf[nodes]
+        for _ in range(self.max_depth):
+            rows = np.flatnonzero(~done)
+            if len(rows) == 0:
+                break
+            current = nodes[rows]
+            # Where no child's predicate is true.
+            next_nodes = (current.copy() if self.return_last_prediction
+                          else np.full(len(rows), self.null_node))
+            undecided = np.ones(len(rows), dtype=bool)
+            for j in range(self.children.shape[1]):
+                child = self.children[current, j]
+                candidates = np.flatnonzero(undecided & (child >= 0))
+                if len(candidates) == 0:
+                    continue
+                is_true, unknown = self._evaluate_predicates(
+                    child[candidates], X[rows[candidates]])
+                if self.missing_value_strategy == 'defaultChild':
+                    unknown_rows = candidates[unknown]
+                    next_nodes[unknown_rows] = self.default_child[
+                        current[unknown_rows]]
+                    undecided[unknown_rows] = False
+                elif self.missing_value_strategy == 'lastPrediction':
+                    unknown_rows = candidates[unknown]
+                    next_nodes[unknown_rows] = current[unknown_rows]
+                    undecided[unknown_rows] = False
+                matched = candidates[is_true]
+                next_nodes[matched] = child[matched]
+                undecided[matched] = False
+            nodes[rows] = next_nodes
+            # Rows that stayed at an inner node keep its prediction.
+            done[rows] = (next_nodes == current) | self.is_leaf[next_nodes]
+        return nodes
+
+    def evaluate(self, input_df):
+        """Scores `input_df`, returning the target field and the output
+        fields as columns."""
+        nodes = self.leaf_nodes(input_df)
+        columns = {self.target_field: self.scores[nodes]}
+        for name, feature, value in self.output_fields:
+            if feature == 'probability':
+                columns[name] = self.probabilities[
+                    nodes, self.classes.index(value)]
+            elif feature == 'predictedValue':
+                columns[name] = self.scores[nodes]
+            else:
+                columns[name] = self.entity_ids[nodes]
+        return pd.DataFrame(columns)
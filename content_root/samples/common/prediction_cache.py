@@ -0,0 +1,185 @@
+"""Cache of prediction results for models that score rows on a remote
+service, such as a SageMaker endpoint or an Openscoring server.
+
+Monitoring replays and explanation sampling often send rows that were
+scored before. With a cache, only rows that are not cached go to the
+remote service, and only once per distinct row.
+
+Rows are keyed by a 128-bit hash of their values, after integer columns are
+cast to float, together with the column names and the model identity.
+Entries expire `ttl_seconds` after they were stored, and the least recently
+used are evicted once there are more than `max_entries`.
+"""
+import collections
+import threading
+import time
+
+import numpy as np
+import pandas as pd
+
+DEFAULT_MAX_ENTRIES = 100000
+DEFAULT_TTL_SECONDS = 3600
+
+# Approximate bytes used by an entry besides its values: the key, the entry
+# tuple, the values array object and the OrderedDict node (CPython 3.7-3.11).
+_ENTRY_OVERHEAD_BYTES = 430
+
+# Two independently keyed 64-bit row hashes.
+_HASH_KEYS = ('prediction-cache', 'cache-prediction')
+
+
+class _Layout:
+    """Output columns and dtypes, shared by the entries of one result."""
+    def __init__(self, result_df):
+        self.columns = result_df.columns
+        self.dtypes = result_df.dtypes
+
+
+class PredictionCache:
+    def __init__(self, model_id, max_entries=DEFAULT_MAX_ENTRIES,
+                 ttl_seconds=DEFAULT_TTL_SECONDS):
+        """
+        :param model_id: Identifies the remote model, e.g. the endpoint name.
+            Caches for different models never share results.
+        :param max_entries: Maximum number of rows kept.
+        :param ttl_seconds: Seconds a result is served from the cache.
+        """
+        self.model_id = model_id
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self.lock = threading.Lock()
+        # key => (expires_at, layout, values). Least recently used first.
+        self._entries = collections.OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+
+    @classmethod
+    def from_config(cls, config, model_id):
+        """Returns a cache configured by a `prediction_cache` section of a
+        model.yaml, e.g. {max_entries: 10000, ttl_seconds: 600}, or None if
+        there isn't one."""
+        if config is None:
+            return None
+        return cls(model_id,
+                   max_entries=config.get('max_entries', DEFAULT_MAX_ENTRIES),
+                   ttl_seconds=config.get('ttl_seconds', DEFAULT_TTL_SECONDS))
+
+    def predict(self, input_df, predict_fn):
+        """Returns `predict_fn(input_df)`, calling it only with the distinct
+        rows of `input_df` that are not cached."""
+        if len(input_df) == 0:
+            return predict_fn(input_df)
+        keys, found = self._lookup(input_df)
+        positions = self._missing_positions(keys, found)
+        if len(positions) > 0:
+            self._store(keys, found, positions,
+                        predict_fn(input_df.iloc[positions]))
+        return self._assemble(found)
+
+    async def apredict(self, input_df, apredict_fn):
+        """Async `predict`, awaiting `apredict_fn` for the missing rows."""
+        if len(input_df) == 0:
+            return await apredict_fn(input_df)
+        keys, found = self._lookup(input_df)
+        positions = self._missing_positions(keys, found)
+        if len(positions) > 0:
+            self._store(keys, found, positions,
+                        await apredict_fn(input_df.iloc[positions]))
+        return self._assemble(found)
+
+    @property
+    def hit_rate(self):
+        lookups = self.hits + self.misses
+        return self.hits / lookups if lookups else 0.0
+
+    def stats(self):
+        with self.lock:
+            return {'hits': self.hits, 'misses': self.misses,
+                    'hit_rate': self.hit_rate,
+                    'evictions': self.evictions,
+                    'expirations': self.expirations,
+                    'entries': len(self._entries)}
+
+    def clear(self):
+        with self.lock:
+            self._entries.clear()
+
+    def memory_footprint(self):
+        """Returns the approximate bytes used by the cached results."""
+        with self.lock:
+            return sum(_ENTRY_OVERHEAD_BYTES + entry[2].nbytes
+                       for entry in self._entries.values())
+
+    def __len__(self):
+        return len(self._entries)
+
+    def row_keys(self, input_df):
+        """Returns the cache key of every row of `input_df`."""
+        canonical = input_df.copy(deep=False)
+        for column, dtype in input_df.dtypes.items():
+            if pd.api.types.is_integer_dtype(dtype):
+                canonical[column] = input_df[column].astype(np.float64)
+        hashes = [pd.util.hash_pandas_object(canonical, index=False,
+                                             hash_key=hash_key).values
+                  for hash_key in _HASH_KEYS]
+        prefix = hash((self.model_id, tuple(input_df.columns)))
+        return [(prefix, low, high)
+                for low, high in zip(hashes[0].tolist(), hashes[1].tolist())]
+
+    def _lookup(self, input_df):
+        keys = self.row_keys(input_df)
+        found = [None] * len(keys)
+        now = time.time()
+        with self.lock:
+            for i, key in enumerate(keys):
+                entry = self._entries.get(key)
+                if entry is not None and entry[0] <= now:
+                    del self._entries[key]
+                    self.expirations += 1
+                    entry = None
+                if entry is None:
+                    self.misses += 1
+                else:
+                    self._entries.move_to_end(key)
+                    self.hits += 1
+                    found[i] = entry
+        return keys, found
+
+    @staticmethod
+    def _missing_positions(keys, found):
+        # First position of each distinct missing row.
+        positions = {}
+        for i, (key, entry) in enumerate(zip(keys, found)):
+            if entry is None and key not in positions:
+                positions[key] = i
+        return np.fromiter(positions.values(), dtype=np.intp,
+                           count=len(positions))
+
+    def _store(self, keys, found, positions, result_df):
+        if len(result_df) != len(positions):
+            raise ValueError(f'Expected {len(positions)} predictions, got '
+                             f'{len(result_df)}')
+        layout = _Layout(result_df)
+        expires_at = time.time() + self.ttl_seconds
+        # Results of this call are kept here too, in case the cache is too
+        # small to hold them all.
+        new_entries = {keys[position]: (expires_at, layout, values)
+                       for position, values
+                       in zip(positions, result_df.to_numpy())}
+        with self.lock:
+            self._entries.update(new_entries)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+        for i, key in enumerate(keys):
+            if found[i] is None:
+                found[i] = new_entries[key]
+
+    @staticmethod
+    def _assemble(found):
+        layout = found[0][1]
+        result = pd.DataFrame(np.array([entry[2] for entry in found]),
+                              columns=layout.columns)
+        return result.astype(dict(zip(layout.columns, layout.dtypes)))
@@ -1,16 +1,96 @@
 import pandas as pd
+import aiohttp
+import asyncio
 import boto3
+import collections
+import io
 import logging
 import json
+import numpy as np
+import random
 import threading
 import time
 import yaml
+from botocore.auth import SigV4Auth
+from botocore.awsrequest import AWSRequest
+from botocore.config import Config
+from botocore.exceptions import ClientError
+from botocore.exceptions import ConnectionError
+from botocore.exceptions import HTTPClientError
+from botocore.response import StreamingBody
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import quote
+
+from prediction_cache import PredictionCache
 
 _logger = logging.getLogger(__name__)
 
 
 MAX_REQUEST_SIZE = 4 * 1024 * 1024  # Limit to 4MB. AWS API limit is 5MB.
 
+# Errors retried by `SageMakerRuntimeModel`, in addition to 5xx responses
+# and connection errors.
+THROTTLING_ERROR_CODES = {'ThrottlingException', 'ModelNotReadyException',
+                          'TooManyRequestsException'}
+
+JSON_CONTENT_TYPE = 'application/json'
+CSV_CONTENT_TYPE = 'text/csv'
+
+
+def parse_json_scores(body):
+    """Yields arrays of scores from a JSON lines response body, one per
+    line, e.g. {"predictions": [{"score": 2.043767929}]}."""
+    for line in body.iter_lines():
+        if line:
+            yield np.asarray([prediction['score'] for prediction
+                              in json.loads(line)['predictions']],
+                             dtype=np.float64).ravel()
+
+
+def parse_csv_scores(body):
+    """Yields the scores in a CSV response body, with a row per input
+    row and a value per output column."""
+    yield np.array(body.read().replace(b',', b' ').split(), dtype=np.float64)
+
+
+_SCORE_PARSERS = {JSON_CONTENT_TYPE: parse_json_scores,
+                  CSV_CONTENT_TYPE: parse_csv_scores}
+
+
+def row_chunks(input_df, max_request_size=MAX_REQUEST_SIZE):
+    """
+    Serializes `input_df` to CSV and splits it into request bodies of at most
+    `max_request_size` bytes, packing as many whole rows into each as fit.
+    A single row larger than the limit is sent on its own.
+
+    Yields (start_row, end_row, body) with the utf-8 encoded body holding
+    rows [start_row, end_row).
+    """
+    num_rows = input_df.shape[0]
+    if num_rows == 0:
+        return
+    data = input_df.to_csv(header=False, index=False).encode()
+    # Byte offset just past each line's newline.
+    line_ends = np.flatnonzero(
+        np.frombuffer(data, dtype=np.uint8) == ord('\n')) + 1
+    if len(line_ends) != num_rows:
+        # Quoted values contain newlines, so serialize row by row.
+        rows = [input_df.iloc[idx:idx + 1].to_csv(
+                    header=False, index=False).encode()
+                for idx in range(num_rows)]
+        data = b''.join(rows)
+        line_ends = np.cumsum([len(row) for row in rows])
+
+    start_row = 0
+    start_offset = 0
+    while start_row < num_rows:
+        end_row = np.searchsorted(line_ends, start_offset + max_request_size,
+                                  side='right')
+        end_row = max(int(end_row), start_row + 1)
+        end_offset = int(line_ends[end_row - 1])
+        yield start_row, end_row, data[start_offset:end_offset]
+        start_row, start_offset = end_row, end_offset
+
 
 class SageMakerRuntimeModel:
     """
@@ -35,8 +115,76 @@ class SageMakerRuntimeModel:
         self.aws_secret_access_key = endpoint_config.get(
             'aws_secret_access_key', None)
         self.assume_role_arn = endpoint_config.get('assume_role_arn', None)
+        # Optional, e.g. for VPC interface endpoints or a local endpoint.
+        self.endpoint_url = endpoint_config.get('endpoint_url', None)
+
+        self.max_request_size = endpoint_config.get('max_request_size',
+                                                    MAX_REQUEST_SIZE)
+        # Response content type to request, application/json or text/csv.
+        self.accept = endpoint_config.get('accept', JSON_CONTENT_TYPE)
+        if self.accept not in _SCORE_PARSERS:
+            raise ValueError(f'Unsupported accept type "{self.accept}", '
+                             f'expected one of {sorted(_SCORE_PARSERS)}')
+        self._parse_scores = _SCORE_PARSERS[self.accept]
+        # Number of request chunks sent to the endpoint at a time.
+        self.max_concurrent_requests = endpoint_config.get(
+            'max_concurrent_requests', 1)
+        # Throttled and failed requests are retried with exponential
+        # backoff, starting at retry_backoff_seconds.
+        self.max_retries = endpoint_config.get('max_retries', 4)
+        self.retry_backoff_seconds = endpoint_config.get(
+            'retry_backoff_seconds', 0.5)
+        # Optional cache of results by row, e.g.
+        # prediction_cache: {max_entries: 100000, ttl_seconds: 3600}
+        self.prediction_cache = PredictionCache.from_config(
+            endpoint_config.get('prediction_cache', None),
+            f'{self.region_name}/{self.endpoint_name}')
+        self._pool = None
+        # aiohttp session used by apredict, bound to the event loop it was
+        # created on.
+        self._aio_session = None
+        self._aio_loop = None
         self.refresh_client()
 
+    def load_model(self):
+        """Creates the sagemaker-runtime client if `unload_model` closed
+        it."""
+        if self.client is None:
+            self.refresh_client()
+
+    def unload_model(self):
+        """Closes the client and its connections, stops the request threads
+        and clears the prediction cache. Sessions of `apredict` should be
+        closed with `aclose` first; otherwise they are closed here if their
+        event loop is not running, and dropped if it is."""
+        with self.lock:
+            pool = self._pool
+            self._pool = None
+        if pool is not None:
+            pool.shutdown()
+        if self._aio_session is not None:
+            if not self._aio_loop.is_closed():
+                if self._aio_loop.is_running():
+                    self._aio_loop.call_soon_threadsafe(
+                        self._aio_loop.create_task, self._aio_session.close())
+                else:
+                    self._aio_loop.run_until_complete(
+                        self._aio_session.close())
+            self._aio_session = None
+            self._aio_loop = None
+        if self.client is not None:
+            self.client.close()
+            self.client = None
+        if self.prediction_cache is not None:
+            self.prediction_cache.clear()
+
+    def memory_footprint(self):
+        """Returns the approximate bytes used by the prediction cache. The
+        model itself runs on the endpoint."""
+        if self.prediction_cache is None:
+            return 0
+        return self.prediction_cache.memory_footprint()
+
     @staticmethod
     def _ensure_key(config: dict, key: str):
         if key not in config:
@@ -44,43 +192,178 @@ class SageMakerRuntimeModel:
         return config[key]
 
     def predict(self, input_df):
+        if self.prediction_cache is None:
+            return self._predict(input_df)
+        return self.prediction_cache.predict(input_df, self._predict)
+
+    async def apredict(self, input_df):
+        """Same as `predict`, but sends requests from the running event loop
+        through a shared aiohttp connection pool instead of blocking a thread
+        per request. Call `aclose` when done."""
+        if self.prediction_cache is None:
+            return await self._apredict(input_df)
+        return await self.prediction_cache.apredict(input_df, self._apredict)
+
+    def _predict(self, input_df):
+        num_rows = input_df.shape[0]
+        _logger.info('Invoking endpoint with {} rows'.format(num_rows))
+        scores = self._allocate_scores(num_rows)
+
+        if self.max_concurrent_requests <= 1:
+            for start, end, body in row_chunks(input_df,
+                                               self.max_request_size):
+                self._score_chunk(body, scores[start:end])
+        else:
+            # Bodies are submitted as slots free up, so at most
+            # max_concurrent_requests of them are held in memory.
+            pending = collections.deque()
+            for start, end, body in row_chunks(input_df,
+                                               self.max_request_size):
+                if len(pending) >= self.max_concurrent_requests:
+                    pending.popleft().result()
+                pending.append(self._get_pool().submit(
+                    self._score_chunk, body, scores[start:end]))
+            while pending:
+                pending.popleft().result()
 
+        return pd.DataFrame(scores, columns=self.prediction_columns or None)
+
+    async def _apredict(self, input_df):
         num_rows = input_df.shape[0]
         _logger.info('Invoking endpoint with {} rows'.format(num_rows))
-        results = []
-
-        def row_chunks():
-            # Split rows into chunks to keep size below MAX_REQUEST_SIZE.
-            rows = []
-            for idx in range(num_rows):
-                total_size = 0
-                df_slice = input_df.iloc[idx:idx+1]
-                csv_row = df_slice.to_csv(header=False, index=False)
-                if len(rows) > 0 and \
-                        total_size + len(csv_row) >= MAX_REQUEST_SIZE:
-                    yield rows
-                    rows = []
-                    total_size = 0
-                total_size += len(csv_row)
-                rows.append(csv_row)
-            if len(rows) > 0:
-                yield rows
-
-        for csv_rows in row_chunks():
+        scores = self._allocate_scores(num_rows)
+
+        pending = collections.deque()
+        try:
+            for start, end, body in row_chunks(input_df,
+                                               self.max_request_size):
+                if len(pending) >= self.max_concurrent_requests:
+                    await pending.popleft()
+                pending.append(asyncio.ensure_future(
+                    self._ascore_chunk(body, scores[start:end])))
+            while pending:
+                await pending.popleft()
+        finally:
+            for task in pending:
+                task.cancel()
+
+        return pd.DataFrame(scores, columns=self.prediction_columns or None)
+
+    async def aclose(self):
+        """Closes the connections opened by `apredict`."""
+        if self._aio_session is not None:
+            await self._aio_session.close()
+            self._aio_session = None
+
+    def _allocate_scores(self, num_rows):
+        # Responses are parsed straight into place, a value per row and
+        # output column.
+        num_outputs = max(len(self.prediction_columns), 1)
+        return np.empty((num_rows, num_outputs), dtype=np.float64)
+
+    def _get_pool(self):
+        with self.lock:
+            if self._pool is None:
+                self._pool = ThreadPoolExecutor(self.max_concurrent_requests)
+            return self._pool
+
+    def _score_chunk(self, body, out):
+        """Sends one request body and writes its scores into `out`, failing
+        as soon as the response holds more or fewer than expected."""
+        self._write_scores(self._invoke(body)['Body'], out)
+
+    async def _ascore_chunk(self, body, out):
+        self._write_scores(await self._ainvoke(body), out)
+
+    def _write_scores(self, response_body, out):
+        # Rows of the preallocated array are contiguous, so this is a view.
+        out = out.reshape(-1)
+        filled = 0
+        for values in self._parse_scores(response_body):
+            end = filled + len(values)
+            if end > len(out):
+                raise ValueError(f'Endpoint returned more than the '
+                                 f'{len(out)} scores expected')
+            out[filled:end] = values
+            filled = end
+        if filled != len(out):
+            raise ValueError(f'Endpoint returned {filled} scores, expected '
+                             f'{len(out)}')
+
+    def _invoke(self, body):
+        """Sends one request body and returns the response, retrying
+        throttled and failed requests."""
+        for attempt in range(self.max_retries + 1):
             self.refresh_client_if_required()
-            response = self.client.invoke_endpoint(
-                EndpointName=self.endpoint_name,
-                ContentType='text/csv',
-                Accept='application/json',
-                Body=''.join(csv_rows)
-            )
+            try:
+                return self.client.invoke_endpoint(
+                    EndpointName=self.endpoint_name,
+                    ContentType=CSV_CONTENT_TYPE,
+                    Accept=self.accept,
+                    Body=body
+                )
+            except (ClientError, ConnectionError, HTTPClientError) as e:
+                if attempt == self.max_retries or not self._is_retryable(e):
+                    raise
+                delay = self._retry_delay(attempt)
+                _logger.info(f'Retrying request in {delay:.2f}s: {e}')
+                time.sleep(delay)
+
+    async def _ainvoke(self, body):
+        """Async `_invoke`, returning the response body."""
+        for attempt in range(self.max_retries + 1):
+            if time.time() >= self.client_refresh_time:
+                # Fetching credentials blocks, so keep it off the loop.
+                await asyncio.get_running_loop().run_in_executor(
+                    None, self.refresh_client_if_required)
+            try:
+                return await self._apost(body)
+            except (ClientError, aiohttp.ClientConnectionError) as e:
+                if attempt == self.max_retries or not self._is_retryable(e):
+                    raise
+                delay = self._retry_delay(attempt)
+                _logger.info(f'Retrying request in {delay:.2f}s: {e}')
+                await asyncio.sleep(delay)
 
-            for line in response.get('Body').iter_lines():
-                # output format: {"predictions": [{"score": 2.043767929}]}
-                for predictions in json.loads(line).get('predictions'):
-                    results.append(predictions.get('score'))
+    async def _apost(self, body):
+        # Same request as invoke_endpoint, signed with the client's
+        # credentials and sent to the client's endpoint.
+        url = (f'{self.client.meta.endpoint_url}/endpoints/'
+               f'{quote(self.endpoint_name, safe="")}/invocations')
+        request = AWSRequest(method='POST', url=url, data=body,
+                             headers={'Content-Type': CSV_CONTENT_TYPE,
+                                      'Accept': self.accept})
+        SigV4Auth(self.credentials.get_frozen_credentials(), 'sagemaker',
+                  self.region_name).add_auth(request)
 
-        return pd.DataFrame(results, columns=self.prediction_columns)
+        async with self._get_aio_session().post(
+                url, data=body, headers=dict(request.headers)) as response:
+            data = await response.read()
+            if response.status != 200:
+                raise _client_error(response, data)
+        return StreamingBody(io.BytesIO(data), len(data))
+
+    def _get_aio_session(self):
+        loop = asyncio.get_running_loop()
+        if self._aio_session is None or self._aio_loop is not loop:
+            self._aio_loop = loop
+            self._aio_session = aiohttp.ClientSession(
+                connector=aiohttp.TCPConnector(
+                    limit=self._max_pool_connections()))
+        return self._aio_session
+
+    def _retry_delay(self, attempt):
+        # Jitter keeps concurrent chunks from retrying in lockstep.
+        return (self.retry_backoff_seconds * 2 ** attempt
+                * random.uniform(0.5, 1.5))
+
+    @staticmethod
+    def _is_retryable(error):
+        if not isinstance(error, ClientError):
+            return True  # Connection errors.
+        return (error.response['Error'].get('Code') in THROTTLING_ERROR_CODES
+                or error.response['ResponseMetadata'].get(
+                    'HTTPStatusCode', 0) >= 500)
 
     def refresh_client(self):
         _logger.info('Initializing sagemaker-runtime client')
@@ -98,25 +381,39 @@ class SageMakerRuntimeModel:
                 RoleSessionName='Fiddler'
             )['Credentials']
 
-            self.client = boto3.client(
-                'sagemaker-runtime',
+            session = boto3.Session(
                 region_name=self.region_name,
                 aws_access_key_id=tmp_credentials['AccessKeyId'],
                 aws_secret_access_key=tmp_credentials['SecretAccessKey'],
                 aws_session_token=tmp_credentials['SessionToken'])
+            self._set_client(session)
 
             # tmp_credentials expire in 1 hour. Refresh 5 minutes before that.
             expires_at = tmp_credentials['Expiration']
             _logger.info(f'temporary credentials expire at {expires_at}')
             self.client_refresh_time = expires_at.timestamp() - 300
         else:
-            self.client = boto3.client(
-                'sagemaker-runtime',
+            session = boto3.Session(
                 region_name=self.region_name,
                 aws_access_key_id=self.aws_access_key_id,
                 aws_secret_access_key=self.aws_secret_access_key)
+            self._set_client(session)
             self.client_refresh_time = float('inf')
 
+    def _set_client(self, session):
+        # Requests are retried by _invoke, so botocore doesn't retry them as
+        # well. The connection pool holds a connection per concurrent request.
+        config = Config(retries={'max_attempts': 0},
+                        max_pool_connections=self._max_pool_connections())
+        self.client = session.client('sagemaker-runtime',
+                                     endpoint_url=self.endpoint_url,
+                                     config=config)
+        # Also used to sign apredict's requests.
+        self.credentials = session.get_credentials()
+
+    def _max_pool_connections(self):
+        return max(self.max_concurrent_requests, 10)
+
     def refresh_client_if_required(self):
         if self.client_refresh_time < float('inf'):
             with self.lock:
@@ -124,6 +421,22 @@ class SageMakerRuntimeModel:
                     self.refresh_client()
 
 
+def _client_error(response, data):
+    """Builds the ClientError botocore raises for an error response."""
+    code = response.headers.get('x-amzn-ErrorType', '').split(':')[0]
+    message = data.decode(errors='replace')
+    try:
+        error = json.loads(data)
+        code = code or error.get('__type') or error.get('code', '')
+        message = error.get('message', error.get('Message', message))
+    except ValueError:
+        pass
+    return ClientError({'Error': {'Code': code, 'Message': message},
+                        'ResponseMetadata': {'HTTPStatusCode':
+                                             response.status}},
+                       'InvokeEndpoint')
+
+
 if __name__ == '__main__':  # Quick Test
     logging.basicConfig(level=logging.INFO,
                         format='%(asctime)s %(levelname)-7s: %(message)s')
@@ -0,0 +1,54 @@
+import numpy as np
+import pandas as pd
+import yaml
+
+
+class SchemaEncoder:
+    """Maps categorical model inputs to integer codes using the
+    `possible-values` declared for them in a model.yaml.
+
+    The yaml is read once. Columns that already arrive with the declared
+    categories are encoded from their existing codes; anything else (e.g.
+    strings) is looked up against the fixed categories without any dtype
+    inference. Missing and undeclared values get code -1.
+    """
+
+    def __init__(self, model_yaml_path):
+        with open(model_yaml_path) as f:
+            inputs = yaml.safe_load(f)['model']['inputs']
+        self.input_columns = [col['column-name'] for col in inputs]
+        self.categorical_dtypes = {
+            col['column-name']: pd.api.types.CategoricalDtype(
+                col['possible-values'])
+            for col in inputs if col['data-type'] == 'category'}
+        self.numeric_columns = [
+            col['column-name'] for col in inputs
+            if col['data-type'] in ('int', 'float')]
+
+    def categories(self, column):
+        return self.categorical_dtypes[column].categories
+
+    def codes(self, input_df, column):
+        """Returns the integer codes of `input_df[column]`, indexing into
+        `categories(column)`."""
+        values = input_df[column]
+        categories = self.categorical_dtypes[column].categories
+        if isinstance(values.dtype, pd.api.types.CategoricalDtype):
+            codes = np.asarray(values.cat.codes)
+            if values.cat.categories.equals(categories):
+                return codes
+            # Remap the column's own codes; -1 indexes the trailing -1.
+            remap = np.append(
+                categories.get_indexer(values.cat.categories), -1)
+            return remap[codes]
+        return categories.get_indexer(values)
+
+    def code_lookup(self, column, categories):
+        """Returns an array mapping this schema's codes for `column` to
+        positions in `categories` (e.g. a fitted encoder's categories), or
+        -1 where a declared value is not among them. Index it with codes
+        from `codes`; code -1 maps to the last entry, which is always -1."""
+        positions = {value: i for i, value in enumerate(categories)}
+        return np.array([positions.get(value, -1)
+                         for value in self.categories(column)] + [-1],
+                        dtype=np.intp)
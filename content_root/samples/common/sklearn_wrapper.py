@@ -1,7 +1,58 @@
+import multiprocessing
 import pickle
+import sys
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
 
+import joblib
+import numpy as np
 import pandas as pd
 
+from artifact_cache import acquire_artifact
+from artifact_cache import artifact_footprint
+from artifact_cache import release_artifact
+
+JOBLIB_SUFFIX = '.joblib'
+
+# Model used by process pool workers. It is set by the pool initializer,
+# which is inherited over fork, so the model is never pickled.
+_worker_model = None
+
+
+def _init_worker(model):
+    global _worker_model
+    _worker_model = model
+
+
+def _predict_in_worker(input_df):
+    return _worker_model.predict_chunk(input_df)
+
+
+def load_artifact(path, mmap_mode='r'):
+    """Loads a serialized model or transformer.
+
+    Files ending in '.joblib' are loaded with joblib, memory-mapping their
+    numpy arrays with `mmap_mode`, so processes serving the same artifact
+    share its pages and loading does not read the arrays up front. Anything
+    else is unpickled.
+    """
+    if Path(path).suffix == JOBLIB_SUFFIX:
+        return joblib.load(path, mmap_mode=mmap_mode)
+    with open(path, 'rb') as infile:
+        return pickle.load(infile)
+
+
+def convert_to_joblib(pickle_path, joblib_path=None):
+    """Re-saves a pickled artifact in the uncompressed joblib format that
+    `load_artifact` can memory-map, and returns the new path."""
+    if joblib_path is None:
+        joblib_path = Path(pickle_path).with_suffix(JOBLIB_SUFFIX)
+    with open(pickle_path, 'rb') as infile:
+        joblib.dump(pickle.load(infile), joblib_path)
+    return joblib_path
+
 
 class IdentityTransform:
     """Simple placeholder if no transformer is passed in."""
@@ -14,30 +65,156 @@ class SimpleSklearnModel:
     """Simple class to deserialize and run a sklearn model on json input."""
     def __init__(self, path_to_serialized_model, output_columns,
                  path_to_serialized_transformer=None, is_classifier=False,
-                 is_multiclass=False):
+                 is_multiclass=False, sparse_features=False, num_workers=1,
+                 min_chunk_size=10000, use_processes=False, mmap_mode='r'):
+        """
+        :param mmap_mode: Memory-map mode for model and transformer files
+            saved with joblib (see `load_artifact`). None loads them fully
+            into memory.
+        :param num_workers: Number of workers used to score large inputs.
+            Inputs are split into at most this many row chunks, each at least
+            `min_chunk_size` rows, which are transformed and scored
+            concurrently. The default of 1 scores everything in the calling
+            thread.
+        :param use_processes: Score chunks in forked worker processes instead
+            of threads. Workers inherit the loaded model over fork, so only
+            the input chunks and predictions are pickled.
+        """
         self.path_to_serialized_model = path_to_serialized_model
         self.path_to_serialized_transformer = path_to_serialized_transformer
         self.output_columns = output_columns
         self.is_cls = is_classifier
         self.is_multi = is_multiclass
-        with open(self.path_to_serialized_model, 'rb') as infile:
-            self.model = pickle.load(infile)
+        self.sparse_features = sparse_features
+        self.num_workers = num_workers
+        self.min_chunk_size = min_chunk_size
+        self.use_processes = use_processes
+        self.mmap_mode = mmap_mode
+        self._pool = None
+        # Guards creating and shutting down the pool.
+        self.lock = threading.Lock()
+        self.model = None
+        self.transformer = None
+        self.load_model()
+
+    def load_model(self):
+        """Loads the model and transformer. Called on construction, and again
+        to reload them after `unload_model`."""
+        if self.model is not None:
+            return
+        # Models and transformers are shared with other packages loading
+        # identical files in this process.
+        self.model = acquire_artifact(self.path_to_serialized_model,
+                                      load_artifact, mmap_mode=self.mmap_mode)
         if self.path_to_serialized_transformer is not None:
-            with open(self.path_to_serialized_transformer, 'rb') as infile:
-                self.transformer = pickle.load(infile)
+            self.transformer = acquire_artifact(
+                self.path_to_serialized_transformer, load_artifact,
+                mmap_mode=self.mmap_mode)
         else:
             self.transformer = IdentityTransform()
+        if (self.sparse_features
+                and not hasattr(self.transformer, 'transform_array')):
+            raise ValueError('sparse_features requires a transformer that '
+                             'implements transform_array')
 
-    def predict(self, input_df):
-        if self.is_cls:
-            if self.is_multi:
-                predict_fn = self.model.predict_proba
-            else:
-                def predict_fn(x):
-                    return self.model.predict_proba(x)[:, 1]
+        # Resolve the transform and predict functions once, so per-call
+        # overhead does not depend on the model type.
+        self._transform_fn = self._resolve_transform_fn()
+        self._predict_fn = self._resolve_predict_fn()
+
+    def unload_model(self):
+        """Shuts down the workers and releases the model and transformer."""
+        with self.lock:
+            pool, self._pool = self._pool, None
+        if pool is not None:
+            pool.shutdown()
+        if self.model is None:
+            return
+        release_artifact(self.model)
+        if self.path_to_serialized_transformer is not None:
+            release_artifact(self.transformer)
+        self.model = None
+        self.transformer = None
+        self._transform_fn = None
+        self._predict_fn = None
+
+    def memory_footprint(self):
+        """Returns the approximate resident bytes of the loaded model and
+        transformer."""
+        if self.model is None:
+            return 0
+        footprint = artifact_footprint(self.model)
+        if self.path_to_serialized_transformer is not None:
+            footprint += artifact_footprint(self.transformer)
+        return footprint
+
+    def _resolve_transform_fn(self):
+        # Transformers with a fixed output layout can skip building and
+        # aligning an intermediate DataFrame, and may hand the model a CSR
+        # matrix so memory scales with the number of nonzeros.
+        if not hasattr(self.transformer, 'transform_array'):
+            return self.transformer.transform
+        if self.sparse_features:
+            return self._transform_sparse
+        return self.transformer.transform_array
+
+    def _transform_sparse(self, input_df):
+        return self.transformer.transform_array(input_df, sparse=True)
+
+    def _resolve_predict_fn(self):
+        if not self.is_cls:
+            return self.model.predict
+        if self.is_multi:
+            return self.model.predict_proba
+        return self._predict_positive_proba
+
+    def _predict_positive_proba(self, features):
+        return self.model.predict_proba(features)[:, 1]
+
+    def transform(self, input_df):
+        return self._transform_fn(input_df)
+
+    def predict_chunk(self, input_df):
+        return self._predict_fn(self._transform_fn(input_df))
+
+    def predict_array(self, input_df):
+        """Same as `predict`, but returns the raw ndarray of predictions for
+        callers that don't need a DataFrame."""
+        num_chunks = min(self.num_workers,
+                         len(input_df) // max(self.min_chunk_size, 1))
+        if num_chunks <= 1:
+            return self.predict_chunk(input_df)
+
+        bounds = np.linspace(0, len(input_df), num_chunks + 1).astype(int)
+        chunks = [input_df.iloc[start:end]
+                  for start, end in zip(bounds[:-1], bounds[1:])]
+        if self.use_processes:
+            results = self._get_pool().map(_predict_in_worker, chunks)
         else:
-            predict_fn = self.model.predict
+            results = self._get_pool().map(self.predict_chunk, chunks)
+        return np.concatenate(list(results))
+
+    def _get_pool(self):
+        with self.lock:
+            if self._pool is None:
+                if self.use_processes:
+                    self._pool = ProcessPoolExecutor(
+                        self.num_workers,
+                        mp_context=multiprocessing.get_context('fork'),
+                        initializer=_init_worker, initargs=(self,))
+                else:
+                    self._pool = ThreadPoolExecutor(self.num_workers)
+            return self._pool
+
+    def predict(self, input_df):
+        return pd.DataFrame(self.predict_array(input_df),
+                            columns=self.output_columns)
+
 
-        return pd.DataFrame(
-            predict_fn(self.transformer.transform(input_df)),
-            columns=self.output_columns)
+if __name__ == '__main__':
+    # Convert pickled artifacts for memory-mapped loading:
+    #   python sklearn_wrapper.py model.pkl [more.pkl ...]
+    # Artifacts that unpickle classes from __main__ (e.g. the lending
+    # CustomFeatureTransformer) must be converted from their package instead.
+    for path in sys.argv[1:]:
+        print(convert_to_joblib(path))
@@ -0,0 +1,104 @@
+import importlib.util
+import pickle
+import sys
+from pathlib import Path
+
+import pytest
+
+# The executor puts the common directory on sys.path, and common modules
+# import each other as top-level modules.
+COMMON_DIR = str(Path(__file__).parents[1])
+if COMMON_DIR not in sys.path:
+    sys.path.insert(0, COMMON_DIR)
+
+from .stubs import OPENSCORING_PATH  # noqa: E402
+from .stubs import StubEndpoint  # noqa: E402
+from .stubs import StubOpenscoringServer  # noqa: E402
+from .stubs import write_model_yaml  # noqa: E402
+
+PMML_IRIS_DIR = (Path(__file__).parents[2] / 'iris_classification'
+                 / 'pmml_iris')
+
+
+@pytest.fixture
+def openscoring_server():
+    server = StubOpenscoringServer(delay=0.01)
+    yield server
+    server.close()
+
+
+@pytest.fixture
+def stub_endpoint():
+    """Returns a function that starts a StubEndpoint with the given
+    arguments. The endpoints are closed after the test."""
+    endpoints = []
+
+    def start(**kwargs):
+        endpoints.append(StubEndpoint(**kwargs))
+        return endpoints[-1]
+
+    yield start
+    for endpoint in endpoints:
+        endpoint.close()
+
+
+@pytest.fixture(scope='session')
+def pmml_iris_package():
+    spec = importlib.util.spec_from_file_location(
+        'pmml_iris_package', PMML_IRIS_DIR / 'package.py')
+    package = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(package)
+    return package
+
+
+@pytest.fixture
+def make_iris_model(tmp_path, pmml_iris_package):
+    """Returns a function that builds the pmml_iris package's model, scoring
+    on an openscoring server at `url`."""
+    def make(url, max_rows_per_request=10000, max_concurrent_requests=1,
+             **config):
+        path = write_model_yaml(tmp_path / 'model.yaml', openscoring=dict(
+            url=url + OPENSCORING_PATH,
+            read_timeout=5, max_rows_per_request=max_rows_per_request,
+            max_concurrent_requests=max_concurrent_requests, **config))
+        return pmml_iris_package.IrisPMMLModel(path)
+
+    return make
+
+
+@pytest.fixture
+def make_sagemaker_model(tmp_path):
+    """Returns a function that builds a SageMakerRuntimeModel with a `score`
+    output, scoring on `endpoint`."""
+    from ..sagemaker_runtime_model import SageMakerRuntimeModel
+
+    def make(endpoint, max_concurrent_requests=1, accept='application/json',
+             **config):
+        path = write_model_yaml(
+            tmp_path / 'model.yaml',
+            outputs=[{'column-name': 'score', 'data-type': 'float'}],
+            sagemaker_endpoint=dict(
+                endpoint_name='stub', region_name='us-west-2',
+                endpoint_url=endpoint.url, aws_access_key_id='key',
+                aws_secret_access_key='secret', max_request_size=200,
+                max_concurrent_requests=max_concurrent_requests,
+                accept=accept, max_retries=2, retry_backoff_seconds=0.01,
+                **config))
+        return SageMakerRuntimeModel(path)
+
+    return make
+
+
+@pytest.fixture
+def make_sklearn_model(tmp_path):
+    """Returns a function that pickles `model` and wraps it in a
+    SimpleSklearnModel."""
+    from ..sklearn_wrapper import SimpleSklearnModel
+
+    def make(model, output_columns, **kwargs):
+        model_path = tmp_path / 'model.pkl'
+        with open(model_path, 'wb') as outfile:
+            pickle.dump(model, outfile)
+        return SimpleSklearnModel(model_path, output_columns, **kwargs)
+
+    return make
@@ -0,0 +1,146 @@
+"""Local stand-ins for the services packages score on, shared by the tests
+and the benchmarks. This module only needs pandas and pyyaml, so the
+benchmarks can import it without pytest."""
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler
+from http.server import ThreadingHTTPServer
+from io import BytesIO
+
+import numpy as np
+import pandas as pd
+import yaml
+
+OPENSCORING_PATH = '/openscoring/model/DecisionTreeIris/csv'
+
+
+def write_model_yaml(path, **config):
+    """Writes a model.yaml with `config` as its model section to `path`,
+    and returns `path`."""
+    path.write_text(yaml.safe_dump({'model': config}))
+    return path
+
+
+class StubServer:
+    """Answers POST requests on a local port with `respond`, after `delay`
+    seconds. Counts the requests, the connections they came on, and how
+    many were in flight at once."""
+
+    def __init__(self, delay=0.0):
+        self.delay = delay
+        self.num_requests = 0
+        self.connections = set()
+        self.in_flight = 0
+        self.max_in_flight = 0
+        self.lock = threading.Lock()
+
+        stub = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = 'HTTP/1.1'  # Keep connections alive.
+            # Headers and body are written separately.
+            disable_nagle_algorithm = True
+
+            def do_POST(self):
+                body = self.rfile.read(int(self.headers['Content-Length']))
+                status, content_type, response = stub._handle(self, body)
+                self.send_response(status)
+                self.send_header('Content-Type', content_type)
+                self.send_header('Content-Length', str(len(response)))
+                self.end_headers()
+                self.wfile.write(response)
+
+            def log_message(self, *args):
+                pass
+
+        self.server = ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+        self.server.daemon_threads = True
+        self.url = f'http://127.0.0.1:{self.server.server_port}'
+        threading.Thread(target=self.server.serve_forever,
+                         kwargs={'poll_interval': 0.01}, daemon=True).start()
+
+    def _handle(self, request, body):
+        with self.lock:
+            self.num_requests += 1
+            self.connections.add(request.client_address)
+            self.in_flight += 1
+            self.max_in_flight = max(self.max_in_flight, self.in_flight)
+        try:
+            time.sleep(self.delay)
+            return self.respond(request, body)
+        finally:
+            with self.lock:
+                self.in_flight -= 1
+
+    def respond(self, request, body):
+        """Returns the status, content type and body of the response to
+        `request`."""
+        raise NotImplementedError
+
+    def close(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+
+class StubEndpoint(StubServer):
+    """Local stand-in for a SageMaker endpoint. Scores each CSV row with its
+    first value, and throttles the first `num_throttled` requests. Responses
+    are JSON lines or CSV, per the Accept header, and hold `extra_scores`
+    more scores than rows."""
+
+    def __init__(self, num_throttled=0, delay=0.0, extra_scores=0):
+        super().__init__(delay)
+        self.throttles_left = num_throttled
+        self.extra_scores = extra_scores
+        self.authorization = None
+
+    def respond(self, request, body):
+        accept = request.headers['Accept']
+        self.authorization = request.headers['Authorization']
+        with self.lock:
+            throttled = self.throttles_left > 0
+            self.throttles_left -= throttled
+        if throttled:
+            return 400, accept, json.dumps({
+                '__type': 'ThrottlingException',
+                'message': 'Slow down'}).encode()
+        scores = [line.split(b',')[0].decode() for line in body.splitlines()]
+        scores = scores + ['0.5'] * self.extra_scores
+        if self.extra_scores < 0:
+            scores = scores[:self.extra_scores]
+        if accept == 'text/csv':
+            return 200, accept, ''.join(
+                f'{score}\n' for score in scores).encode()
+        # Two lines, to check scores are collected across them.
+        return 200, accept, b'\n'.join(
+            json.dumps({'predictions': [{'score': float(score)}
+                                        for score in part]}).encode()
+            for part in (scores[:1], scores[1:]))
+
+
+def classify_by_petal_length(input_df):
+    """Splits rows like the root of DecisionTreeIris."""
+    is_setosa = input_df['Petal_Length'] < 2.45
+    return pd.DataFrame({
+        'Species': np.where(is_setosa, 'setosa', 'versicolor'),
+        'Node_Id': np.where(is_setosa, 2, 3),
+        'Probability_setosa': is_setosa.astype(float),
+        'Probability_versicolor': 1.0 - is_setosa,
+    })
+
+
+class StubOpenscoringServer(StubServer):
+    """Local stand-in for an openscoring server's CSV evaluation API, which
+    serves DecisionTreeIris at OPENSCORING_PATH. Like openscoring, it reads
+    the PMML field names, and scores them with `evaluate`."""
+
+    def __init__(self, evaluate=classify_by_petal_length, delay=0.0):
+        super().__init__(delay)
+        self.evaluate = evaluate
+
+    def respond(self, request, body):
+        if request.path != OPENSCORING_PATH:
+            return 404, 'text/plain', b''
+        result = self.evaluate(pd.read_csv(BytesIO(body)))
+        return 200, 'text/plain', result.to_csv(index=False).encode()
@@ -0,0 +1,168 @@
+import os
+import pickle
+import threading
+
+import numpy as np
+import pytest
+from .. import artifact_cache
+from ..artifact_cache import ArtifactCache
+from ..artifact_cache import resident_bytes
+
+
+def write_pickle(path, value):
+    with open(path, 'wb') as outfile:
+        pickle.dump(value, outfile)
+    return path
+
+
+def test_identical_files_are_loaded_once(tmp_path):
+    cache = ArtifactCache()
+    first = cache.acquire(write_pickle(tmp_path / 'a.pkl', {'x': 1}))
+    second = cache.acquire(write_pickle(tmp_path / 'b.pkl', {'x': 1}))
+    other = cache.acquire(write_pickle(tmp_path / 'c.pkl', {'x': 2}))
+
+    assert first is second
+    assert other is not first
+    assert len(cache) == 2
+
+
+def test_files_are_only_hashed_to_find_identical_copies(tmp_path,
+                                                        monkeypatch):
+    hashed = []
+    hash_path = artifact_cache._hash_path
+    monkeypatch.setattr(artifact_cache, '_hash_path',
+                        lambda path: hashed.append(path.name) or
+                        hash_path(path))
+    cache = ArtifactCache()
+
+    cache.acquire(write_pickle(tmp_path / 'a.pkl', list(range(10))))
+    cache.acquire(write_pickle(tmp_path / 'b.pkl', list(range(1000))))
+    cache.acquire(tmp_path / 'a.pkl')
+    assert hashed == []
+
+    # Only a file the size of a loaded one is compared with it by content.
+    copy = cache.acquire(write_pickle(tmp_path / 'c.pkl', list(range(10))))
+    assert sorted(hashed) == ['a.pkl', 'c.pkl']
+    assert copy is cache.acquire(tmp_path / 'a.pkl')
+    assert len(cache) == 2
+
+
+def test_directory_changes_in_subdirectories_are_detected(tmp_path):
+    model_dir = tmp_path / 'saved_model'
+    (model_dir / 'variables').mkdir(parents=True)
+    variables = model_dir / 'variables' / 'variables.data'
+    variables.write_bytes(b'1')
+    cache = ArtifactCache()
+
+    def loader(p):
+        return (p / 'variables' / 'variables.data').read_bytes()
+
+    assert cache.acquire(model_dir, loader) == b'1'
+    variables.write_bytes(b'2')
+    # Editing a file keeps its size and its directories' mtimes. Its own
+    # mtime is moved forward in case the filesystem's clock is coarse.
+    os.utime(variables, ns=(os.stat(model_dir).st_mtime_ns + 10 ** 9,) * 2)
+
+    assert cache.acquire(model_dir, loader) == b'2'
+
+
+def test_loads_do_not_block_other_artifacts(tmp_path):
+    cache = ArtifactCache()
+    slow_path = write_pickle(tmp_path / 'slow.pkl', 'slow')
+    fast_path = write_pickle(tmp_path / 'fast.pkl', ['fast'])
+    loading = threading.Event()
+    finish = threading.Event()
+    loads = []
+
+    def slow_loader(p):
+        loads.append(p)
+        loading.set()
+        assert finish.wait(5)
+        return artifact_cache.load_pickle(p)
+
+    results = []
+    threads = [threading.Thread(
+        target=lambda: results.append(cache.acquire(slow_path, slow_loader)))
+        for _ in range(2)]
+    threads[0].start()
+    assert loading.wait(5)
+    threads[1].start()
+    # Loading another artifact doesn't wait for the slow load.
+    assert cache.acquire(fast_path) == ['fast']
+    finish.set()
+    for thread in threads:
+        thread.join()
+
+    assert results == ['slow', 'slow'] and len(loads) == 1
+
+
+def test_failed_loads_are_retried(tmp_path):
+    cache = ArtifactCache()
+    path = write_pickle(tmp_path / 'a.pkl', 1)
+    calls = []
+
+    def flaky_loader(p):
+        calls.append(p)
+        if len(calls) == 1:
+            raise IOError('transient')
+        return artifact_cache.load_pickle(p)
+
+    with pytest.raises(IOError):
+        cache.acquire(path, flaky_loader)
+    assert cache.acquire(path, flaky_loader) == 1
+    assert len(cache) == 1
+
+
+def test_loader_arguments_are_part_of_the_key(tmp_path):
+    cache = ArtifactCache()
+    path = write_pickle(tmp_path / 'a.pkl', [1, 2])
+
+    def loader(p, scale):
+        with open(p, 'rb') as infile:
+            return [v * scale for v in pickle.load(infile)]
+
+    assert cache.acquire(path, loader, scale=1) == [1, 2]
+    assert cache.acquire(path, loader, scale=2) == [2, 4]
+    assert len(cache) == 2
+
+
+def test_unreferenced_artifacts_are_evicted_lru(tmp_path):
+    evicted = []
+    cache = ArtifactCache(max_unused=1)
+    values = [cache.acquire(write_pickle(tmp_path / f'{i}.pkl', [i]),
+                            on_evict=evicted.append)
+              for i in range(3)]
+
+    cache.release(values[0])
+    cache.release(values[2])
+    # values[0] is the least recently used of the two unused artifacts.
+    assert evicted == [[0]]
+
+    # Referenced artifacts are kept, released ones can be reused.
+    assert cache.acquire(tmp_path / '2.pkl') is values[2]
+    cache.clear()
+    assert evicted == [[0]]
+    assert len(cache) == 2
+
+    cache.release(values[1])
+    cache.release(values[2])
+    cache.clear()
+    assert len(cache) == 0
+
+    with pytest.raises(ValueError):
+        cache.release(values[1])
+
+
+@pytest.mark.skipif(resident_bytes() is None,
+                    reason='resident size is not available')
+def test_footprint_is_resident_growth_while_loading(tmp_path):
+    cache = ArtifactCache()
+    path = write_pickle(tmp_path / 'a.pkl', None)
+
+    def loader(p):
+        return np.ones(64 * 1024 * 1024, dtype=np.uint8)
+
+    value = cache.acquire(path, loader)
+
+    assert 60 * 1024 * 1024 < cache.footprint(value) < 128 * 1024 * 1024
+    assert cache.footprint(object()) == 0
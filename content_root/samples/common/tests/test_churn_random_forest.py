@@ -0,0 +1,115 @@
+import importlib.util
+import pickle
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+import pytest
+from sklearn.compose import ColumnTransformer
+from sklearn.ensemble import RandomForestClassifier
+from sklearn.impute import SimpleImputer
+from sklearn.pipeline import Pipeline
+from sklearn.preprocessing import OneHotEncoder
+
+PACKAGE_DIR = Path(__file__).parents[2] / 'bank_churn' / 'bank_churn'
+MODEL_YAML = PACKAGE_DIR / 'model.yaml'
+
+NUMERIC_COLUMNS = ['CreditScore', 'Age', 'Tenure', 'Balance',
+                   'NumOfProducts', 'EstimatedSalary']
+CATEGORIES = {'Geography': ['France', 'Germany', 'Spain'],
+              'Gender': ['Female', 'Male'],
+              'HasCrCard': ['Yes', 'No'],
+              'IsActiveMember': ['Yes', 'No']}
+
+
+@pytest.fixture(scope='module')
+def churn_module():
+    spec = importlib.util.spec_from_file_location(
+        'churn_random_forest', PACKAGE_DIR / 'churn_random_forest.py')
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+def make_inputs(num_rows, seed):
+    rng = np.random.RandomState(seed)
+    df = pd.DataFrame(rng.normal(size=(num_rows, len(NUMERIC_COLUMNS))),
+                      columns=NUMERIC_COLUMNS)
+    for column, values in CATEGORIES.items():
+        df[column] = rng.choice(values, num_rows).astype(object)
+    return df
+
+
+@pytest.fixture(scope='module')
+def pipeline_dir(tmp_path_factory):
+    train_df = make_inputs(400, seed=0)
+    # Spain is declared in model.yaml but never seen by the encoder.
+    train_df.loc[train_df['Geography'] == 'Spain', 'Geography'] = 'France'
+    train_df.loc[::7, 'Balance'] = np.nan
+    labels = ((train_df['Age'] > 0) ^ (train_df['Gender'] == 'Male')
+              ^ (train_df['Geography'] == 'Germany'))
+    pipeline = Pipeline([
+        ('preprocess', ColumnTransformer([
+            ('numeric', Pipeline([('impute', SimpleImputer(
+                strategy='median'))]), NUMERIC_COLUMNS),
+            ('categorical', Pipeline([('one_hot', OneHotEncoder(
+                handle_unknown='ignore'))]), list(CATEGORIES)),
+        ])),
+        ('forest', RandomForestClassifier(n_estimators=20, max_depth=6,
+                                          random_state=0)),
+    ]).fit(train_df, labels)
+    model_dir = tmp_path_factory.mktemp('bank_churn')
+    with open(model_dir / 'model.pkl', 'wb') as outfile:
+        pickle.dump(pipeline, outfile)
+    return model_dir
+
+
+def test_compiled_schema_path_matches_pipeline(churn_module, pipeline_dir):
+    with open(pipeline_dir / 'model.pkl', 'rb') as infile:
+        pipeline = pickle.load(infile)
+    predictor = churn_module.RFPredictor(
+        str(pipeline_dir), output_column=['probability_churned'],
+        compiled=True, compiled_max_rows=1000, model_yaml=MODEL_YAML)
+    input_df = make_inputs(200, seed=1)
+    input_df.loc[::5, 'Balance'] = np.nan
+    input_df.loc[::9, 'Age'] = np.nan
+    input_df.loc[::11, 'Geography'] = 'Italy'
+    input_df.loc[::13, 'Geography'] = 'Spain'
+    expected = pipeline.predict_proba(input_df)
+
+    assert isinstance(predictor.preprocessor,
+                      churn_module.SchemaPreprocessor)
+    np.testing.assert_allclose(
+        predictor.preprocessor.transform(input_df),
+        pipeline.steps[0][1].transform(input_df))
+    np.testing.assert_allclose(predictor.predict_proba(input_df), expected)
+    result = predictor.predict(input_df)
+    np.testing.assert_allclose(result['probability_churned'],
+                               expected[:, 0])
+    # Categorical dtypes, in another category order and with unknown
+    # levels, encode like the strings.
+    categorical_df = input_df.copy()
+    for column, values in CATEGORIES.items():
+        categorical_df[column] = pd.Categorical(
+            input_df[column], categories=list(reversed(values)) + ['Italy'])
+    np.testing.assert_allclose(predictor.predict_proba(categorical_df),
+                               expected)
+    schema_df = input_df[input_df['Geography'] != 'Italy'].copy()
+    for column, values in CATEGORIES.items():
+        schema_df[column] = pd.Categorical(schema_df[column],
+                                           categories=values)
+    np.testing.assert_allclose(predictor.predict_proba(schema_df),
+                               expected[input_df['Geography'] != 'Italy'])
+
+
+def test_large_batches_match_pipeline(churn_module, pipeline_dir):
+    with open(pipeline_dir / 'model.pkl', 'rb') as infile:
+        pipeline = pickle.load(infile)
+    predictor = churn_module.RFPredictor(
+        str(pipeline_dir), compiled=True, compiled_max_rows=10,
+        model_yaml=MODEL_YAML)
+    input_df = make_inputs(50, seed=2)
+
+    for batch in (input_df[:10], input_df):
+        np.testing.assert_allclose(predictor.predict_proba(batch),
+                                   pipeline.predict_proba(batch))
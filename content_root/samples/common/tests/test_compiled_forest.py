@@ -0,0 +1,31 @@
+import numpy as np
+import pytest
+from sklearn.ensemble import ExtraTreesRegressor
+from sklearn.ensemble import RandomForestClassifier
+from ..compiled_forest import CompiledForest
+
+rng = np.random.RandomState(0)
+X = rng.normal(size=(300, 5))
+y = (X[:, 0] + X[:, 1] * X[:, 2] > 0).astype(int) + (X[:, 3] > 1)
+
+
+@pytest.mark.parametrize('num_rows', [1, 100, 300])
+def test_classifier_matches_predict_proba(num_rows):
+    forest = RandomForestClassifier(n_estimators=20, max_depth=6,
+                                    random_state=0).fit(X, y)
+    compiled = CompiledForest(forest)
+
+    assert np.allclose(compiled.predict_proba(X[:num_rows]),
+                       forest.predict_proba(X[:num_rows]))
+    assert np.array_equal(compiled.predict(X[:num_rows]),
+                          forest.predict(X[:num_rows]))
+
+
+def test_unbounded_regressor_matches_predict():
+    forest = ExtraTreesRegressor(n_estimators=10, random_state=0).fit(
+        X, X[:, 0] * 2 + y)
+    compiled = CompiledForest(forest)
+
+    assert np.allclose(compiled.predict(X), forest.predict(X))
+    with pytest.raises(AttributeError):
+        compiled.predict_proba(X)
@@ -0,0 +1,234 @@
+import importlib.util
+import pickle
+import sys
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+import pytest
+import scipy.sparse
+import sklearn.preprocessing
+from sklearn.linear_model import LogisticRegression
+
+from ..sklearn_wrapper import SimpleSklearnModel
+
+LENDING_DIR = Path(__file__).parents[2] / 'lending'
+# Each lending package ships its own copy of the transformer.
+TRANSFORMER_PATHS = [
+    LENDING_DIR / package / 'shared_assets' / 'cutsom_feature_transformer.py'
+    for package in ('logreg-all', 'logreg-simple')]
+
+GRADES = ['A', 'B', 'C']
+STATES = ['CA', 'NY', 'TX', 'WY']
+
+
+@pytest.fixture(scope='module', params=TRANSFORMER_PATHS,
+                ids=lambda path: path.parts[-3])
+def transformer_module(request):
+    spec = importlib.util.spec_from_file_location(
+        f'cutsom_feature_transformer_{request.param.parts[-3]}',
+        request.param)
+    module = importlib.util.module_from_spec(spec)
+    # Registered so fitted transformers can be pickled.
+    sys.modules[spec.name] = module
+    spec.loader.exec_module(module)
+    return module
+
+
+def make_frame(num_rows, seed=0):
+    rng = np.random.RandomState(seed)
+    mostly_zero = rng.normal(size=num_rows)
+    mostly_zero[rng.uniform(size=num_rows) < 0.9] = 0
+    with_missing = rng.normal(loc=5, size=num_rows)
+    with_missing[rng.uniform(size=num_rows) < 0.1] = np.nan
+    # WY is rare enough to be trimmed.
+    states = rng.choice(STATES, num_rows, p=[0.45, 0.3, 0.24, 0.01])
+    return pd.DataFrame({
+        'revol_bal': mostly_zero,
+        'annual_inc': with_missing,
+        'term': rng.randint(1, 5, num_rows),
+        'grade': pd.Categorical(rng.choice(GRADES, num_rows),
+                                categories=GRADES),
+        'addr_state': pd.Categorical(states, categories=STATES),
+    })
+
+
+def fit_transformer(module, df, **kwargs):
+    transformer = module.CustomFeatureTransformer(**kwargs)
+    transformer.fit(df)
+    return transformer
+
+
+def test_layout_is_fixed_at_fit_time(transformer_module):
+    train_df = make_frame(500)
+    transformer = fit_transformer(transformer_module, train_df)
+    batch = make_frame(20, seed=1)
+    expected = transformer.transform(batch)
+
+    assert list(expected.columns) == transformer.output_cols_in_order
+    # Fewer levels, in another order, or as plain strings, give the same
+    # columns and values.
+    for grade in (pd.Categorical(batch['grade'], categories=['C', 'A', 'B']),
+                  batch['grade'].astype(str),
+                  batch['grade'].astype(object)):
+        result = transformer.transform(batch.assign(grade=grade))
+        assert list(result.columns) == transformer.output_cols_in_order
+        np.testing.assert_array_equal(result.values, expected.values)
+    only_a = batch[batch['grade'] == 'A'].copy()
+    only_a['grade'] = pd.Categorical(['A'] * len(only_a))
+    np.testing.assert_array_equal(transformer.transform_array(only_a),
+                                  expected[batch['grade'] == 'A'].values)
+    # A row's encoding does not depend on the rest of its batch.
+    np.testing.assert_array_equal(transformer.transform_array(batch[3:4]),
+                                  expected.values[3:4])
+
+
+def test_unseen_and_missing_levels_encode_as_zeros(transformer_module):
+    transformer = fit_transformer(transformer_module, make_frame(500))
+    batch = make_frame(3, seed=1)
+    batch['grade'] = pd.Series(['A', 'Z', None], dtype=object)
+
+    result = transformer.transform(batch)
+
+    grade_columns = [f'grade_{grade}' for grade in GRADES]
+    assert result[grade_columns].values.tolist() == [
+        [1, 0, 0], [0, 0, 0], [0, 0, 0]]
+
+
+@pytest.mark.parametrize('kwargs', [
+    {},
+    {'missing': 'impute', 'missing_drop_threshold': 0.05},
+    {'binarize_threshold': 0.5, 'categorical_trim': {'addr_state': 0.05}},
+])
+def test_matches_frame_transform(transformer_module, kwargs):
+    transformer = fit_transformer(transformer_module, make_frame(500),
+                                  **kwargs)
+    batch = make_frame(100, seed=1)
+
+    result = transformer.transform_array(batch)
+    expected = transformer._transform_frame(batch)
+
+    assert list(expected.columns) == transformer.output_cols_in_order
+    np.testing.assert_allclose(result, expected.to_numpy(dtype=float))
+    if 'categorical_trim' in kwargs:
+        assert 'addr_state_WY' not in transformer.output_cols_in_order
+        assert 'nonzero_revol_bal' in transformer.output_cols_in_order
+        assert transformer.categorical_levels['addr_state'] == STATES[:3]
+
+
+def test_sparse_output_matches_dense(transformer_module):
+    transformer = fit_transformer(transformer_module, make_frame(500),
+                                  binarize_threshold=0.5)
+    batch = make_frame(100, seed=1)
+
+    result = transformer.transform_array(batch, sparse=True)
+
+    assert isinstance(result, scipy.sparse.csr_matrix)
+    np.testing.assert_array_equal(result.toarray(),
+                                  transformer.transform_array(batch))
+    # Only the one-hot entries that are set are stored.
+    num_dense = len(transformer.binarized_fields +
+                    transformer.continuous_cols_in_order)
+    assert result[:, num_dense:].nnz == 2 * len(batch)
+
+
+def test_sparse_output_of_legacy_transformer_warns(transformer_module):
+    transformer = fit_transformer(transformer_module, make_frame(500))
+    batch = make_frame(100, seed=1)
+    expected = transformer.transform_array(batch)
+    state = dict(transformer.__dict__)
+    for attr in ('categorical_levels', 'output_cols_in_order', '_layout',
+                 '_fit_stats'):
+        del state[attr]
+    legacy = transformer_module.CustomFeatureTransformer.__new__(
+        transformer_module.CustomFeatureTransformer)
+    legacy.__setstate__(state)
+
+    with pytest.warns(RuntimeWarning):
+        result = legacy.transform_array(batch, sparse=True)
+
+    assert isinstance(result, scipy.sparse.csr_matrix)
+    np.testing.assert_array_equal(result.toarray(), expected)
+
+
+def test_sklearn_model_scores_sparse_features(transformer_module, tmp_path):
+    train_df = make_frame(500)
+    transformer = fit_transformer(transformer_module, train_df)
+    labels = train_df['grade'] == 'A'
+    sk_model = LogisticRegression(solver='lbfgs').fit(
+        transformer.transform_array(train_df), labels)
+    paths = {'model': tmp_path / 'model.pkl',
+             'transformer': tmp_path / 'transformer.pkl'}
+    for name, artifact in [('model', sk_model), ('transformer', transformer)]:
+        with open(paths[name], 'wb') as outfile:
+            pickle.dump(artifact, outfile)
+    batch = make_frame(100, seed=1)
+
+    dense = SimpleSklearnModel(
+        paths['model'], ['p'], path_to_serialized_transformer=(
+            paths['transformer']), is_classifier=True)
+    sparse = SimpleSklearnModel(
+        paths['model'], ['p'], path_to_serialized_transformer=(
+            paths['transformer']), is_classifier=True, sparse_features=True)
+
+    assert scipy.sparse.issparse(sparse.transform(batch))
+    np.testing.assert_allclose(sparse.predict_array(batch),
+                               dense.predict_array(batch))
+
+
+@pytest.mark.parametrize('kwargs', [
+    {},
+    {'missing': 'impute', 'missing_drop_threshold': 0.05},
+    {'binarize_threshold': 0.5, 'categorical_trim': {'addr_state': 0.05}},
+])
+def test_fit_csv_in_chunks_matches_fit(transformer_module, tmp_path, kwargs):
+    train_df = make_frame(500)
+    csv_path = tmp_path / 'train.csv'
+    train_df.to_csv(csv_path, index=False)
+    fitted = fit_transformer(transformer_module, train_df, **kwargs)
+
+    chunked = transformer_module.CustomFeatureTransformer(**kwargs)
+    chunked.fit_csv(csv_path, categorical_columns=['grade', 'addr_state'],
+                    chunksize=60)
+
+    assert chunked._fit_stats is None and fitted._fit_stats is None
+    assert chunked.binarized_fields == fitted.binarized_fields
+    assert (chunked.continuous_cols_in_order
+            == fitted.continuous_cols_in_order)
+    assert chunked.output_cols_in_order == fitted.output_cols_in_order
+    assert ({name: sorted(levels)
+             for name, levels in chunked.categorical_levels.items()}
+            == {name: sorted(levels)
+                for name, levels in fitted.categorical_levels.items()})
+    # The scaler only covers the columns that are scaled, with the moments
+    # of a scaler fit on them alone.
+    expected_scaler = sklearn.preprocessing.StandardScaler().fit(
+        train_df[fitted.continuous_cols_in_order])
+    for scaler in (fitted.scaler, chunked.scaler):
+        np.testing.assert_allclose(scaler.mean_, expected_scaler.mean_)
+        np.testing.assert_allclose(scaler.scale_, expected_scaler.scale_)
+    batch = make_frame(100, seed=1)
+    np.testing.assert_allclose(chunked.transform_array(batch),
+                               fitted.transform_array(batch))
+    if kwargs.get('missing') == 'impute':
+        assert 'annual_inc' not in fitted.continuous_cols_in_order
+    if 'binarize_threshold' in kwargs:
+        assert fitted.binarized_fields == ['revol_bal']
+        assert 'addr_state_WY' not in fitted.output_cols_in_order
+
+
+def test_partial_fit_rejects_mismatched_chunks(transformer_module):
+    transformer = transformer_module.CustomFeatureTransformer()
+    train_df = make_frame(100)
+    transformer.partial_fit(train_df)
+
+    with pytest.raises(ValueError):
+        transformer.partial_fit(train_df.drop(columns=['term']))
+    with pytest.raises(Exception, match='Must fit first'):
+        transformer.transform_array(train_df)
+
+    # A partial_fit after finalize_fit starts a new fit.
+    transformer.finalize_fit()
+    transformer.partial_fit(train_df.drop(columns=['term']))
+    transformer.finalize_fit()
+    assert 'term' not in transformer.continuous_cols_in_order
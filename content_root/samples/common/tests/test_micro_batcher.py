@@ -0,0 +1,136 @@
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import pandas as pd
+import pytest
+
+from ..micro_batcher import Histogram
+from ..micro_batcher import MicroBatcher
+
+
+class RecordingModel:
+    def __init__(self, delay=0.0):
+        self.batch_sizes = []
+        self.delay = delay
+        self.lock = threading.Lock()
+
+    def predict(self, input_df):
+        with self.lock:
+            self.batch_sizes.append(len(input_df))
+        if (input_df['x'] < 0).any():
+            raise ValueError('negative input')
+        threading.Event().wait(self.delay)
+        return pd.DataFrame({'y': input_df['x'] * 2})
+
+
+def predict_concurrently(batcher, inputs):
+    with ThreadPoolExecutor(len(inputs)) as pool:
+        return list(pool.map(batcher.predict, inputs))
+
+
+def test_concurrent_requests_are_batched():
+    model = RecordingModel(delay=0.01)
+    batcher = MicroBatcher(model, max_delay_ms=50, max_batch_rows=8)
+    inputs = [pd.DataFrame({'x': [float(i), i + 0.5]}) for i in range(16)]
+
+    results = predict_concurrently(batcher, inputs)
+    batcher.close()
+
+    for input_df, result in zip(inputs, results):
+        assert list(result['y']) == list(input_df['x'] * 2)
+        assert list(result.index) == [0, 1]
+    assert sum(model.batch_sizes) == 32
+    assert max(model.batch_sizes) <= 8
+    assert len(model.batch_sizes) < 16
+    stats = batcher.stats()
+    assert stats['request_latency']['count'] == 16
+    assert stats['batch_rows']['count'] == len(model.batch_sizes)
+
+
+def test_lone_request_waits_at_most_max_delay():
+    model = RecordingModel()
+    batcher = MicroBatcher(model, max_delay_ms=20, max_batch_rows=100)
+
+    result = batcher.predict(pd.DataFrame({'x': [1.0]}))
+    batcher.close()
+
+    assert list(result['y']) == [2.0]
+    assert model.batch_sizes == [1]
+    assert 0.015 < batcher.request_latency.max < 0.5
+
+
+def test_failed_batch_is_retried_one_request_at_a_time():
+    model = RecordingModel(delay=0.01)
+    batcher = MicroBatcher(model, max_delay_ms=50, max_batch_rows=100)
+    inputs = [pd.DataFrame({'x': [1.0]}), pd.DataFrame({'x': [-1.0]}),
+              pd.DataFrame({'x': [2.0]})]
+
+    with ThreadPoolExecutor(3) as pool:
+        futures = [pool.submit(batcher.predict, df) for df in inputs]
+        errors = [future.exception() for future in futures]
+    batcher.close()
+
+    # Only the request with a negative input fails, batched or not.
+    assert errors[0] is None and errors[2] is None
+    assert isinstance(errors[1], ValueError)
+    assert list(futures[2].result()['y']) == [4.0]
+    if max(model.batch_sizes) > 1:
+        # The batch, then each of its requests alone.
+        assert model.batch_sizes.count(1) >= 2
+    with pytest.raises(RuntimeError):
+        batcher.predict(inputs[0])
+
+
+def test_only_requests_with_the_same_layout_are_batched():
+    model = RecordingModel(delay=0.01)
+    batcher = MicroBatcher(model, max_delay_ms=50, max_batch_rows=100)
+    inputs = [pd.DataFrame({'x': [1.0]}),
+              pd.DataFrame({'x': [2.0], 'z': [0.0]}),
+              pd.DataFrame({'x': [3]}),
+              pd.DataFrame({'x': [4.0]})]
+
+    results = predict_concurrently(batcher, inputs)
+    batcher.close()
+
+    for input_df, result in zip(inputs, results):
+        assert list(result['y']) == list(input_df['x'] * 2)
+    assert sum(model.batch_sizes) == 4
+    assert len(model.batch_sizes) >= 3
+
+
+def test_close_while_predicting():
+    batcher = MicroBatcher(RecordingModel(), max_delay_ms=1)
+    outcomes = []
+
+    def predict():
+        for _ in range(200):
+            try:
+                batcher.predict(pd.DataFrame({'x': [1.0]}))
+                outcomes.append('ok')
+            except RuntimeError:
+                outcomes.append('closed')
+                return
+
+    threads = [threading.Thread(target=predict) for _ in range(4)]
+    for thread in threads:
+        thread.start()
+    threading.Event().wait(0.01)
+    batcher.close()
+    for thread in threads:
+        # Every request queued before close is answered.
+        thread.join(5)
+        assert not thread.is_alive()
+    batcher.close()
+
+    assert 'ok' in outcomes
+
+
+def test_histogram_percentiles():
+    histogram = Histogram()
+    for value in [0.001] * 90 + [0.1] * 10:
+        histogram.record(value)
+
+    assert histogram.percentile(50) == pytest.approx(0.001)
+    assert histogram.percentile(99) == pytest.approx(0.1)
+    assert histogram.mean() == pytest.approx(0.0109)
+    assert histogram.stats()['max'] == 0.1
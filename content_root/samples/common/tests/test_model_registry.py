@@ -0,0 +1,240 @@
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from ..artifact_cache import resident_bytes
+from ..model_registry import ModelHost
+from ..model_registry import ModelRegistry
+
+
+class FakeModel:
+    def __init__(self, name, footprint, events):
+        self.name = name
+        self.footprint = footprint
+        self.events = events
+        self.loaded = False
+
+    def load_model(self):
+        self.loaded = True
+        self.events.append(('load', self.name))
+
+    def unload_model(self):
+        self.loaded = False
+        self.events.append(('unload', self.name))
+
+    def memory_footprint(self):
+        return self.footprint if self.loaded else 0
+
+
+@pytest.fixture
+def events():
+    return []
+
+
+def factory(name, footprint, events):
+    return lambda: FakeModel(name, footprint, events)
+
+
+def test_least_recently_used_models_are_unloaded(events):
+    registry = ModelRegistry(memory_budget_bytes=100)
+
+    a = registry.get('a', factory('a', 40, events))
+    registry.get('b', factory('b', 40, events))
+    assert registry.get('a', factory('a', 40, events)) is a
+    registry.get('c', factory('c', 40, events))
+
+    # b was used least recently.
+    assert events == [('load', 'a'), ('load', 'b'), ('load', 'c'),
+                      ('unload', 'b')]
+    assert 'b' not in registry and 'a' in registry
+    assert registry.memory_footprint() == 80
+    assert (registry.hits, registry.misses, registry.evictions) == (1, 3, 1)
+
+    # Reloaded on demand.
+    b = registry.get('b', factory('b', 40, events))
+    assert b.loaded and not a.loaded
+    assert registry.evictions == 2
+
+
+def test_requested_model_is_kept_over_budget(events):
+    registry = ModelRegistry(memory_budget_bytes=100)
+    registry.get('a', factory('a', 10, events))
+
+    big = registry.get('big', factory('big', 500, events))
+
+    assert big.loaded
+    assert list(registry._models) == ['big']
+
+
+def test_models_without_lifecycle_methods(events):
+    registry = ModelRegistry(memory_budget_bytes=100)
+
+    plain = registry.get('plain', object)
+    registry.get('a', factory('a', 150, events))
+
+    assert 'plain' not in registry
+    assert registry.get('plain', object) is not plain
+
+
+def test_unload_and_clear(events):
+    registry = ModelRegistry(memory_budget_bytes=100)
+    a = registry.get('a', factory('a', 10, events))
+    b = registry.get('b', factory('b', 10, events))
+
+    registry.unload('a')
+    registry.unload('missing')
+    assert not a.loaded and b.loaded and len(registry) == 1
+
+    registry.clear()
+    assert not b.loaded and len(registry) == 0
+
+
+def test_models_in_use_are_unloaded_once_released(events):
+    registry = ModelRegistry(memory_budget_bytes=100)
+
+    with registry.use('a', factory('a', 60, events)) as a:
+        registry.get('b', factory('b', 60, events))
+        assert a.loaded and 'a' in registry
+        with registry.use('c', factory('c', 60, events)):
+            # b is not in use, so it makes room for c.
+            assert events[-1] == ('unload', 'b')
+            registry.unload('c')
+            assert 'c' not in registry and events[-1] == ('unload', 'b')
+        assert events[-1] == ('unload', 'c')
+        assert a.loaded
+
+    # Released while still over budget.
+    registry.get('d', factory('d', 60, events))
+    assert not a.loaded
+    assert [name for _, name in events] == [
+        'a', 'b', 'c', 'b', 'c', 'd', 'a']
+
+
+def test_loads_do_not_block_loaded_models(events):
+    registry = ModelRegistry(memory_budget_bytes=1000)
+    fast = registry.get('fast', factory('fast', 10, events))
+    loading = threading.Event()
+    resume = threading.Event()
+    created = []
+
+    def slow_factory():
+        created.append(1)
+        loading.set()
+        resume.wait(5)
+        return FakeModel('slow', 10, events)
+
+    with ThreadPoolExecutor(2) as pool:
+        futures = [pool.submit(registry.get, 'slow', slow_factory)
+                   for _ in range(2)]
+        assert loading.wait(5)
+        # Served while slow is loading.
+        assert registry.get('fast', factory('fast', 10, events)) is fast
+        resume.set()
+        slow = [future.result() for future in futures]
+
+    assert slow[0] is slow[1] and len(created) == 1
+
+
+def test_failed_loads_are_retried(events):
+    registry = ModelRegistry(memory_budget_bytes=100)
+
+    def failing_factory():
+        raise RuntimeError('no model')
+
+    with pytest.raises(RuntimeError):
+        registry.get('a', failing_factory)
+    assert 'a' not in registry and not registry._loading
+    assert registry.get('a', factory('a', 10, events)).loaded
+
+
+SIBLING_PACKAGE = """
+import numpy as np
+import pandas as pd
+
+
+class Model:
+    def __init__(self, size):
+        self.weights = np.ones(size, dtype=np.uint8)
+
+    def predict(self, input_df):
+        return pd.DataFrame({'y': input_df['x'] * 2})
+
+
+def get_model():
+    return Model(1)
+"""
+
+DEPENDENT_PACKAGE = """
+from ..base.package import Model
+
+
+def get_model():
+    return Model(32 * 1024 * 1024)
+"""
+
+
+def test_model_host_loads_packages_on_demand(tmp_path):
+    # Directories need not be identifiers, and may import from siblings.
+    for name, source in [('base', SIBLING_PACKAGE),
+                         ('big-model', DEPENDENT_PACKAGE)]:
+        (tmp_path / name).mkdir()
+        (tmp_path / name / '__init__.py').write_text('')
+        (tmp_path / name / 'package.py').write_text(source)
+    host = ModelHost({'small': tmp_path / 'base',
+                      'big': tmp_path / 'big-model'},
+                     memory_budget_bytes=1024 * 1024 * 1024)
+
+    result = host.predict('big', pd.DataFrame({'x': [1.0, 2.0]}))
+    host.predict('small', pd.DataFrame({'x': [3.0]}))
+    host.predict('big', pd.DataFrame({'x': [4.0]}))
+
+    assert list(result['y']) == [2.0, 4.0]
+    assert host.stats()['hit_rate'] == pytest.approx(1 / 3)
+    loaded = {model.name: model for model in host.loaded_models()}
+    assert [model.name for model in host.loaded_models()] == ['small', 'big']
+    assert loaded['big'].last_used >= loaded['small'].last_used
+    if resident_bytes() is not None:
+        # Models without memory_footprint count their resident growth.
+        assert loaded['big'].footprint() > 30 * 1024 * 1024
+
+    # The budget is enforced when a model loads.
+    host.memory_budget_bytes = 0
+    host.unload('small')
+    host.get_model('small')
+    assert 'big' not in host
+    assert isinstance(host.get_model('small').weights, np.ndarray)
+
+
+IMPORT_HEAVY_PACKAGE = """
+import numpy as np
+import pandas as pd
+
+# Stands in for a large library that is imported for the first time.
+LIBRARY = np.ones(64 * 1024 * 1024, dtype=np.uint8)
+
+
+class Model:
+    def predict(self, input_df):
+        return pd.DataFrame({'y': input_df['x']})
+
+
+def get_model():
+    return Model()
+"""
+
+
+@pytest.mark.skipif(resident_bytes() is None,
+                    reason='Resident size is not available')
+def test_model_host_does_not_count_package_imports(tmp_path):
+    (tmp_path / 'heavy').mkdir()
+    (tmp_path / 'heavy' / '__init__.py').write_text('')
+    (tmp_path / 'heavy' / 'package.py').write_text(IMPORT_HEAVY_PACKAGE)
+    host = ModelHost({'heavy': tmp_path / 'heavy'},
+                     memory_budget_bytes=1024 * 1024 * 1024)
+
+    host.predict('heavy', pd.DataFrame({'x': [1.0]}))
+
+    assert host.loaded_models()[0].footprint() < 16 * 1024 * 1024
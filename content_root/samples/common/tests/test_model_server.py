@@ -0,0 +1,212 @@
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from .. import model_server
+from ..model_server import ModelServer
+
+PACKAGE = """
+import os
+import time
+
+import pandas as pd
+
+LOADED_IN = []
+
+
+class Model:
+    def __init__(self):
+        LOADED_IN.append(os.getpid())
+
+    def predict(self, input_df):
+        if (input_df['x'] < 0).any():
+            raise ValueError('negative input')
+        time.sleep(0.05)
+        return pd.DataFrame({'y': input_df['x'] * 2,
+                             'pid': LOADED_IN * len(input_df)})
+
+
+def get_model():
+    return Model()
+"""
+
+# Workers exit on a negative input, and can't load once NO_RELOAD exists.
+CRASHING_PACKAGE = """
+import os
+from pathlib import Path
+
+import pandas as pd
+
+NO_RELOAD = Path(__file__).parent / 'NO_RELOAD'
+
+
+class Model:
+    def predict(self, input_df):
+        if (input_df['x'] < 0).any():
+            os._exit(1)
+        return pd.DataFrame({'y': input_df['x'] * 2,
+                             'pid': os.getpid()})
+
+
+def get_model():
+    if NO_RELOAD.exists():
+        raise IOError('artifact went missing')
+    return Model()
+"""
+
+ECHO_PACKAGE = """
+import pandas as pd
+
+
+class Model:
+    def predict(self, input_df):
+        # Written to, as preprocessing may do in place.
+        input_df['x'] += 1
+        return input_df.copy()
+
+
+def get_model():
+    return Model()
+"""
+
+FAILING_PACKAGE = """
+def get_model():
+    raise IOError('missing artifact')
+"""
+
+
+def make_package(root, name, source):
+    (root / name).mkdir()
+    (root / name / '__init__.py').write_text('')
+    (root / name / 'package.py').write_text(source)
+    return root / name
+
+
+def test_requests_are_served_by_workers(tmp_path):
+    package_dir = make_package(tmp_path, 'model-a', PACKAGE)
+    inputs = [pd.DataFrame({'x': [float(i)]}) for i in range(8)]
+
+    with ModelServer(package_dir, num_workers=2) as server:
+        assert len(server.load_seconds) == 2
+        assert server.memory_footprint() >= 0
+        with ThreadPoolExecutor(4) as pool:
+            results = list(pool.map(server.predict, inputs))
+        with pytest.raises(ValueError):
+            server.predict(pd.DataFrame({'x': [-1.0]}))
+        # Workers keep serving after an error.
+        assert list(server.predict(inputs[1])['y']) == [2.0]
+
+    assert [result['y'][0] for result in results] == [
+        2.0 * i for i in range(8)]
+    # Each worker created its own model, after the fork.
+    pids = {result['pid'][0] for result in results}
+    assert len(pids) == 2
+    assert os.getpid() not in pids
+    with pytest.raises(RuntimeError):
+        server.predict(inputs[0])
+
+
+def test_large_requests_are_passed_through_shared_memory(tmp_path):
+    package_dir = make_package(tmp_path, 'echo', ECHO_PACKAGE)
+    num_rows = model_server.SHARED_MEMORY_MIN_BYTES // 8
+    large = pd.DataFrame({
+        'x': np.arange(num_rows, dtype=float),
+        'n': np.arange(num_rows),
+        'c': pd.Categorical(np.where(np.arange(num_rows) % 3, 'a', 'b')),
+        's': 'text'})
+
+    with ModelServer(package_dir, num_workers=1) as server:
+        small = server.predict(large[:10])
+        worker = server._workers[0]
+        assert worker.segment is None
+        results = [server.predict(large) for _ in range(2)]
+        results.append(server.predict(large[:num_rows // 2]))
+        if model_server.shared_memory is not None:
+            assert worker.segment.size >= large['x'].nbytes
+        segment = worker.segment
+
+    expected = large.assign(x=large['x'] + 1)
+    pd.testing.assert_frame_equal(small, expected[:10])
+    for result in results[:2]:
+        pd.testing.assert_frame_equal(result, expected)
+    pd.testing.assert_frame_equal(results[2], expected[:num_rows // 2])
+    if segment is not None:
+        with pytest.raises(FileNotFoundError):
+            model_server.shared_memory.SharedMemory(segment.name)
+
+
+@pytest.mark.parametrize('num_rows', [
+    1, model_server.SHARED_MEMORY_MIN_BYTES // 8])
+def test_unpicklable_request_fails_alone(tmp_path, num_rows):
+    package_dir = make_package(tmp_path, 'echo', ECHO_PACKAGE)
+    unpicklable = pd.DataFrame({'x': np.zeros(num_rows),
+                                'f': [lambda: None] * num_rows})
+
+    with ModelServer(package_dir, num_workers=1) as server:
+        with pytest.raises(Exception):
+            server.predict(unpicklable)
+        # The worker is still idle.
+        with ThreadPoolExecutor(1) as pool:
+            result = pool.submit(server.predict, pd.DataFrame({'x': [1.0]}))
+            assert list(result.result(timeout=30)['x']) == [2.0]
+        assert server.respawns == 0
+
+
+def test_load_failure_is_raised(tmp_path):
+    server = ModelServer(make_package(tmp_path, 'broken', FAILING_PACKAGE),
+                         num_workers=2)
+
+    with pytest.raises(RuntimeError) as error:
+        server.load_model()
+    assert isinstance(error.value.__cause__, IOError)
+    assert server.load_seconds == []
+
+
+def wait_for_respawns(server, count):
+    deadline = time.time() + 30
+    while server.respawns < count and time.time() < deadline:
+        time.sleep(0.05)
+    assert server.respawns == count
+
+
+def test_exited_workers_are_replaced(tmp_path):
+    package_dir = make_package(tmp_path, 'crashing', CRASHING_PACKAGE)
+
+    with ModelServer(package_dir, num_workers=2) as server:
+        first = server.predict(pd.DataFrame({'x': [1.0]}))
+        with pytest.raises(RuntimeError, match='exited'):
+            server.predict(pd.DataFrame({'x': [-1.0]}))
+        wait_for_respawns(server, 1)
+
+        pids = {server.predict(pd.DataFrame({'x': [1.0]}))['pid'][0]
+                for _ in range(6)}
+        assert len(server._workers) == 2
+        assert len(pids) <= 2
+    assert first['y'][0] == 2.0
+
+
+def test_requests_fail_once_no_worker_can_load(tmp_path):
+    package_dir = make_package(tmp_path, 'crashing', CRASHING_PACKAGE)
+
+    with ModelServer(package_dir, num_workers=1) as server:
+        (package_dir / 'NO_RELOAD').write_text('')
+        with pytest.raises(RuntimeError, match='exited'):
+            server.predict(pd.DataFrame({'x': [-1.0]}))
+
+        # Raised as soon as the replacement fails, instead of blocking.
+        with ThreadPoolExecutor(2) as pool:
+            futures = [pool.submit(server.predict, pd.DataFrame({'x': [1.0]}))
+                       for _ in range(2)]
+            for future in futures:
+                with pytest.raises(RuntimeError, match='No workers|loaded'):
+                    future.result(timeout=30)
+        assert server.respawns == 0
+
+    # Loading again starts new workers.
+    (package_dir / 'NO_RELOAD').unlink()
+    with server:
+        assert list(server.predict(pd.DataFrame({'x': [2.0]}))['y']) == [4.0]
@@ -0,0 +1,99 @@
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+import pytest
+import requests
+import yaml
+
+PACKAGE_DIR = Path(__file__).parents[2] / 'iris_classification' / 'pmml_iris'
+IRIS_CSV = Path(__file__).parents[2] / 'datasets' / 'iris' / 'train.csv'
+with open(PACKAGE_DIR / 'model.yaml') as f:
+    INPUT_COLUMNS = [column['column-name']
+                     for column in yaml.safe_load(f)['model']['inputs']]
+OUTPUT_COLUMNS = ['Probability_setosa', 'Probability_versicolor',
+                  'Probability_virginica']
+
+
+def make_input(num_rows):
+    """Returns rows with the inputs declared in model.yaml, with petal
+    lengths on both sides of the DecisionTreeIris root split."""
+    input_df = pd.DataFrame({column: np.full(num_rows, 1.0)
+                             for column in INPUT_COLUMNS})
+    input_df['petal length (cm)'] = np.linspace(1.0, 6.0, num_rows)
+    return input_df
+
+
+def test_package_config(pmml_iris_package):
+    model = pmml_iris_package.get_model_class()
+
+    assert model.url.endswith('/openscoring/model/DecisionTreeIris/csv')
+    assert model.timeout == (5, 60)
+    assert model.prediction_cache is None
+
+
+def test_predict_reuses_connection(make_iris_model, openscoring_server):
+    server = openscoring_server
+    model = make_iris_model(server.url)
+    input_df = make_input(10)
+
+    results = [model.predict(input_df) for _ in range(3)]
+
+    for result in results:
+        assert list(result.columns) == ['Probability_setosa',
+                                        'Probability_versicolor']
+        np.testing.assert_array_equal(
+            result['Probability_setosa'],
+            input_df['petal length (cm)'] < 2.45)
+    assert server.num_requests == 3
+    assert len(server.connections) == 1
+
+
+def test_predict_chunks_concurrently_in_order(make_iris_model,
+                                              openscoring_server):
+    server = openscoring_server
+    model = make_iris_model(server.url, max_rows_per_request=10,
+                            max_concurrent_requests=4)
+    input_df = make_input(95)
+
+    result = model.predict(input_df)
+
+    assert server.num_requests == 10
+    assert 1 < server.max_in_flight <= 4
+    np.testing.assert_array_equal(result['Probability_setosa'],
+                                  input_df['petal length (cm)'] < 2.45)
+
+
+def test_predict_raises_on_http_error(make_iris_model, openscoring_server):
+    model = make_iris_model(openscoring_server.url)
+    model.url = openscoring_server.url + '/missing'
+
+    with pytest.raises(requests.HTTPError):
+        model.predict(make_input(2))
+
+
+def test_empty_input_sends_no_request(make_iris_model, openscoring_server):
+    model = make_iris_model(openscoring_server.url)
+
+    result = model.predict(make_input(0))
+
+    assert list(result.columns) == OUTPUT_COLUMNS
+    assert len(result) == 0
+    assert openscoring_server.num_requests == 0
+
+
+def test_in_process_evaluation(make_iris_model):
+    model = make_iris_model('http://127.0.0.1:1', in_process=True)
+    # The model.yaml inputs, with the species labels 0, 1, 2.
+    iris = pd.read_csv(IRIS_CSV)
+
+    result = model.predict(iris[INPUT_COLUMNS])
+
+    # The openscoring response columns, without Species and Node_Id.
+    assert list(result.columns) == OUTPUT_COLUMNS
+    assert list(model.predict(make_input(0)).columns) == OUTPUT_COLUMNS
+    predicted = result.to_numpy().argmax(axis=1)
+    assert (predicted == iris['species']).mean() > 0.9
+    assert set(predicted) == {0, 1, 2}
+    with pytest.raises(ValueError, match='petal width'):
+        model.predict(iris.drop(columns=['petal width (cm)']))
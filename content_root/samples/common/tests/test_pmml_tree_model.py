@@ -0,0 +1,139 @@
+import math
+import xml.etree.ElementTree as ET
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from ..pmml_tree_model import PMMLTreeModel
+
+IRIS_PMML = (Path(__file__).parents[2] / 'iris_classification' /
+             'pmml_iris' / 'DecisionTreeIris.pmml')
+NS = {'pmml': 'http://www.dmg.org/PMML-4_2'}
+
+TREE_PMML = '''<?xml version="1.0"?>
+<PMML xmlns="http://www.dmg.org/PMML-4_2" version="4.2">
+  <DataDictionary>
+    <DataField name="y" optype="categorical" dataType="string">
+      <Value value="a"/><Value value="b"/>
+    </DataField>
+    <DataField name="x" optype="continuous" dataType="double"/>
+  </DataDictionary>
+  <TreeModel functionName="classification"
+             missingValueStrategy="{strategy}"
+             noTrueChildStrategy="{no_true_child}">
+    <MiningSchema>
+      <MiningField name="y" usageType="predicted"/>
+      <MiningField name="x"/>
+    </MiningSchema>
+    <Node id="root" score="a" defaultChild="right">
+      <True/>
+      <ScoreDistribution value="a" recordCount="3"/>
+      <ScoreDistribution value="b" recordCount="1"/>
+      <Node id="left" score="a">
+        <SimplePredicate field="x" operator="lessOrEqual" value="0"/>
+        <ScoreDistribution value="a" recordCount="2" probability="0.9"/>
+        <ScoreDistribution value="b" recordCount="0" probability="0.1"/>
+      </Node>
+      <Node id="right" score="b">
+        <SimplePredicate field="x" operator="greaterThan" value="5"/>
+        <ScoreDistribution value="b" recordCount="1"/>
+      </Node>
+    </Node>
+  </TreeModel>
+</PMML>
+'''
+
+
+def reference_leaf(node, row):
+    """Walks the iris tree one row at a time, as openscoring does."""
+    while True:
+        children = node.findall('pmml:Node', NS)
+        if not children:
+            return node
+        for child in children:
+            predicate = child.find('pmml:SimplePredicate', NS)
+            value = row[predicate.get('field')]
+            if math.isnan(value):
+                node = next(c for c in children
+                            if c.get('id') == node.get('defaultChild'))
+                break
+            threshold = float(predicate.get('value'))
+            if {'lessThan': value < threshold,
+                    'greaterOrEqual': value >= threshold}[
+                    predicate.get('operator')]:
+                node = child
+                break
+
+
+def test_iris_tree_matches_reference():
+    rng = np.random.RandomState(0)
+    input_df = pd.DataFrame({
+        'Sepal_Length': rng.uniform(4, 8, 300),
+        'Sepal_Width': rng.uniform(2, 4.5, 300),
+        'Petal_Length': rng.uniform(1, 7, 300),
+        'Petal_Width': rng.uniform(0, 2.5, 300)})
+    input_df = input_df.mask(rng.rand(*input_df.shape) < 0.1)
+    root = ET.parse(IRIS_PMML).getroot().find('pmml:TreeModel/pmml:Node', NS)
+
+    result = PMMLTreeModel(IRIS_PMML).evaluate(input_df)
+
+    assert list(result.columns) == [
+        'Species', 'Probability_setosa', 'Probability_versicolor',
+        'Probability_virginica', 'Node_Id']
+    for (_, row), (_, scored) in zip(input_df.iterrows(), result.iterrows()):
+        leaf = reference_leaf(root, row)
+        assert scored['Node_Id'] == leaf.get('id')
+        assert scored['Species'] == leaf.get('score')
+        for score in leaf.findall('pmml:ScoreDistribution', NS):
+            assert scored['Probability_' + score.get('value')] == \
+                pytest.approx(float(score.get('confidence')))
+
+
+@pytest.mark.parametrize('strategy,no_true_child,expected', [
+    ('defaultChild', 'returnNullPrediction',
+     ['left', 'right', None, 'right']),
+    ('none', 'returnNullPrediction', ['left', 'right', None, None]),
+    ('none', 'returnLastPrediction', ['left', 'right', 'root', 'root']),
+    ('lastPrediction', 'returnNullPrediction',
+     ['left', 'right', None, 'root']),
+])
+def test_missing_value_and_no_true_child_strategies(tmp_path, strategy,
+                                                    no_true_child, expected):
+    path = tmp_path / 'tree.pmml'
+    path.write_text(TREE_PMML.format(strategy=strategy,
+                                     no_true_child=no_true_child))
+    model = PMMLTreeModel(path)
+    input_df = pd.DataFrame({'x': [-1.0, 6.0, 3.0, np.nan]})
+
+    leaves = model.leaf_nodes(input_df)
+    result = model.evaluate(input_df)
+
+    assert list(model.entity_ids[leaves]) == expected
+    assert list(result.columns) == ['y']
+    # Probabilities come from the probability attribute when present, and
+    # from record counts otherwise.
+    root_index = list(model.entity_ids).index('root')
+    left_index = list(model.entity_ids).index('left')
+    np.testing.assert_allclose(model.probabilities[root_index], [0.75, 0.25])
+    np.testing.assert_allclose(model.probabilities[left_index], [0.9, 0.1])
+
+
+def test_unsupported_model(tmp_path):
+    path = tmp_path / 'tree.pmml'
+    path.write_text(TREE_PMML.format(strategy='weightedConfidence',
+                                     no_true_child='returnNullPrediction'))
+
+    with pytest.raises(NotImplementedError, match='weightedConfidence'):
+        PMMLTreeModel(path)
+
+
+def test_missing_active_field_raises():
+    model = PMMLTreeModel(IRIS_PMML)
+    input_df = pd.DataFrame({'Petal_Length': [1.0], 'Petal_Width': [0.1],
+                             'sepal length (cm)': [5.0],
+                             'sepal width (cm)': [3.0]})
+
+    with pytest.raises(ValueError, match='Sepal_Length'):
+        model.evaluate(input_df)
@@ -0,0 +1,99 @@
+import asyncio
+import time
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from ..prediction_cache import PredictionCache
+
+
+class CountingModel:
+    """Scores rows with a + b, recording the rows it was called with."""
+
+    def __init__(self):
+        self.calls = []
+
+    def predict(self, input_df):
+        self.calls.append(input_df.copy())
+        return pd.DataFrame({'score': input_df['a'] + input_df['b'],
+                             'label': np.where(input_df['a'] > 1, 'hi', 'lo')})
+
+    async def apredict(self, input_df):
+        return self.predict(input_df)
+
+
+def make_input(values):
+    return pd.DataFrame({'a': [a for a, _ in values],
+                         'b': [b for _, b in values]})
+
+
+def test_only_distinct_misses_are_scored():
+    cache = PredictionCache('model')
+    model = CountingModel()
+
+    first = cache.predict(make_input([(1, 2.0), (3, 4.0), (1, 2.0)]),
+                          model.predict)
+    second = cache.predict(make_input([(3, 4.0), (5, 6.0)]), model.predict)
+
+    assert list(first['score']) == [3.0, 7.0, 3.0]
+    assert list(first['label']) == ['lo', 'hi', 'lo']
+    assert first['score'].dtype == np.float64
+    assert list(second['score']) == [7.0, 11.0]
+    assert [len(call) for call in model.calls] == [2, 1]
+    assert list(model.calls[1]['a']) == [5]
+    assert cache.stats() == {'hits': 1, 'misses': 4, 'hit_rate': 0.2,
+                             'evictions': 0, 'expirations': 0,
+                             'entries': 3}
+
+
+def test_keys_are_canonical_and_model_specific():
+    cache = PredictionCache('model')
+
+    ints = cache.row_keys(pd.DataFrame({'a': [1, 2]}))
+    floats = cache.row_keys(pd.DataFrame({'a': [1.0, 2.0]}))
+
+    assert ints == floats
+    assert ints[0] != ints[1]
+    assert PredictionCache('other').row_keys(pd.DataFrame({'a': [1]})) \
+        != ints[:1]
+    assert cache.row_keys(pd.DataFrame({'b': [1]})) != ints[:1]
+
+
+def test_ttl_and_lru_eviction():
+    cache = PredictionCache('model', max_entries=2, ttl_seconds=0.05)
+    model = CountingModel()
+
+    cache.predict(make_input([(1, 0.0), (2, 0.0), (3, 0.0)]), model.predict)
+    assert len(cache) == 2
+    assert cache.evictions == 1
+
+    # (1, 0) was evicted, (3, 0) is still cached.
+    cache.predict(make_input([(3, 0.0), (1, 0.0)]), model.predict)
+    assert list(model.calls[-1]['a']) == [1]
+
+    time.sleep(0.1)
+    cache.predict(make_input([(3, 0.0)]), model.predict)
+    assert list(model.calls[-1]['a']) == [3]
+    assert cache.expirations == 1
+
+
+def test_apredict_and_empty_input():
+    cache = PredictionCache('model')
+    model = CountingModel()
+    input_df = make_input([(1, 2.0), (1, 2.0)])
+
+    result = asyncio.run(cache.apredict(input_df, model.apredict))
+    empty = cache.predict(input_df.iloc[:0], model.predict)
+
+    assert list(result['score']) == [3.0, 3.0]
+    assert len(empty) == 0
+    assert cache.hit_rate == 0.0
+
+
+def test_wrong_number_of_predictions():
+    cache = PredictionCache('model')
+
+    with pytest.raises(ValueError, match='Expected 2 predictions, got 1'):
+        cache.predict(make_input([(1, 2.0), (3, 4.0)]),
+                      lambda input_df: pd.DataFrame({'score': [1.0]}))
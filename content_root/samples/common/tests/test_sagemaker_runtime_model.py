@@ -0,0 +1,237 @@
+import asyncio
+import time
+
+import numpy as np
+import pandas as pd
+import pytest
+from botocore.exceptions import ClientError
+
+from ..sagemaker_runtime_model import row_chunks
+
+
+def make_df(num_rows):
+    rng = np.random.RandomState(0)
+    return pd.DataFrame({'a': rng.rand(num_rows),
+                         'b': rng.randint(0, 1000, num_rows),
+                         'c': rng.choice(['x', 'yy', 'zzz'], num_rows)})
+
+
+def test_row_chunks_respect_size_limit():
+    input_df = make_df(1000)
+    csv = input_df.to_csv(header=False, index=False).encode()
+    row_sizes = [len(line) + 1 for line in csv.splitlines()]
+    max_size = 2000
+
+    chunks = list(row_chunks(input_df, max_size))
+
+    assert b''.join(body for _, _, body in chunks) == csv
+    assert chunks[0][0] == 0 and chunks[-1][1] == 1000
+    for (_, end, body), (next_start, _, _) in zip(chunks, chunks[1:]):
+        assert end == next_start
+        assert len(body) <= max_size
+        # Packing is greedy: the next row would not have fit.
+        assert len(body) + row_sizes[end] > max_size
+    for start, end, body in chunks:
+        assert body.count(b'\n') == end - start
+
+
+def test_row_chunks_single_request():
+    input_df = make_df(10)
+
+    chunks = list(row_chunks(input_df))
+
+    assert len(chunks) == 1
+    assert chunks[0][:2] == (0, 10)
+
+
+def test_row_chunks_oversized_row_and_empty_frame():
+    input_df = pd.DataFrame({'a': ['x' * 50, 'y', 'z']})
+
+    chunks = list(row_chunks(input_df, 10))
+
+    assert [chunk[:2] for chunk in chunks] == [(0, 1), (1, 3)]
+    assert list(row_chunks(input_df.iloc[:0])) == []
+
+
+def test_row_chunks_quoted_newlines():
+    input_df = pd.DataFrame({'a': ['multi\nline', 'b', 'c'],
+                             'b': [1, 2, 3]})
+
+    chunks = list(row_chunks(input_df, 16))
+
+    assert [chunk[:2] for chunk in chunks] == [(0, 1), (1, 3)]
+    assert chunks[0][2] == b'"multi\nline",1\n'
+
+
+@pytest.fixture
+def large_input():
+    # Split into many 200 byte requests.
+    return pd.DataFrame({'a': np.arange(500, dtype=float), 'b': 1.0})
+
+
+def test_predict_sequential(stub_endpoint, make_sagemaker_model, large_input):
+    endpoint = stub_endpoint()
+    result = make_sagemaker_model(endpoint).predict(large_input)
+
+    assert list(result.columns) == ['score']
+    np.testing.assert_array_equal(result['score'], large_input['a'])
+    assert endpoint.max_in_flight == 1
+
+
+def test_predict_concurrent_in_order(stub_endpoint, make_sagemaker_model,
+                                     large_input):
+    endpoint = stub_endpoint(delay=0.01)
+    model = make_sagemaker_model(endpoint, max_concurrent_requests=4)
+    result = model.predict(large_input)
+
+    np.testing.assert_array_equal(result['score'], large_input['a'])
+    assert endpoint.num_requests > 4
+    assert 1 < endpoint.max_in_flight <= 4
+
+
+def test_predict_retries_throttled_requests(stub_endpoint,
+                                            make_sagemaker_model,
+                                            large_input):
+    endpoint = stub_endpoint(num_throttled=2)
+    model = make_sagemaker_model(endpoint, max_concurrent_requests=4)
+    result = model.predict(large_input)
+
+    np.testing.assert_array_equal(result['score'], large_input['a'])
+
+
+def test_predict_gives_up_after_max_retries(stub_endpoint,
+                                            make_sagemaker_model):
+    endpoint = stub_endpoint(num_throttled=3)
+    with pytest.raises(ClientError, match='ThrottlingException'):
+        make_sagemaker_model(endpoint).predict(
+            pd.DataFrame({'a': [1.0]}))
+
+    assert endpoint.num_requests == 3
+
+
+def test_predict_csv_accept(stub_endpoint, make_sagemaker_model, large_input):
+    endpoint = stub_endpoint()
+    model = make_sagemaker_model(endpoint, max_concurrent_requests=4,
+                                 accept='text/csv')
+    result = model.predict(large_input)
+
+    assert result['score'].dtype == np.float64
+    np.testing.assert_array_equal(result['score'], large_input['a'])
+
+
+@pytest.mark.parametrize('accept', ['application/json', 'text/csv'])
+@pytest.mark.parametrize('extra_scores,message', [(1, 'more than the 3'),
+                                                  (-1, '2 scores')])
+def test_predict_fails_on_score_count_mismatch(stub_endpoint,
+                                               make_sagemaker_model, accept,
+                                               extra_scores, message):
+    endpoint = stub_endpoint(extra_scores=extra_scores)
+    with pytest.raises(ValueError, match=message):
+        make_sagemaker_model(endpoint, accept=accept).predict(
+            pd.DataFrame({'a': [1.0, 2.0, 3.0]}))
+
+
+@pytest.mark.parametrize('accept', ['application/json', 'text/csv'])
+def test_apredict(stub_endpoint, make_sagemaker_model, large_input, accept):
+    endpoint = stub_endpoint(delay=0.01)
+    model = make_sagemaker_model(endpoint, max_concurrent_requests=4,
+                                 accept=accept)
+
+    async def run():
+        try:
+            return await model.apredict(large_input)
+        finally:
+            await model.aclose()
+
+    result = asyncio.run(run())
+
+    np.testing.assert_array_equal(result['score'], large_input['a'])
+    assert 1 < endpoint.max_in_flight <= 4
+    assert endpoint.authorization.startswith(
+        'AWS4-HMAC-SHA256 Credential=key/')
+
+
+def test_apredict_concurrent_calls_on_one_loop(stub_endpoint,
+                                               make_sagemaker_model):
+    endpoint = stub_endpoint(num_throttled=2, delay=0.01)
+    model = make_sagemaker_model(endpoint)
+    inputs = [pd.DataFrame({'a': [float(i), i + 0.5]}) for i in range(50)]
+
+    async def run():
+        try:
+            return await asyncio.gather(*[model.apredict(input_df)
+                                          for input_df in inputs])
+        finally:
+            await model.aclose()
+
+    results = asyncio.run(run())
+
+    for input_df, result in zip(inputs, results):
+        np.testing.assert_array_equal(result['score'], input_df['a'])
+    assert endpoint.max_in_flight > 1
+
+
+def test_apredict_refreshes_client(stub_endpoint, make_sagemaker_model):
+    endpoint = stub_endpoint()
+    model = make_sagemaker_model(endpoint)
+    model.client_refresh_time = time.time() - 1
+    client = model.client
+
+    async def run():
+        try:
+            return await model.apredict(pd.DataFrame({'a': [1.0]}))
+        finally:
+            await model.aclose()
+
+    result = asyncio.run(run())
+
+    assert list(result['score']) == [1.0]
+    assert model.client is not client
+    assert model.client_refresh_time == float('inf')
+
+
+def test_apredict_fails_on_score_count_mismatch(stub_endpoint,
+                                                make_sagemaker_model):
+    endpoint = stub_endpoint(extra_scores=-1)
+    model = make_sagemaker_model(endpoint)
+
+    async def run():
+        try:
+            return await model.apredict(pd.DataFrame({'a': [1.0, 2.0]}))
+        finally:
+            await model.aclose()
+
+    with pytest.raises(ValueError, match='1 scores, expected 2'):
+        asyncio.run(run())
+
+
+def test_predict_with_prediction_cache(stub_endpoint, make_sagemaker_model):
+    endpoint = stub_endpoint()
+    model = make_sagemaker_model(
+        endpoint, accept='text/csv',
+        prediction_cache={'max_entries': 100, 'ttl_seconds': 60})
+    first = model.predict(pd.DataFrame({'a': [1.0, 2.0, 1.0]}))
+    second = model.predict(pd.DataFrame({'a': [2.0, 3.0]}))
+
+    assert list(first['score']) == [1.0, 2.0, 1.0]
+    assert list(second['score']) == [2.0, 3.0]
+    assert endpoint.num_requests == 2
+    assert model.prediction_cache.stats()['hits'] == 1
+    assert model.memory_footprint() > 0
+
+
+def test_unload_and_reload(stub_endpoint, make_sagemaker_model, large_input):
+    endpoint = stub_endpoint()
+    model = make_sagemaker_model(endpoint, max_concurrent_requests=4)
+    model.predict(large_input)
+    asyncio.run(model.apredict(large_input.iloc[:10]))
+    model.unload_model()
+
+    assert model.client is None
+    assert model._pool is None and model._aio_session is None
+    assert model.memory_footprint() == 0
+
+    model.load_model()
+    result = model.predict(large_input)
+
+    np.testing.assert_array_equal(result['score'], large_input['a'])
@@ -0,0 +1,117 @@
+import importlib.util
+import json
+import pickle
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+import pytest
+
+xgb = pytest.importorskip('xgboost')
+
+PACKAGE_DIR = (Path(__file__).parents[2] / 'lending' /
+               'xgboost-simple-sagemaker')
+XGBOOST_1 = int(xgb.__version__.split('.')[0]) >= 1
+
+rng = np.random.RandomState(0)
+features = rng.normal(size=(200, 4)).astype(np.float32)
+labels = (features[:, 0] + features[:, 1] * features[:, 2] > 0).astype(int)
+
+
+@pytest.fixture(scope='module')
+def predictor_module():
+    spec = importlib.util.spec_from_file_location(
+        'sagemaker_xgboost_predictor',
+        PACKAGE_DIR / 'sagemaker_xgboost_predictor.py')
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+def train_booster(feature_names=None):
+    dtrain = xgb.DMatrix(features, label=labels, feature_names=feature_names)
+    return xgb.train({'objective': 'binary:logistic', 'max_depth': 3},
+                     dtrain, num_boost_round=10)
+
+
+def booster_nthread(booster):
+    config = json.loads(booster.save_config())
+    return int(config['learner']['generic_param']['nthread'])
+
+
+def test_predict_matches_booster(predictor_module, tmp_path):
+    booster = train_booster()
+    # xgboost < 1.0 writes its binary format whatever the suffix.
+    booster.save_model(str(tmp_path / 'model.json'))
+    input_df = pd.DataFrame(features.astype(float),
+                            columns=['a', 'b', 'c', 'd'])
+    expected = booster.predict(xgb.DMatrix(features))
+
+    model = predictor_module.SageMakerXGBoostPredictor(
+        str(tmp_path / 'model.json'), output_column=['p'])
+    result = model.predict(input_df)
+
+    assert list(result.columns) == ['p']
+    np.testing.assert_allclose(result['p'], expected, rtol=1e-6)
+    assert model._inplace == XGBOOST_1
+    # The DMatrix fallback for xgboost < 1.1 gives the same predictions.
+    model._inplace = False
+    np.testing.assert_allclose(model.predict(input_df)['p'], expected,
+                               rtol=1e-6)
+    # The caller's frame is not modified.
+    assert input_df['a'].dtype == np.float64
+
+
+def test_pickled_booster_matches_inputs_by_name(predictor_module, tmp_path):
+    names = ['f0', 'f1', 'f2', 'f3']
+    booster = train_booster(feature_names=names)
+    with open(tmp_path / 'xgboost-model', 'wb') as outfile:
+        pickle.dump(booster, outfile)
+    input_df = pd.DataFrame(features, columns=names)
+    expected = booster.predict(xgb.DMatrix(features, feature_names=names))
+
+    model = predictor_module.SageMakerXGBoostPredictor(
+        str(tmp_path / 'xgboost-model'), output_column=['p'])
+
+    np.testing.assert_allclose(model.predict(input_df)['p'], expected,
+                               rtol=1e-6)
+    np.testing.assert_allclose(
+        model.predict(input_df[names[::-1]])['p'], expected, rtol=1e-6)
+    with pytest.raises(ValueError):
+        model.predict(input_df[names[:3]])
+
+
+def test_nthread_is_not_shared_between_predictors(predictor_module,
+                                                  tmp_path):
+    model_path = str(tmp_path / 'model.json')
+    train_booster().save_model(model_path)
+
+    one = predictor_module.SageMakerXGBoostPredictor(model_path, nthread=1)
+    two = predictor_module.SageMakerXGBoostPredictor(model_path, nthread=2)
+    other_one = predictor_module.SageMakerXGBoostPredictor(model_path,
+                                                           nthread=1)
+    default = predictor_module.SageMakerXGBoostPredictor(model_path)
+
+    # Boosters are shared only between predictors with the same nthread.
+    assert one.model is other_one.model
+    assert len({id(one.model), id(two.model), id(default.model)}) == 3
+    if hasattr(xgb.Booster, 'save_config'):
+        assert booster_nthread(one.model) == 1
+        assert booster_nthread(two.model) == 2
+    input_df = pd.DataFrame(features)
+    np.testing.assert_allclose(one.predict(input_df), two.predict(input_df))
+    for model in (one, two, other_one, default):
+        model.unload_model()
+
+
+@pytest.mark.skipif(not XGBOOST_1, reason='the JSON format needs xgboost 1.0')
+def test_shipped_model_loads(predictor_module):
+    model = predictor_module.SageMakerXGBoostPredictor(
+        str(PACKAGE_DIR / 'xgboost-model.json'), output_column=['p'])
+    input_df = pd.DataFrame(rng.normal(size=(20, 6)))
+
+    result = model.predict(input_df)
+
+    assert result.shape == (20, 1)
+    assert ((result['p'] >= 0) & (result['p'] <= 1)).all()
+    model.unload_model()
@@ -0,0 +1,57 @@
+import numpy as np
+import pandas as pd
+from ..schema_encoder import SchemaEncoder
+
+MODEL_YAML = '''
+model:
+    inputs:
+      - {column-name: Age, data-type: int}
+      - column-name: Geography
+        data-type: category
+        possible-values: [France, Germany, Spain]
+      - {column-name: Balance, data-type: float}
+'''
+
+
+def make_encoder(tmp_path):
+    path = tmp_path / 'model.yaml'
+    path.write_text(MODEL_YAML)
+    return SchemaEncoder(path)
+
+
+def test_schema_columns(tmp_path):
+    encoder = make_encoder(tmp_path)
+
+    assert encoder.input_columns == ['Age', 'Geography', 'Balance']
+    assert encoder.numeric_columns == ['Age', 'Balance']
+    assert list(encoder.categories('Geography')) == ['France', 'Germany',
+                                                     'Spain']
+
+
+def test_codes_for_strings_and_categoricals(tmp_path):
+    encoder = make_encoder(tmp_path)
+    values = ['Spain', 'France', None, 'Italy']
+    expected = [2, 0, -1, -1]
+
+    strings = pd.DataFrame({'Geography': values})
+    assert list(encoder.codes(strings, 'Geography')) == expected
+
+    # Same categories in a different order still map to schema codes.
+    values, expected = values[:3], expected[:3]
+    reordered = pd.DataFrame({'Geography': pd.Categorical(
+        values, categories=['Spain', 'Germany', 'France'])})
+    assert list(encoder.codes(reordered, 'Geography')) == expected
+
+    declared = pd.DataFrame({'Geography': pd.Categorical(
+        values, categories=['France', 'Germany', 'Spain'])})
+    assert list(encoder.codes(declared, 'Geography')) == expected
+
+
+def test_code_lookup(tmp_path):
+    encoder = make_encoder(tmp_path)
+    lookup = encoder.code_lookup('Geography', ['Germany', 'Spain'])
+    codes = encoder.codes(
+        pd.DataFrame({'Geography': ['France', 'Spain', None]}), 'Geography')
+
+    assert list(lookup[codes]) == [-1, 1, -1]
+    assert lookup.dtype == np.intp
@@ -0,0 +1,113 @@
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+import pandas as pd
+from sklearn.linear_model import LinearRegression
+from sklearn.linear_model import LogisticRegression
+from ..sklearn_wrapper import SimpleSklearnModel
+from ..sklearn_wrapper import convert_to_joblib
+
+rng = np.random.RandomState(0)
+input_df = pd.DataFrame(rng.normal(size=(50, 3)), columns=['a', 'b', 'c'])
+labels = np.arange(50) % 3
+
+
+def test_binary_classifier_predicts_positive_class(make_sklearn_model):
+    sk_model = LogisticRegression(solver='lbfgs').fit(input_df, labels == 0)
+    model = make_sklearn_model(sk_model, ['p'], is_classifier=True)
+
+    predictions = model.predict(input_df)
+
+    assert list(predictions.columns) == ['p']
+    assert np.allclose(predictions['p'],
+                       sk_model.predict_proba(input_df)[:, 1])
+    assert np.allclose(model.predict_array(input_df), predictions['p'])
+
+
+def test_multiclass_classifier_predicts_all_classes(make_sklearn_model):
+    sk_model = LogisticRegression(solver='lbfgs').fit(input_df, labels)
+    model = make_sklearn_model(sk_model, ['x', 'y', 'z'],
+                               is_classifier=True, is_multiclass=True)
+
+    predictions = model.predict(input_df.iloc[:1])
+
+    assert predictions.shape == (1, 3)
+    assert np.allclose(predictions.values,
+                       sk_model.predict_proba(input_df.iloc[:1]))
+
+
+def test_regressor_predict_array(make_sklearn_model):
+    sk_model = LinearRegression().fit(input_df, labels)
+    model = make_sklearn_model(sk_model, ['y'])
+
+    assert isinstance(model.predict_array(input_df), np.ndarray)
+    assert np.allclose(model.predict_array(input_df),
+                       sk_model.predict(input_df))
+
+
+def test_parallel_scoring_matches_serial(make_sklearn_model):
+    sk_model = LogisticRegression(solver='lbfgs').fit(input_df, labels == 0)
+    serial = make_sklearn_model(sk_model, ['p'], is_classifier=True)
+    expected = serial.predict_array(input_df)
+
+    for use_processes in (False, True):
+        model = make_sklearn_model(sk_model, ['p'], is_classifier=True,
+                                   num_workers=3, min_chunk_size=10,
+                                   use_processes=use_processes)
+        try:
+            assert np.allclose(model.predict_array(input_df), expected)
+            # too small to be split
+            assert np.allclose(model.predict_array(input_df.iloc[:15]),
+                               expected[:15])
+        finally:
+            model.unload_model()
+
+
+def test_concurrent_first_calls_share_one_pool(make_sklearn_model):
+    sk_model = LogisticRegression(solver='lbfgs').fit(input_df, labels == 0)
+    model = make_sklearn_model(sk_model, ['p'], is_classifier=True,
+                               num_workers=3, min_chunk_size=10)
+    started = threading.Barrier(8)
+    pools = []
+
+    def first_call(_):
+        started.wait()
+        pools.append(model._get_pool())
+        return model.predict_array(input_df)
+
+    try:
+        with ThreadPoolExecutor(8) as callers:
+            results = list(callers.map(first_call, range(8)))
+        assert len({id(pool) for pool in pools}) == 1
+        for result in results:
+            assert np.allclose(result, results[0])
+    finally:
+        model.unload_model()
+
+
+def test_joblib_artifact_is_memory_mapped(make_sklearn_model):
+    sk_model = LogisticRegression(solver='lbfgs').fit(input_df, labels == 0)
+    pickled = make_sklearn_model(sk_model, ['p'], is_classifier=True)
+    joblib_path = convert_to_joblib(pickled.path_to_serialized_model)
+
+    model = SimpleSklearnModel(joblib_path, ['p'], is_classifier=True)
+
+    assert isinstance(model.model.coef_, np.memmap)
+    assert np.allclose(model.predict_array(input_df),
+                       pickled.predict_array(input_df))
+
+
+def test_unload_and_reload(make_sklearn_model):
+    sk_model = LogisticRegression(solver='lbfgs').fit(input_df, labels == 0)
+    model = make_sklearn_model(sk_model, ['p'], is_classifier=True,
+                               num_workers=3, min_chunk_size=10)
+    expected = model.predict_array(input_df)
+
+    model.unload_model()
+    assert model.model is None and model._pool is None
+    assert model.memory_footprint() == 0
+    model.unload_model()
+
+    model.load_model()
+    assert np.allclose(model.predict_array(input_df), expected)
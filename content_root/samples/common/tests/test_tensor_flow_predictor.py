@@ -0,0 +1,164 @@
+import importlib.util
+import os
+import shutil
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+import pytest
+
+pytest.importorskip('tensorflow')
+
+PACKAGE_DIR = (Path(__file__).parents[2] / 'wine_quality' /
+               'dnn_wine_regressor')
+DATASET_CSV = (Path(__file__).parents[2] / 'datasets' / 'winequality' /
+               'test.csv')
+
+
+def load_predictor_module():
+    spec = importlib.util.spec_from_file_location(
+        'dnn_wine_tensor_flow_predictor',
+        PACKAGE_DIR / 'tensor_flow_predictor.py')
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+@pytest.fixture(scope='module')
+def predictor_module():
+    return load_predictor_module()
+
+
+@pytest.fixture(scope='module')
+def input_df():
+    input_columns = ['fixed acidity', 'volatile acidity', 'citric acid',
+                     'residual sugar', 'chlorides', 'free sulfur dioxide',
+                     'total sulfur dioxide', 'density', 'pH', 'sulphates',
+                     'alcohol']
+    return pd.read_csv(DATASET_CSV, usecols=input_columns)[:100]
+
+
+def test_batches_match_single_run(predictor_module, input_df):
+    model_dir = str(PACKAGE_DIR / 'dnn_model')
+    whole = predictor_module.TensorFlowPredictor(model_dir, ['quality'])
+    batched = predictor_module.TensorFlowPredictor(model_dir, ['quality'],
+                                                   batch_size=7)
+
+    expected = whole.predict(input_df)
+    result = batched.predict(input_df)
+
+    assert list(result.columns) == ['quality']
+    assert len(result) == len(input_df)
+    np.testing.assert_allclose(result['quality'], expected['quality'],
+                               rtol=1e-6)
+    # Column order does not matter, and feeds are computed once per order.
+    reordered = batched.predict(input_df[input_df.columns[::-1]])
+    np.testing.assert_allclose(reordered['quality'], expected['quality'],
+                               rtol=1e-6)
+    batched.predict(input_df)
+    assert len(batched._feeds) == 2
+    for _, _, dtype in batched._feeds[tuple(input_df.columns)]:
+        assert dtype == np.float32
+    whole.unload_model()
+    batched.unload_model()
+
+
+def test_feeds_are_kept_for_recently_used_columns(predictor_module, input_df):
+    model = predictor_module.TensorFlowPredictor(
+        str(PACKAGE_DIR / 'dnn_model'), ['quality'])
+    columns = list(input_df.columns)
+    rng = np.random.RandomState(0)
+
+    model.predict(input_df)
+    feeds = model._feeds[tuple(columns)]
+    for _ in range(predictor_module.MAX_FEED_LAYOUTS + 5):
+        model.predict(input_df[list(rng.permutation(columns))])
+        model.predict(input_df)
+
+    assert len(model._feeds) == predictor_module.MAX_FEED_LAYOUTS
+    # The layout in use is never evicted by the others.
+    assert model._feeds[tuple(columns)] is feeds
+    assert list(model._feeds)[-1] == tuple(columns)
+    model.unload_model()
+
+
+def test_optimized_graph_is_saved_and_reused(predictor_module, input_df,
+                                             tmp_path, monkeypatch):
+    model_dir = str(PACKAGE_DIR / 'dnn_model')
+    graph_path = tmp_path / 'dnn_model_optimized.pb'
+    expected = predictor_module.TensorFlowPredictor(
+        model_dir, ['quality']).predict(input_df)
+
+    optimized = predictor_module.TensorFlowPredictor(
+        model_dir, ['quality'], optimized_graph_path=str(graph_path))
+
+    assert graph_path.exists()
+    assert Path(f'{graph_path}.key').exists()
+    graph_ops = {op.type for op in optimized.sess.graph.get_operations()}
+    assert 'VariableV2' not in graph_ops
+    np.testing.assert_allclose(optimized.predict(input_df)['quality'],
+                               expected['quality'], rtol=1e-5)
+
+    def fail():
+        raise AssertionError('The saved graph should be loaded')
+    monkeypatch.setattr(predictor_module.TensorFlowPredictor,
+                        '_optimize_graph', lambda self: fail())
+    cached = predictor_module.TensorFlowPredictor(
+        model_dir, ['quality'], optimized_graph_path=str(graph_path))
+    np.testing.assert_allclose(cached.predict(input_df)['quality'],
+                               expected['quality'], rtol=1e-5)
+
+
+def test_optimized_graph_is_rebuilt_when_variables_change(
+        predictor_module, tmp_path, monkeypatch):
+    model_dir = tmp_path / 'dnn_model'
+    shutil.copytree(str(PACKAGE_DIR / 'dnn_model'), str(model_dir))
+    graph_path = str(tmp_path / 'dnn_model_optimized.pb')
+    predictor_module.TensorFlowPredictor(
+        str(model_dir), ['quality'], optimized_graph_path=graph_path)
+    num_builds = []
+    optimize_graph = predictor_module.TensorFlowPredictor._optimize_graph
+    monkeypatch.setattr(
+        predictor_module.TensorFlowPredictor, '_optimize_graph',
+        lambda self: num_builds.append(1) or optimize_graph(self))
+
+    # Only a variables file changes, as when retrained weights are copied
+    # over the old ones.
+    variables_path = next((model_dir / 'variables').glob('*.data-*'))
+    stat = variables_path.stat()
+    os.utime(str(variables_path), ns=(stat.st_atime_ns,
+                                      stat.st_mtime_ns + 10 ** 9))
+    predictor_module.TensorFlowPredictor(
+        str(model_dir), ['quality'], optimized_graph_path=graph_path)
+    predictor_module.TensorFlowPredictor(
+        str(model_dir), ['quality'], optimized_graph_path=graph_path)
+
+    assert len(num_builds) == 1
+
+
+def test_optimized_graph_is_not_saved_to_read_only_directory(
+        predictor_module, input_df, tmp_path, monkeypatch):
+    graph_path = tmp_path / 'dnn_model_optimized.pb'
+    monkeypatch.setattr(predictor_module.os, 'access',
+                        lambda path, mode: False)
+
+    model = predictor_module.TensorFlowPredictor(
+        str(PACKAGE_DIR / 'dnn_model'), ['quality'],
+        optimized_graph_path=str(graph_path))
+
+    assert list(tmp_path.iterdir()) == []
+    assert len(model.predict(input_df)) == len(input_df)
+
+
+def test_unload_and_reload(predictor_module, input_df):
+    model = predictor_module.TensorFlowPredictor(
+        str(PACKAGE_DIR / 'dnn_model'), ['quality'])
+    expected = model.predict(input_df)
+
+    model.unload_model()
+    assert model.sess is None
+    assert model.memory_footprint() == 0
+
+    model.load_model()
+    np.testing.assert_allclose(model.predict(input_df)['quality'],
+                               expected['quality'], rtol=1e-6)
@@ -2,6 +2,7 @@ import pathlib
 import pandas as pd
 from tensorflow.keras.models import load_model
 import tensorflow as tf
+from artifact_cache import resident_bytes
 tf.compat.v1.disable_eager_execution()
 
 
@@ -10,25 +11,52 @@ class MyModel:
                  output_columns=['predicted_target']):
         self.max_allowed_error = max_allowed_error
 
-        model_dir = pathlib.Path(__file__).parent
-
-        self.sess = tf.Session()
-        with self.sess.as_default():
-            self.model = load_model(pathlib.Path(model_dir) /
-                                    'heart_disease_num_features.h5')
         self.ig_enabled = True
         self.is_input_differentiable = True
         self.batch_size = 256
         self.output_columns = output_columns
-        self.input_tensors = self.model.input
-        self.output_tensor = self.model.output
-        self.gradient_tensors = \
-            {'predicted_target':
-                 {self.input_tensors:
-                      tf.gradients(self.output_tensor, self.input_tensors)}}
+        self.sess = None
+        self.resident_bytes = 0
+        self.load_model()
+
+    def load_model(self):
+        if self.sess is not None:
+            return
+        model_dir = pathlib.Path(__file__).parent
+        start_resident = resident_bytes()
+
+        # Each load gets its own graph, so reloading after unload_model
+        # doesn't add a second copy of the model to the default graph.
+        self.graph = tf.Graph()
+        self.sess = tf.Session(graph=self.graph)
+        with self.graph.as_default(), self.sess.as_default():
+            self.model = load_model(pathlib.Path(model_dir) /
+                                    'heart_disease_num_features.h5')
+            self.input_tensors = self.model.input
+            self.output_tensor = self.model.output
+            self.gradient_tensors = \
+                {'predicted_target':
+                     {self.input_tensors:
+                          tf.gradients(self.output_tensor,
+                                       self.input_tensors)}}
         self.input_tensor_to_differentiable_layer_mapping = {
             self.input_tensors: self.input_tensors}
         self.differentiable_tensors = {self.input_tensors: self.input_tensors}
+        self.resident_bytes = (0 if start_resident is None
+                               else max(resident_bytes() - start_resident, 0))
+
+    def unload_model(self):
+        if self.sess is None:
+            return
+        sess = self.sess
+        self.sess = None
+        self.graph = None
+        self.model = None
+        self.resident_bytes = 0
+        sess.close()
+
+    def memory_footprint(self):
+        return self.resident_bytes
 
     def get_feed_dict(self, input_df):
         """
@@ -50,7 +78,7 @@ class MyModel:
     def predict(self, input_df):
         transformed_input_df = self.transform_input(input_df)
 
-        with self.sess.as_default():
+        with self.graph.as_default(), self.sess.as_default():
 
             predictions = self.model.predict(transformed_input_df)
 
@@ -1,7 +1,9 @@
 import logging
 import numpy as np
 import pathlib
-import pickle
+from artifact_cache import acquire_artifact
+from artifact_cache import artifact_footprint
+from artifact_cache import release_artifact
 from bert import tokenization
 from .tf_saved_model_wrapper_ig import TFSavedModelWrapperIg
 from .cover_tokens import cover_tokens
@@ -128,8 +130,8 @@ class TFBertModelIg(TFSavedModelWrapperIg):
             input_tensor_to_differentiable_layer_mapping,
             max_allowed_error=max_allowed_error)
 
-        with open(tokenizer_path, 'rb') as handle:
-            self.tokenizer = pickle.load(handle)
+        self.tokenizer_path = tokenizer_path
+        self.tokenizer = acquire_artifact(tokenizer_path)
 
         # When the word_level_attribution boolean is set to True,
         # the wordpiece attributions from the BERT model are aggregated at
@@ -141,6 +143,25 @@ class TFBertModelIg(TFSavedModelWrapperIg):
         self.max_seq_length = max_seq_length
         self.word_level_attribution = word_level_attribution
 
+    def load_model(self):
+        """Extends load model defined in the TFSavedModelWrapperIg class"""
+        if self.tokenizer is None:
+            self.tokenizer = acquire_artifact(self.tokenizer_path)
+        super().load_model()
+
+    def unload_model(self):
+        """Extends unload model defined in the TFSavedModelWrapperIg class"""
+        super().unload_model()
+        if self.tokenizer is not None:
+            release_artifact(self.tokenizer)
+            self.tokenizer = None
+
+    def memory_footprint(self):
+        footprint = super().memory_footprint()
+        if self.tokenizer is not None:
+            footprint += artifact_footprint(self.tokenizer)
+        return footprint
+
     def transform_input(self, input_df):
         """
         Transform the provided dataframe into one that complies with the input
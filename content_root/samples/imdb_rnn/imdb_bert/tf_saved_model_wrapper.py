@@ -2,6 +2,37 @@ import numpy as np
 import pandas as pd
 import tensorflow as tf
 import logging
+import weakref
+from artifact_cache import acquire_artifact
+from artifact_cache import artifact_footprint
+from artifact_cache import release_artifact
+
+
+def _load_saved_model(saved_model_path):
+    # Its own graph, so closing the session frees the model, instead of
+    # each reload adding another copy to the default graph.
+    sess = tf.Session(graph=tf.Graph())
+    saved_model = tf.saved_model.loader.load(
+        sess=sess, tags=['serve'], export_dir=str(saved_model_path))
+    return sess, saved_model
+
+
+def _close_session(loaded):
+    loaded[0].close()
+
+
+# graph => {key: tensors}. Tensors derived from a shared session's graph are
+# only added to it once, however many wrappers load or reload it.
+_derived_tensors = weakref.WeakKeyDictionary()
+
+
+def derived_tensor(graph, key, build):
+    """Returns `build()`, calling it only once per graph and key."""
+    tensors = _derived_tensors.setdefault(graph, {})
+    if key not in tensors:
+        with graph.as_default():
+            tensors[key] = build()
+    return tensors[key]
 
 
 class TFSavedModelWrapper:
@@ -55,19 +86,23 @@ class TFSavedModelWrapper:
         self.output_tensor = None
         self.sess = None
         self.saved_model = None
+        self._loaded = None
         self.is_binary_classification = is_binary_classification
         self.batch_size = batch_size
 
     def load_model(self):
         """
         Loads the model and creates a session from the saved_model_path
-        provided at initialization.
+        provided at initialization. Does nothing if it is already loaded.
         """
-        # load the model
-        self.sess = tf.Session()
-        self.saved_model = tf.saved_model.loader.load(
-            sess=self.sess, tags=['serve'],
-            export_dir=str(self.saved_model_path))
+        if self._loaded is not None:
+            return
+        # load the model. Wrappers of the same SavedModel (e.g. imdb_rnn and
+        # imdb_rnn_test) share one session.
+        self._loaded = acquire_artifact(
+            self.saved_model_path, _load_saved_model,
+            on_evict=_close_session)
+        self.sess, self.saved_model = self._loaded
 
         # Extract input and output tensors from the signature.
         sig = self.saved_model.signature_def[self.sig_def_key]
@@ -87,7 +122,31 @@ class TFSavedModelWrapper:
             logging.info(f'Output tensor shape is {output_tensor_shape}')
             if len(output_tensor_shape) == 2:
                 if output_tensor_shape[1] == 2:
-                    self.output_tensor = self.output_tensor[:, 1]
+                    output_tensor = self.output_tensor
+                    self.output_tensor = derived_tensor(
+                        self.sess.graph, ('positive_class', output_tensor.name),
+                        lambda: output_tensor[:, 1])
+
+    def unload_model(self):
+        """
+        Releases the session. It is closed once no other wrapper uses it and
+        it is evicted from the artifact cache. `load_model` loads it again.
+        """
+        if self._loaded is None:
+            return
+        loaded = self._loaded
+        self._loaded = None
+        self.sess = None
+        self.saved_model = None
+        self.input_tensors = None
+        self.output_tensor = None
+        release_artifact(loaded)
+
+    def memory_footprint(self):
+        """Returns the approximate resident bytes of the loaded model."""
+        if self._loaded is None:
+            return 0
+        return artifact_footprint(self._loaded)
 
     def transform_input(self, input_df):
         """
@@ -1,9 +1,11 @@
 import numpy as np
 import pathlib
-import pickle
 import logging
 import pandas as pd
 import tensorflow as tf
+from artifact_cache import acquire_artifact
+from artifact_cache import artifact_footprint
+from artifact_cache import release_artifact
 from .cover_tokens import strip_accents_and_special_characters
 from .cover_tokens import word_tokenizer
 from .cover_tokens import cover_tokens_new as cover_tokens
@@ -66,10 +68,30 @@ class MyModel(TFSavedModelWrapperIg):
                          input_tensor_to_differentiable_layer_mapping=
                          input_tensor_to_differentiable_layer_mapping,
                          max_allowed_error=max_allowed_error)
-        with open(tokenizer_path, 'rb') as handle:
-            self.tokenizer = pickle.load(handle)
+        # imdb_rnn_test loads the same tokenizer, share it.
+        self.tokenizer_path = tokenizer_path
+        self.tokenizer = acquire_artifact(tokenizer_path)
         self.max_seq_length = 512
 
+    def load_model(self):
+        """Extends load model defined in the TFSavedModelWrapperIg class"""
+        if self.tokenizer is None:
+            self.tokenizer = acquire_artifact(self.tokenizer_path)
+        super().load_model()
+
+    def unload_model(self):
+        """Extends unload model defined in the TFSavedModelWrapperIg class"""
+        super().unload_model()
+        if self.tokenizer is not None:
+            release_artifact(self.tokenizer)
+            self.tokenizer = None
+
+    def memory_footprint(self):
+        footprint = super().memory_footprint()
+        if self.tokenizer is not None:
+            footprint += artifact_footprint(self.tokenizer)
+        return footprint
+
     def transform_input(self, input_df):
         """
         Transform the provided dataframe into one that complies with the input
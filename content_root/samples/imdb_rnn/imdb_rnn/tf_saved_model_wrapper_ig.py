@@ -1,4 +1,5 @@
 from .tf_saved_model_wrapper import TFSavedModelWrapper
+from .tf_saved_model_wrapper import derived_tensor
 import tensorflow as tf
 import logging
 
@@ -100,6 +101,8 @@ class TFSavedModelWrapperIg(TFSavedModelWrapper):
 
     def load_model(self):
         """Extends load model defined in the TFSavedModelWrapper class"""
+        if self._loaded is not None:
+            return
         super().load_model()
 
         for key, tensor_info in self.input_tensors.items():
@@ -132,13 +135,30 @@ class TFSavedModelWrapperIg(TFSavedModelWrapper):
             self.gradient_tensors[self.output_columns[0]] = {}
             for key, tensor in self.differentiable_tensors.items():
                 self.gradient_tensors[self.output_columns[0]][key] = \
-                    tf.gradients(self.output_tensor, tensor)
+                    self._gradients(self.output_tensor, tensor)
         else:
             for index, column in enumerate(self.output_columns):
                 self.gradient_tensors[column] = {}
                 for key, tensor in self.differentiable_tensors.items():
                     self.gradient_tensors[column][key] = \
-                        tf.gradients(self.output_tensor[:, index], tensor)
+                        self._gradients(self.output_tensor, tensor, index)
+
+    def _gradients(self, output_tensor, tensor, index=None):
+        # Added to the graph once, as wrappers may share the session.
+        def build():
+            output = output_tensor if index is None else \
+                output_tensor[:, index]
+            return tf.gradients(output, tensor)
+        return derived_tensor(self.sess.graph,
+                              ('gradients', output_tensor.name, index,
+                               tensor.name),
+                              build)
+
+    def unload_model(self):
+        """Extends unload model defined in the TFSavedModelWrapper class"""
+        super().unload_model()
+        self.differentiable_tensors = {}
+        self.gradient_tensors = {}
 
     def generate_baseline(self, input_df):
         """
@@ -1,9 +1,61 @@
 import pandas as pd
 import requests
-from io import StringIO
+import yaml
+from concurrent.futures import ThreadPoolExecutor
+from io import BytesIO
+from pathlib import Path
+from requests.adapters import HTTPAdapter
+
+from pmml_tree_model import PMMLTreeModel
+from prediction_cache import PredictionCache
+
+PACKAGE_DIR = Path(__file__).parent
+MODEL_YAML_PATH = PACKAGE_DIR / 'model.yaml'
+PMML_PATH = PACKAGE_DIR / 'DecisionTreeIris.pmml'
+
+# Openscoring response columns that are not model outputs.
+DROPPED_COLUMNS = ['Species', 'Node_Id']
+# The model outputs in openscoring responses, in the order of the
+# DecisionTreeIris.pmml output fields.
+OUTPUT_COLUMNS = ['Probability_setosa', 'Probability_versicolor',
+                  'Probability_virginica']
+# The inputs declared in model.yaml => the DecisionTreeIris.pmml fields
+# they are scored as.
+PMML_FIELDS = {'sepal length (cm)': 'Sepal_Length',
+               'sepal width (cm)': 'Sepal_Width',
+               'petal length (cm)': 'Petal_Length',
+               'petal width (cm)': 'Petal_Width'}
 
 
 class IrisPMMLModel:
+    """Scores rows on an openscoring server, configured by the `openscoring`
+    section of model.yaml. With `in_process: true` there, the PMML model is
+    evaluated in this process instead, with the same output columns."""
+
+    def __init__(self, model_yaml_config=MODEL_YAML_PATH):
+        with open(model_yaml_config) as f:
+            config = yaml.safe_load(f)['model']['openscoring']
+        # Replace the URL in model.yaml with your openscoring endpoint.
+        self.url = config['url']
+        self.timeout = (config.get('connect_timeout', 5),
+                        config.get('read_timeout', 60))
+        # Larger inputs are split into chunks of this many rows, and up to
+        # max_concurrent_requests of them are scored at a time.
+        self.max_rows_per_request = config.get('max_rows_per_request', 10000)
+        self.max_concurrent_requests = config.get('max_concurrent_requests',
+                                                  1)
+        self.prediction_cache = PredictionCache.from_config(
+            config.get('prediction_cache', None), self.url)
+        self.evaluator = (PMMLTreeModel(PMML_PATH)
+                          if config.get('in_process', False) else None)
+
+        # Connections are kept alive and reused across requests.
+        self.session = requests.Session()
+        self.session.headers['Content-type'] = 'text/plain; charset=UTF-8'
+        adapter = HTTPAdapter(pool_maxsize=self.max_concurrent_requests)
+        self.session.mount('http://', adapter)
+        self.session.mount('https://', adapter)
+        self._pool = None
 
     def load_model(self):
         pass
@@ -12,24 +64,53 @@ class IrisPMMLModel:
         return input_df
 
     def predict(self, input_df):
-        # convert input to csv
-        csv_input = input_df.to_csv()
-
-        # call openscoring server,
-        # replace this URL with your openscoring endpoint
-        OPEN_SCORING_URL = 'http://host.docker.internal:8080/' \
-                           'openscoring/model/DecisionTreeIris/csv'
-        headers = {'Content-type': 'text/plain; charset=UTF-8'}
-        res = requests.post(
-            OPEN_SCORING_URL,
-            data=csv_input,
-            headers=headers
+        if self.prediction_cache is None:
+            return self._predict(input_df)
+        return self.prediction_cache.predict(input_df, self._predict)
+
+    def _predict(self, input_df):
+        input_df = self._pmml_inputs(input_df)
+        if len(input_df) == 0:
+            return pd.DataFrame(columns=OUTPUT_COLUMNS, dtype=float)
+        if self.evaluator is not None:
+            return self.evaluator.evaluate(input_df).drop(
+                columns=DROPPED_COLUMNS)
+        chunks = [input_df.iloc[start:start + self.max_rows_per_request]
+                  for start in range(0, len(input_df),
+                                     self.max_rows_per_request)]
+        if len(chunks) <= 1 or self.max_concurrent_requests <= 1:
+            results = [self._predict_chunk(chunk) for chunk in chunks]
+        else:
+            results = list(self._get_pool().map(self._predict_chunk, chunks))
+        return pd.concat(results, ignore_index=True)
+
+    @staticmethod
+    def _pmml_inputs(input_df):
+        """Returns the model.yaml inputs of `input_df` renamed to the PMML
+        fields, which both openscoring and the evaluator match by name."""
+        missing = [column for column in PMML_FIELDS
+                   if column not in input_df]
+        if missing:
+            raise ValueError(f'Input is missing the columns {missing}')
+        return input_df[list(PMML_FIELDS)].rename(columns=PMML_FIELDS)
+
+    def _get_pool(self):
+        if self._pool is None:
+            self._pool = ThreadPoolExecutor(self.max_concurrent_requests)
+        return self._pool
+
+    def _predict_chunk(self, input_df):
+        res = self.session.post(
+            self.url,
+            data=input_df.to_csv(index=False).encode(),
+            timeout=self.timeout
         )
+        res.raise_for_status()
 
         # Drop extra columns from openscoring response
-        df = pd.read_csv(StringIO(res.text), sep=',')
-        df.drop(columns=['Species', 'Node_Id'], inplace=True)
-        return df
+        return pd.read_csv(BytesIO(res.content), sep=',',
+                           usecols=lambda column:
+                           column not in DROPPED_COLUMNS)
 
 
 def get_model_class():
@@ -1,6 +1,11 @@
 """Custom feature transformation implemented in Python!"""
+import copy
+import warnings
+
+import numpy as np
 import pandas as pd
 import pandas.api.types
+import scipy.sparse
 import sklearn.preprocessing
 
 
@@ -37,6 +42,12 @@ class CustomFeatureTransformer:
 
         5. Categorical variables are one-hot encoded. Missing values are
         counted as a distinct level.
+
+        The one-hot vocabulary is fixed at `fit` time, so the output of
+        `transform` always has the same columns in the same order
+        (`output_cols_in_order`), no matter which levels or dtypes show up in
+        a given batch. Levels unseen at fit time encode as all zeros, just
+        like missing values.
         """
         if missing not in ('sentinel', 'impute'):
             raise ValueError('"missing" must either be '
@@ -51,47 +62,261 @@ class CustomFeatureTransformer:
         self.adjusted_categoricals = {}
         self.is_fit = False
         self.continuous_cols_in_order = None
+        self.categorical_levels = None
+        self.output_cols_in_order = None
+        self._layout = None
+        self._fit_stats = None
+
+    def __setstate__(self, state):
+        # transformers pickled before the one-hot vocabulary was recorded at
+        # fit time have no `categorical_levels`; they keep the old
+        # batch-dependent `transform`.
+        state.setdefault('categorical_levels', None)
+        state.setdefault('output_cols_in_order', None)
+        state.setdefault('_layout', None)
+        state.setdefault('_fit_stats', None)
+        self.__dict__.update(state)
+        if self._layout is None and self.categorical_levels is not None:
+            self._build_layout()
 
     def fit(self, df):
-        # first, binarize features
+        self._fit_stats = None
+        self.partial_fit(df)
+        self.finalize_fit()
+
+    def partial_fit(self, df):
+        """Accumulates the statistics `fit` needs from one chunk of the
+        training data: zero and missing counts and standard scaler moments
+        for continuous columns, and level frequencies for categoricals.
+
+        Call `finalize_fit` once every chunk has been seen; chunks passed
+        after that start a new fit. See `fit_csv` for fitting on a file that
+        does not fit in memory."""
         continuous_df = df.select_dtypes(['float', 'int'])
+        categorical_df = df.select_dtypes(['category'])
+
+        stats = getattr(self, '_fit_stats', None)
+        if stats is None:
+            stats = self._fit_stats = {
+                'num_rows': 0,
+                'zero_counts': pd.Series(0, index=continuous_df.columns),
+                'missing_counts': pd.Series(0, index=continuous_df.columns),
+                'scaler': sklearn.preprocessing.StandardScaler(),
+                'level_counts': {
+                    name: pd.Series(0, index=values.cat.categories)
+                    for name, values in categorical_df.items()},
+            }
+        if (continuous_df.columns.tolist()
+                != stats['zero_counts'].index.tolist()):
+            raise ValueError('Continuous columns of this chunk do not match '
+                             'the ones seen in previous chunks')
+
+        stats['num_rows'] += len(df)
+        stats['zero_counts'] += continuous_df.eq(0).sum()
+        stats['missing_counts'] += continuous_df.isna().sum()
+        stats['scaler'].partial_fit(continuous_df)
+        for name, counts in stats['level_counts'].items():
+            # value_counts on a categorical includes unseen levels as zeros
+            stats['level_counts'][name] = counts.add(
+                df[name].value_counts(), fill_value=0)
+
+        self.is_fit = False
+
+    def finalize_fit(self):
+        """Decides binarized, dropped and trimmed features from the
+        statistics accumulated by `partial_fit`."""
+        stats = getattr(self, '_fit_stats', None)
+        if stats is None or stats['num_rows'] == 0:
+            raise Exception('Must partial_fit at least one chunk first!')
+        num_rows = stats['num_rows']
+        continuous_cols = stats['zero_counts'].index
+
+        # first, binarize features
         if self.binarize_threshold is not None:
-            self.binarized_fields = [name
-                                     for name, values
-                                     in continuous_df.iteritems()
-                                     if (values.eq(0).mean()
-                                         > self.binarize_threshold)]
-            continuous_df = continuous_df.drop(columns=self.binarized_fields)
+            should_binarize = (stats['zero_counts'] / num_rows
+                               > self.binarize_threshold)
+            self.binarized_fields = continuous_cols[should_binarize].tolist()
+            continuous_cols = continuous_cols[~should_binarize.values]
 
         # then rescale the rest
         if self.missing == 'impute':
-            should_drop = (continuous_df.isna().mean()
+            should_drop = (stats['missing_counts'][continuous_cols] / num_rows
                            > self.missing_drop_threshold)
-            drop_features = continuous_df.columns[should_drop]
-            continuous_df = continuous_df.drop(columns=drop_features)
-        self.continuous_cols_in_order = continuous_df.columns.tolist()
-        self.scaler.fit(continuous_df)
+            continuous_cols = continuous_cols[~should_drop.values]
+        self.continuous_cols_in_order = continuous_cols.tolist()
+        self.scaler = _select_scaler_columns(
+            stats['scaler'],
+            stats['zero_counts'].index.get_indexer(continuous_cols))
 
         # lastly learn how to clip the categorical variables
+        self.adjusted_categoricals = {}
         if self.categorical_trim is not None:
             for name, threshold in self.categorical_trim.items():
-                value_counts = df[name].value_counts(normalize=True)
+                counts = stats['level_counts'][name]
+                value_counts = counts / counts.sum()
                 drop_levels = set(value_counts[value_counts < threshold].index)
-                remaining_levels = list(
-                    set(df[name].cat.categories) - drop_levels)
+                # in the order of the training categories, so refitting
+                # gives the same layout
+                remaining_levels = [level for level in counts.index
+                                    if level not in drop_levels]
                 self.adjusted_categoricals[
                     name] = pandas.api.types.CategoricalDtype(remaining_levels)
 
+        # record the one-hot vocabulary so every batch gets the same layout
+        self.categorical_levels = {}
+        for name, counts in stats['level_counts'].items():
+            if name in self.adjusted_categoricals:
+                levels = self.adjusted_categoricals[name].categories
+            else:
+                levels = counts.index
+            self.categorical_levels[name] = levels.tolist()
+
+        self._build_layout()
         self.is_fit = True
+        # not pickled with the fitted transformer, and a later
+        # partial_fit starts a new fit
+        self._fit_stats = None
+
+    def fit_csv(self, path, categorical_columns=(), chunksize=100000,
+                **read_csv_kwargs):
+        """Fits on a CSV file in chunks of `chunksize` rows, so the training
+        data never has to be held in memory at once.
+
+        `categorical_columns` are read with the 'category' dtype; any other
+        keyword arguments (e.g. `usecols`) are passed to `pd.read_csv`."""
+        dtype = dict(read_csv_kwargs.pop('dtype', None) or {})
+        for name in categorical_columns:
+            dtype.setdefault(name, 'category')
+
+        self._fit_stats = None
+        for chunk in pd.read_csv(path, chunksize=chunksize, dtype=dtype,
+                                 **read_csv_kwargs):
+            self.partial_fit(chunk)
+        self.finalize_fit()
+
+    def _build_layout(self):
+        """Precomputes the fixed output column order and, for every input
+        column, the output positions it is written to."""
+        binarized_fields = self.binarized_fields or []
+        binarized_names = ['nonzero_' + name for name in binarized_fields]
+        continuous_names = list(self.continuous_cols_in_order)
+        dummy_names = [f'{name}_{level}'
+                       for name, levels in self.categorical_levels.items()
+                       for level in levels]
+
+        # each piece is alphabetized on its own, as `get_dummies` output was
+        binarized_order = sorted(binarized_names)
+        continuous_order = sorted(continuous_names)
+        dummy_order = sorted(dummy_names)
+        self.output_cols_in_order = (binarized_order + continuous_order
+                                     + dummy_order)
+        position = {col: i for i, col in enumerate(self.output_cols_in_order)}
+
+        self._layout = {
+            'num_dense': len(binarized_order) + len(continuous_order),
+            'binarized': np.array([position[col] for col in binarized_names],
+                                  dtype=np.intp),
+            'continuous': np.array([position[col]
+                                    for col in continuous_names],
+                                   dtype=np.intp),
+            'categorical': {
+                name: np.array([position[f'{name}_{level}']
+                                for level in levels], dtype=np.intp)
+                for name, levels in self.categorical_levels.items()},
+        }
 
     def transform(self, df):
         if not self.is_fit:
             raise Exception('Must fit first!')
 
+        if self.categorical_levels is None:
+            return self._transform_frame(df)
+
+        return pd.DataFrame(self.transform_array(df),
+                            index=df.index,
+                            columns=self.output_cols_in_order)
+
+    def transform_array(self, df, sparse=False):
+        """Like `transform`, but returns a float ndarray laid out as
+        `output_cols_in_order` without building any intermediate frames.
+
+        If `sparse` is True a `scipy.sparse.csr_matrix` is returned instead,
+        so memory scales with the number of nonzeros rather than with the
+        width of the one-hot encoding. Transformers pickled without a
+        one-hot vocabulary still build the dense frame first, so they gain
+        nothing from `sparse`."""
+        if not self.is_fit:
+            raise Exception('Must fit first!')
+
+        if self.categorical_levels is None:
+            if sparse:
+                warnings.warn('This transformer was fit without a fixed '
+                              'one-hot vocabulary, so sparse output is '
+                              'converted from a dense frame; refit it to '
+                              'benefit from sparse=True', RuntimeWarning,
+                              stacklevel=2)
+            result = self._transform_frame(df).to_numpy(dtype=float)
+            return scipy.sparse.csr_matrix(result) if sparse else result
+
+        layout = self._layout
+        num_rows = len(df)
+        num_dense = layout['num_dense']
+
+        # binarized and continuous columns come first in the output layout
+        dense = np.empty((num_rows, num_dense))
+
+        # first, binarize features
+        if self.binarized_fields:
+            dense[:, layout['binarized']] = (
+                df[self.binarized_fields].fillna(0).ne(0).to_numpy())
+
+        # next rescale / fill in NaNs for continuous variables
+        scaled = self.scaler.transform(df[self.continuous_cols_in_order])
+        if self.missing == 'sentinel':
+            scaled[np.isnan(scaled)] = self.sentinel_value
+        elif self.missing == 'impute':
+            scaled[np.isnan(scaled)] = 0
+        dense[:, layout['continuous']] = scaled
+
+        # lastly one-hot encode categorical variables; missing and unknown
+        # levels get code -1 and leave their row all zeros
+        one_hot_rows = []
+        one_hot_cols = []
+        for name, positions in layout['categorical'].items():
+            codes = self._category_codes(df[name], name)
+            rows = np.flatnonzero(codes >= 0)
+            one_hot_rows.append(rows)
+            one_hot_cols.append(positions[codes[rows]])
+        one_hot_rows = np.concatenate(one_hot_rows or [[]]).astype(np.intp)
+        one_hot_cols = np.concatenate(one_hot_cols or [[]]).astype(np.intp)
+
+        num_cols = len(self.output_cols_in_order)
+        if not sparse:
+            result = np.zeros((num_rows, num_cols))
+            result[:, :num_dense] = dense
+            result[one_hot_rows, one_hot_cols] = 1
+            return result
+
+        one_hot = scipy.sparse.csr_matrix(
+            (np.ones(len(one_hot_rows)),
+             (one_hot_rows, one_hot_cols - num_dense)),
+            shape=(num_rows, num_cols - num_dense))
+        return scipy.sparse.hstack([scipy.sparse.csr_matrix(dense), one_hot],
+                                   format='csr')
+
+    def _category_codes(self, values, name):
+        levels = self.categorical_levels[name]
+        if (isinstance(values.dtype, pandas.api.types.CategoricalDtype)
+                and values.cat.categories.tolist() == levels):
+            return np.asarray(values.cat.codes)
+        # -1 for missing values and levels unseen at fit time
+        return pd.Index(levels).get_indexer(values)
+
+    def _transform_frame(self, df):
         result_pieces = []
 
         # first, binarize features
-        if len(self.binarized_fields) != 0:
+        if self.binarized_fields:
             binarized = (df[self.binarized_fields]
                          .fillna(0)
                          .ne(0)
@@ -101,7 +326,8 @@ class CustomFeatureTransformer:
             result_pieces.append(binarized)
 
         # next rescale / fill in NaNs for continuous variables
-        scaled_continuous = df[self.continuous_cols_in_order].copy()
+        # int columns are scaled too, so copy them as floats
+        scaled_continuous = df[self.continuous_cols_in_order].astype(float)
         scaled_continuous[:] = self.scaler.transform(scaled_continuous)
         if self.missing == 'sentinel':
             scaled_continuous.fillna(self.sentinel_value, inplace=True)
@@ -124,3 +350,17 @@ class CustomFeatureTransformer:
                          for piece in result_pieces],
                         axis=1)
         return res
+
+
+def _select_scaler_columns(scaler, columns):
+    """Returns a copy of the fitted `scaler` that only scales the features at
+    positions `columns`."""
+    scaler = copy.deepcopy(scaler)
+    for attr in ('mean_', 'var_', 'scale_', 'feature_names_in_'):
+        if getattr(scaler, attr, None) is not None:
+            setattr(scaler, attr, getattr(scaler, attr)[columns])
+    if np.ndim(scaler.n_samples_seen_) > 0:
+        scaler.n_samples_seen_ = scaler.n_samples_seen_[columns]
+    if hasattr(scaler, 'n_features_in_'):
+        scaler.n_features_in_ = len(columns)
+    return scaler
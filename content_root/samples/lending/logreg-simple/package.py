@@ -21,4 +21,7 @@ def get_model():
     return SimpleSklearnModel(
         PACKAGE_PATH / MODEL_FILE_NAME, PRED_COLUMN_NAMES,
         path_to_serialized_transformer=PACKAGE_PATH / TRANSFORMER_FILE_NAME,
+        # The shipped transformer predates the fixed one-hot vocabulary, so
+        # sparse_features would only add a dense-to-CSR conversion. Turn it
+        # on once the transformer is refit.
         is_classifier=True)
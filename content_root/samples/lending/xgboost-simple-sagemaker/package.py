@@ -3,7 +3,10 @@ import os
 from .sagemaker_xgboost_predictor import SageMakerXGBoostPredictor
 
 PACKAGE_DIR = os.path.dirname(__file__)
-SAGE_MAKER_XGB_MODEL_PATH = os.path.join(PACKAGE_DIR, 'xgboost-model')
+# xgboost's JSON model format, converted from the pickled 'xgboost-model'
+# that sagemaker produced, so it loads without unpickling and in newer
+# xgboost (1.0 or later).
+SAGE_MAKER_XGB_MODEL_PATH = os.path.join(PACKAGE_DIR, 'xgboost-model.json')
 
 
 def get_model():
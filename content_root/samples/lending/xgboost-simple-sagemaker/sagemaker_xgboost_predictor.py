@@ -1,37 +1,141 @@
 import logging
+import numpy as np
 import os
 import pandas as pd
 import pickle as pkl
+import sys
+import time
 import xgboost as xgb
 
+from artifact_cache import acquire_artifact
+from artifact_cache import artifact_footprint
+from artifact_cache import release_artifact
+from artifact_cache import resident_bytes
+
+LOG = logging.getLogger(__name__)
+
+# Files with these suffixes are in xgboost's own model format. Anything else
+# (e.g. sagemaker's 'xgboost-model') is a pickled Booster.
+NATIVE_MODEL_SUFFIXES = ('.bin', '.json', '.ubj')
+
+
+def load_booster(model_path, nthread=None):
+    """Loads a Booster saved with `Booster.save_model` or pickled.
+
+    Native models are parsed by xgboost straight from the file, without
+    unpickling a Python wrapper, and load in any later xgboost version. They
+    do not carry feature names, so inputs are matched by position.
+
+    :param nthread: Number of threads the booster predicts with. None keeps
+        xgboost's default (all cores).
+    """
+    if os.path.splitext(model_path)[1] in NATIVE_MODEL_SUFFIXES:
+        booster = xgb.Booster(model_file=model_path)
+    else:
+        with open(model_path, 'rb') as infile:
+            booster = pkl.load(infile)
+    if nthread is not None:
+        booster.set_param({'nthread': nthread})
+    return booster
+
+
+def save_native_model(model_path, native_path=None):
+    """Re-saves a Booster in the native format given by the suffix of
+    `native_path`, by default xgboost's JSON format, and returns the new
+    path. xgboost 1.0 or later is needed to write and read JSON; the legacy
+    binary format ('.bin') is deprecated."""
+    if native_path is None:
+        native_path = os.path.splitext(model_path)[0] + '.json'
+    load_booster(model_path).save_model(native_path)
+    return native_path
+
 
 class SageMakerXGBoostPredictor:
     """An XGBoost predictor for a sagemaker xgboost saved model.
        This loads the predictor once and runs for each call to predict.
     """
 
-    def __init__(self, model_path, output_column=None):
+    def __init__(self, model_path, output_column=None, nthread=None):
         """
-        :param model_path: The directory where the model is saved.
+        :param model_path: Path to the model, either in xgboost's native
+            format (see `NATIVE_MODEL_SUFFIXES`) or a pickled Booster.
         :param output_column: list of column name(s) for the output.
+        :param nthread: Number of threads xgboost uses for prediction.
+            Defaults to xgboost's own default (all cores).
         """
         self.model_path = model_path
         self.output_column = output_column
+        self.nthread = nthread
+        self.model = None
+        self.load_model()
+
+    def load_model(self):
+        """Loads the booster. Called on construction, and again to reload it
+        after `unload_model`."""
+        if self.model is not None:
+            return
+        start_time = time.perf_counter()
+        start_resident = resident_bytes()
+        # Shared with other predictors loading an identical file with the
+        # same nthread, and with forked workers, which inherit it
+        # copy-on-write. nthread is a setting of the booster itself, so it
+        # is part of the cache key rather than set on a shared booster.
+        self.model = acquire_artifact(self.model_path, load_booster,
+                                      nthread=self.nthread)
+        self.load_seconds = time.perf_counter() - start_time
+        self.resident_bytes = (None if start_resident is None
+                               else resident_bytes() - start_resident)
+        LOG.info(f'Loaded {self.model_path} in {self.load_seconds:.3f}s, '
+                 f'resident size grew by {self.resident_bytes} bytes')
+
+        # Inputs are matched to the booster's features by name when they
+        # carry them, otherwise by position (sagemaker names them f0, f1..).
+        self.feature_names = self.model.feature_names
+        self._feature_name_set = set(self.feature_names or ())
+        # Booster.inplace_predict is available from xgboost 1.1 on.
+        self._inplace = hasattr(self.model, 'inplace_predict')
+
+    def unload_model(self):
+        """Releases the booster."""
+        if self.model is not None:
+            release_artifact(self.model)
+            self.model = None
+
+    def memory_footprint(self):
+        """Returns the approximate resident bytes of the loaded booster."""
+        if self.model is None:
+            return 0
+        return artifact_footprint(self.model)
 
-        self.model = pkl.load(open(self.model_path, 'rb'))
+    def _features(self, input_df):
+        # Native models carry no feature names and are always positional.
+        if self.feature_names is not None:
+            if self._feature_name_set.issubset(input_df.columns):
+                input_df = input_df[self.feature_names]
+            elif input_df.shape[1] != len(self.feature_names):
+                raise ValueError(f'Expected {len(self.feature_names)} input '
+                                 f'columns, got {input_df.shape[1]}')
+        return np.ascontiguousarray(input_df.to_numpy(dtype=np.float32))
 
     def predict(self, input_df):
-        input_df.columns = self.model.feature_names
-        dtest = xgb.DMatrix(input_df)
-        pred = self.model.predict(dtest)
+        features = self._features(input_df)
+        if self._inplace:
+            # No DMatrix copy, and the caller's frame is left untouched.
+            pred = self.model.inplace_predict(features)
+        else:
+            dtest = xgb.DMatrix(features, feature_names=self.feature_names,
+                                nthread=self.nthread)
+            pred = self.model.predict(dtest)
         return pd.DataFrame(pred, columns=self.output_column)
 
 
-# Manual testing.
+# Manual testing. To convert a model to the native format (see readme.txt):
+#   python sagemaker_xgboost_predictor.py --convert xgboost-model [out.json]
 def main():
     input_df = pd.read_csv('lending_test_package.csv', index_col=0)
     input_df = input_df.drop(columns=['loan_status'])
-    model_path = os.path.join(os.path.dirname(__file__), 'xgboost-model')
+    model_path = os.path.join(os.path.dirname(__file__),
+                              'xgboost-model.json')
     model = SageMakerXGBoostPredictor(model_path,
                                       output_column=['loan_status'])
     result = model.predict(input_df)
@@ -41,4 +145,7 @@ def main():
 if __name__ == '__main__':
     logging.basicConfig(level=logging.INFO,
                         format='%(asctime)s %(levelname)-7s: %(message)s')
-    main()
+    if len(sys.argv) in (3, 4) and sys.argv[1] == '--convert':
+        print(save_native_model(*sys.argv[2:]))
+    else:
+        main()
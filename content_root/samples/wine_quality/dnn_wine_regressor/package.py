@@ -1,9 +1,14 @@
 import os
 
+import yaml
+
 from .tensor_flow_predictor import TensorFlowPredictor
 
 PACKAGE_DIR = os.path.dirname(__file__)
 DNN_MODEL_DIR = os.path.join(PACKAGE_DIR, 'dnn_model')
+MODEL_YAML_PATH = os.path.join(PACKAGE_DIR, 'model.yaml')
+# Larger inputs are predicted in batches of this many rows.
+BATCH_SIZE = 32768
 
 def get_model():
     """ This function is called by the Fiddler executor to instantiate a model predictor.
@@ -20,6 +25,24 @@ class Model():
     def predict(self, input_df):
         return self.tf_predictor.predict(input_df)
 
-    def __init__(self):
-        self.tf_predictor = TensorFlowPredictor(DNN_MODEL_DIR,
-                                                ['predicted_quality'])
+    def load_model(self):
+        self.tf_predictor.load_model()
+
+    def unload_model(self):
+        self.tf_predictor.unload_model()
+
+    def memory_footprint(self):
+        return self.tf_predictor.memory_footprint()
+
+    def __init__(self, model_yaml_config=MODEL_YAML_PATH):
+        with open(model_yaml_config) as f:
+            config = yaml.safe_load(f)['model'].get('tensorflow', {})
+        # The frozen and optimized graph of dnn_model, written on first load.
+        # Relative paths are relative to this package.
+        optimized_graph_path = config.get('optimized_graph_path')
+        if optimized_graph_path is not None:
+            optimized_graph_path = os.path.join(PACKAGE_DIR,
+                                                optimized_graph_path)
+        self.tf_predictor = TensorFlowPredictor(
+            DNN_MODEL_DIR, ['predicted_quality'], batch_size=BATCH_SIZE,
+            optimized_graph_path=optimized_graph_path)
@@ -1,12 +1,26 @@
 import logging
 import os
+import numpy as np
 import pandas as pd
 import re
+import time
+from collections import OrderedDict
 
+from tensorflow.core.framework import graph_pb2
+from tensorflow.core.protobuf import config_pb2
+from tensorflow.core.protobuf import rewriter_config_pb2
 from tensorflow.python.client import session
+from tensorflow.python.framework import dtypes
+from tensorflow.python.framework import graph_util
+from tensorflow.python.framework import importer
 from tensorflow.python.framework import ops as ops_lib
+from tensorflow.python.grappler import tf_optimizer
 from tensorflow.python.saved_model import loader
 from tensorflow.python.tools import saved_model_utils
+from tensorflow.python.training import saver
+
+from artifact_cache import file_key
+from artifact_cache import resident_bytes
 
 # Default signature def key and tag for TensorFlow serving.
 # These could be made configurable for more custom saved models.
@@ -17,6 +31,14 @@ DEFAULT_TAG = 'serve'
 # We might need to support more custom forms of outputs, in addition to default for serving.
 DEFAULT_OUTPUT_KEY = 'predictions'
 
+# Grappler passes applied to the frozen graph.
+GRAPH_OPTIMIZERS = ['constfold', 'arithmetic', 'dependency']
+
+# Feeds are kept for this many distinct sets of input columns.
+MAX_FEED_LAYOUTS = 16
+
+LOG = logging.getLogger(__name__)
+
 
 class TensorFlowPredictor:
     """A TensorFlow predictor for saved model.
@@ -28,7 +50,8 @@ class TensorFlowPredictor:
     # saved modes. For more information see
     # https://www.tensorflow.org/guide/saved_model#cli_to_inspect_and_execute_savedmodel
 
-    def __init__(self, model_dir, output_columns=None):
+    def __init__(self, model_dir, output_columns=None, batch_size=None,
+                 optimized_graph_path=None):
         """
         :param model_dir: The directory where the model is saved.
         :param output_columns: List of column names for the output.
@@ -36,9 +59,25 @@ class TensorFlowPredictor:
                 containing all the predictions as a 2-d numpy array where number of columns
                 is expected number of outputs for each input tuple. 'output_columns' provides
                 names for each of the columns. If it is None, default names are assigned.
+        :param batch_size: Maximum number of rows fed to the session at once.
+                Larger inputs are predicted in batches of this size. If it is None,
+                all rows are fed at once.
+        :param optimized_graph_path: If set, the saved model is frozen (variables
+                converted to constants), pruned to the predictions output and
+                optimized by grappler, and the resulting GraphDef is saved to this
+                path, with the size and modification time of the saved model
+                (variables included) in a `.key` file next to it. Later instances
+                load the saved GraphDef instead, as long as the saved model is
+                unchanged. If the directory is not writable, the graph is
+                optimized on every load instead.
         """
         self.model_dir = model_dir
         self.output_columns = output_columns
+        self.batch_size = batch_size
+        # Column names tuple => [(column, tensor name, numpy dtype)], for
+        # the MAX_FEED_LAYOUTS most recently used sets of columns, least
+        # recently used first.
+        self._feeds = OrderedDict()
 
         self.meta_graph_def = saved_model_utils.get_meta_graph_def(
             self.model_dir,
@@ -73,31 +112,161 @@ class TensorFlowPredictor:
             self.output_columns = [f'prediction_{i}' for i in
                                    range(output_shape[1])]
 
-        self.sess = session.Session(None, graph=ops_lib.Graph())
-        loader.load(self.sess, [DEFAULT_TAG], self.model_dir)
+        self.optimized_graph_path = optimized_graph_path
+        self.sess = None
+        self.resident_bytes = 0
+        self.load_model()
+
+    def load_model(self):
+        """Creates the session. Called on construction, and again to reload
+        the model after `unload_model`."""
+        if self.sess is not None:
+            return
+        start_time = time.perf_counter()
+        start_resident = resident_bytes()
+        if self.optimized_graph_path is None:
+            self.sess = session.Session(None, graph=ops_lib.Graph())
+            loader.load(self.sess, [DEFAULT_TAG], self.model_dir)
+        else:
+            self.sess = self._load_optimized_graph(self.optimized_graph_path)
+        self.load_seconds = time.perf_counter() - start_time
+        self.resident_bytes = (0 if start_resident is None
+                               else max(resident_bytes() - start_resident, 0))
+        LOG.info(f'Loaded {self.model_dir} in {self.load_seconds:.3f}s, '
+                 f'resident size grew by {self.resident_bytes} bytes')
+
+    def _load_optimized_graph(self, optimized_graph_path):
+        # The saved model as it is now, including variables/.
+        _, size, mtime_ns = file_key(self.model_dir)
+        model_key = f'{size} {mtime_ns}'
+        graph_def = self._read_optimized_graph(optimized_graph_path,
+                                               model_key)
+        if graph_def is None:
+            graph_def = self._optimize_graph()
+            self._save_optimized_graph(graph_def, optimized_graph_path,
+                                       model_key)
+
+        graph = ops_lib.Graph()
+        with graph.as_default():
+            # Tensor names are kept, so the signature still applies.
+            importer.import_graph_def(graph_def, name='')
+        return session.Session(None, graph=graph)
+
+    @staticmethod
+    def _read_optimized_graph(optimized_graph_path, model_key):
+        """Returns the GraphDef saved at `optimized_graph_path` if it was
+        built from the saved model with `model_key`, else None."""
+        try:
+            with open(f'{optimized_graph_path}.key') as f:
+                if f.read() != model_key:
+                    return None
+            graph_def = graph_pb2.GraphDef()
+            with open(optimized_graph_path, 'rb') as f:
+                graph_def.ParseFromString(f.read())
+            return graph_def
+        except OSError:
+            return None
+
+    @staticmethod
+    def _save_optimized_graph(graph_def, optimized_graph_path, model_key):
+        directory = os.path.dirname(os.path.abspath(optimized_graph_path))
+        if not os.access(directory, os.W_OK):
+            LOG.info(f'{directory} is not writable, so the optimized graph '
+                     f'is not saved')
+            return
+        try:
+            # The graph goes first, so its key never names an older graph.
+            # Both are written under a temporary name first, so that
+            # concurrent loads never read a partial file.
+            for path, data in [
+                    (optimized_graph_path, graph_def.SerializeToString()),
+                    (f'{optimized_graph_path}.key', model_key.encode())]:
+                tmp_path = f'{path}.{os.getpid()}.tmp'
+                with open(tmp_path, 'wb') as f:
+                    f.write(data)
+                os.replace(tmp_path, path)
+        except OSError as e:
+            LOG.warning(f'Could not save optimized graph to '
+                        f'{optimized_graph_path}: {e}')
+
+    def _optimize_graph(self):
+        """Returns the frozen GraphDef of the saved model, pruned to the
+        output tensor and optimized by grappler."""
+        output_op = self.output_tensor.name.split(':')[0]
+        with session.Session(None, graph=ops_lib.Graph()) as sess:
+            loader.load(sess, [DEFAULT_TAG], self.model_dir)
+            frozen = graph_util.convert_variables_to_constants(
+                sess, sess.graph.as_graph_def(), [output_op])
+
+        with ops_lib.Graph().as_default() as graph:
+            importer.import_graph_def(frozen, name='')
+            # Grappler keeps the nodes needed for the 'train_op' collection.
+            graph.add_to_collection(
+                'train_op', graph.get_operation_by_name(output_op))
+            meta_graph_def = saver.export_meta_graph(graph_def=frozen,
+                                                     graph=graph)
+        config = config_pb2.ConfigProto()
+        rewrite_options = config.graph_options.rewrite_options
+        rewrite_options.optimizers.extend(GRAPH_OPTIMIZERS)
+        rewrite_options.meta_optimizer_iterations = (
+            rewriter_config_pb2.RewriterConfig.ONE)
+        optimized = tf_optimizer.OptimizeGraph(config, meta_graph_def)
+        LOG.info(f'Optimized {self.model_dir}: {len(frozen.node)} nodes '
+                 f'after freezing, {len(optimized.node)} after grappler')
+        return optimized
 
     def predict(self, input_df):
-        # Fix column names: replace white space with '_'.
-        # We could also check if the names match input_tensors here.
-        # These will be checked during inference anyway.
-        input_df = input_df.rename(
-            mapper=lambda col: re.sub('\\s', '_', col),
-            axis='columns',
-            copy=False)
-        input_feed_dict = {   # column tensor name => column values in input
-            self.input_tensors[col].name: input_df[col]
-            for col in input_df.columns
-        }
-        results = self.sess.run(self.output_tensor.name, feed_dict=input_feed_dict)
+        feeds = self._get_feeds(input_df.columns)
+        columns = [  # Contiguous arrays, in the dtype of their tensor.
+            np.ascontiguousarray(input_df[col].to_numpy(dtype=dtype))
+            for col, _, dtype in feeds
+        ]
+        num_rows = len(input_df)
+        batch_size = self.batch_size or max(num_rows, 1)
+        results = []
+        for start in range(0, max(num_rows, 1), batch_size):
+            input_feed_dict = {  # column tensor name => column values in input
+                tensor_name: values[start:start + batch_size]
+                for (_, tensor_name, _), values in zip(feeds, columns)
+            }
+            results.append(self.sess.run(self.output_tensor.name,
+                                         feed_dict=input_feed_dict))
+        results = results[0] if len(results) == 1 else np.concatenate(results)
         return pd.DataFrame(results, columns=self.output_columns)
 
+    def _get_feeds(self, columns):
+        """Returns the tensor each column is fed to, computed once per
+        distinct set of input columns, of which the MAX_FEED_LAYOUTS most
+        recently used are kept."""
+        key = tuple(columns)
+        feeds = self._feeds.get(key)
+        if feeds is not None:
+            self._feeds.move_to_end(key)
+        else:
+            feeds = []
+            for col in key:
+                # Fix column names: replace white space with '_'.
+                # Columns without a matching input tensor raise KeyError.
+                tensor = self.input_tensors[re.sub('\\s', '_', col)]
+                feeds.append((col, tensor.name,
+                              dtypes.as_dtype(tensor.dtype).as_numpy_dtype))
+            self._feeds[key] = feeds
+            while len(self._feeds) > MAX_FEED_LAYOUTS:
+                self._feeds.popitem(last=False)
+        return feeds
+
     def unload_model(self):
-        # TODO: This is currently not called by the executor. It should.
         if self.sess:
             sess = self.sess
             self.sess = None
+            self.resident_bytes = 0
             sess.close()
 
+    def memory_footprint(self):
+        """Returns the approximate resident bytes of the loaded model,
+        measured as the growth of the process while it loaded."""
+        return self.resident_bytes
+
 
 # Manual testing.
 def main():